@@ -3,343 +3,1188 @@ Flask Backend API for Automation Tool
 Connects the web dashboard to Python automation scripts
 """
 
-from flask import Flask, jsonify, request, send_file
+from flask import Blueprint, Flask, Response, g, jsonify, request, send_file
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from datetime import datetime
 import json
 import os
 import sys
+import time
 from pathlib import Path
 
 # Add scripts directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
 
-from system_monitor import SystemMonitor
-from data_processor import DataProcessor
+from metrics_sampler import MetricsSampler
+from metrics_store import MetricsStore
+from metrics_stream import MetricsBroadcaster
+from data_processor import (DataProcessor, OUTPUT_SUFFIXES, dedupe_files, is_supported_format, process_files_in_directory,
+                            validate_dedupe_subset, validate_filters)
+from pipeline import Pipeline, read_schema
+from result_cache import ResultCache, SharedResultCache
 from file_manager import FileManager
-
-app = Flask(__name__)
-CORS(app)
+from file_index import FileIndex
+from config import get_config
+from coordination import LeaderElection, SharedSnapshot
+from jobs import JobManager, JobRegistry, SUCCEEDED
+from history import create_history_store, parse_time
+from uploads import UploadConflict, UploadError, UploadSessions, parse_content_range, receive_upload
+from log import configure as configure_logging, get_logger
+from profiling import TOKEN_HEADER, ProfileStore, RateLimiter, RequestProfiler
+from telemetry import (WorkerExporter, registry as telemetry_registry, render as render_metrics, request_finished,
+                       request_started)
+
+# Service settings for this process (APP_ENV / FLASK_ENV picks the config class)
+settings = get_config()
+
+configure_logging(settings.LOG_LEVEL, settings.LOG_BUFFERED)
+log = get_logger('api')
+
+api = Blueprint('api', __name__)
+
+# Multi-worker deployments elect one worker per host to sample metrics and
+# maintain the file index; the others mirror its snapshot from STATE_DIR
+election = None
+shared_snapshot = None
+if settings.SHARED_STATE:
+    election = LeaderElection(os.path.join(settings.STATE_DIR, 'leader.lock'),
+                              retry_interval=settings.METRICS_SAMPLE_INTERVAL)
+    shared_snapshot = SharedSnapshot(os.path.join(settings.STATE_DIR, 'metrics-snapshot.json'))
+
+# Shared background sampler; system endpoints read its snapshot
+sampler = MetricsSampler(
+    interval=settings.METRICS_SAMPLE_INTERVAL,
+    alert_threshold=settings.ALERT_THRESHOLD
+)
+
+# Metric history, fed by every sampler snapshot (memory-mapped and shared between workers)
+metrics_store = MetricsStore(path=os.path.join(settings.STATE_DIR, 'metrics') if settings.SHARED_STATE else None)
+
+
+def _record_metrics(report: dict):
+    """Append a snapshot to the metric history (only the leader writes shared history)"""
+    if election is None or election.is_leader:
+        metrics_store.record_report(report)
+
+
+def _publish_snapshot(report: dict):
+    """Leader: hand the snapshot, with its process table, to the other workers"""
+    if election is not None and election.is_leader:
+        shared_snapshot.write(report, {'process_records': sampler.monitor.process_sampler.records()})
+
+
+def _read_snapshot():
+    """Follower: the leader's latest snapshot, if it changed since the last read"""
+    payload = shared_snapshot.read_new()
+    if payload is None:
+        return None
+    report = payload['report']
+    sampler.monitor.process_sampler.load(payload['extra'].get('process_records', []), report.get('sampled_at'))
+    return report
+
+
+sampler.add_listener(_record_metrics)
+sampler.add_listener(_publish_snapshot)
+
+# Live snapshot fan-out for /api/stream/metrics subscribers
+broadcaster = MetricsBroadcaster(max_queue=settings.STREAM_MAX_QUEUE)
+sampler.add_listener(broadcaster.publish)
+
+# Content-addressed cache of analysis results
+if settings.SHARED_STATE:
+    result_cache = SharedResultCache(
+        settings.RESULT_CACHE_DIR,
+        os.path.join(settings.STATE_DIR, 'results.db'),
+        max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+        store_frames=settings.RESULT_CACHE_STORE_FRAMES
+    )
+else:
+    result_cache = ResultCache(
+        settings.RESULT_CACHE_DIR,
+        max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+        store_frames=settings.RESULT_CACHE_STORE_FRAMES
+    )
+
+# Opt-in metadata index; FileManager falls back to walking uncovered paths
+file_index = None
+if settings.FILE_INDEX_ENABLED:
+    file_index = FileIndex(settings.FILE_INDEX_PATH, reconcile_interval=settings.FILE_INDEX_RECONCILE_SECONDS)
+    for root in settings.FILE_INDEX_ROOTS:
+        try:
+            file_index.watch(root)
+        except ValueError as e:
+            log.warning("Not indexing %s: %s", root, e)
+    if election is None:
+        file_index.start()
+
+# Uploads land here; large files arrive through resumable sessions
+UPLOAD_DIR = Path('uploads')
+upload_sessions = UploadSessions(UPLOAD_DIR, settings.UPLOAD_SESSION_MAX_BYTES, settings.UPLOAD_SESSION_TTL_SECONDS)
 
 # Store task execution history
-execution_history = []
-MAX_HISTORY = 100
+history_store = create_history_store(
+    settings.HISTORY_BACKEND,
+    path=settings.HISTORY_PATH,
+    max_entries=settings.HISTORY_MAX_ENTRIES,
+    max_age_seconds=settings.HISTORY_MAX_AGE_DAYS * 24 * 3600
+)
 
 def add_to_history(task_name: str, status: str, details: dict = None):
     """Add task execution to history"""
-    entry = {
-        'timestamp': datetime.now().isoformat(),
-        'task': task_name,
-        'status': status,
-        'details': details or {}
-    }
-    execution_history.append(entry)
-    if len(execution_history) > MAX_HISTORY:
-        execution_history.pop(0)
+    try:
+        history_store.add(task_name, status, details)
+    except Exception as e:
+        # History is best-effort; never fail the task that is being recorded
+        log.warning("Could not record history: %s", e)
+
+
+def _record_job(job):
+    """Mirror finished background jobs into the execution history"""
+    details = dict(job.result) if isinstance(job.result, dict) else {}
+    details['job_id'] = job.id
+    if job.error:
+        details['error'] = job.error
+    add_to_history(job.type, 'success' if job.status == SUCCEEDED else job.status, details)
+
+
+# Background jobs for long-running data and file tasks
+job_manager = JobManager(
+    max_workers=settings.JOB_WORKERS,
+    type_limits=settings.JOB_TYPE_LIMITS,
+    registry=JobRegistry(os.path.join(settings.STATE_DIR, 'jobs.db')) if settings.SHARED_STATE else None
+)
+job_manager.add_listener(_record_job)
+
+
+def _on_elected():
+    """This worker became leader: sample locally and take over the file index"""
+    sampler.set_source(None)
+    sampler.start()
+    if file_index is not None:
+        file_index.start()
+
+
+if election is not None:
+    election.on_elected(_on_elected)
+
+# Request and stage metrics; with shared state every worker publishes its
+# registry to STATE_DIR so /metrics reports totals whichever worker is scraped
+telemetry_exporter = None
+if settings.SHARED_STATE:
+    telemetry_exporter = WorkerExporter(os.path.join(settings.STATE_DIR, 'telemetry'),
+                                        interval=settings.TELEMETRY_FLUSH_SECONDS)
+
+# Stored request profiles (see RequestProfiler); listed and downloaded through /api/admin/profiles
+profile_store = ProfileStore(settings.PROFILE_DIR, max_files=settings.PROFILE_MAX_FILES)
+profile_limiter = RateLimiter(settings.PROFILE_RATE_PER_MINUTE, settings.PROFILE_MAX_CONCURRENT)
+
+_worker_pid = None
+
+
+def start_worker():
+    """Per-process startup for multi-worker servers; safe to call repeatedly
+
+    Runs in each worker after it forks (threads and locks from a preloading
+    parent don't survive the fork): followers mirror the shared snapshot and
+    every worker joins the leader election.
+    """
+    global _worker_pid
+    if election is None or _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    sampler.set_source(_read_snapshot)
+    election.start()
+    telemetry_exporter.start()
+
+
+@api.before_app_request
+def _ensure_worker_started():
+    # Servers that don't call start_worker from a post-fork hook start on first request
+    if election is not None and _worker_pid != os.getpid():
+        start_worker()
+
+
+@api.before_app_request
+def _start_request_timer():
+    # URL rules, not paths, label the metrics; unmatched paths share one label
+    g.request_route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.request_started = time.perf_counter()
+    request_started(g.request_route)
+
+
+@api.after_app_request
+def _note_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@api.teardown_app_request
+def _finish_request_timer(error):
+    started = g.pop('request_started', None)
+    if started is not None:
+        request_finished(request.method, g.request_route, g.pop('response_status', 500),
+                         time.perf_counter() - started)
 
 
 # ============== HEALTH & STATUS ENDPOINTS ==============
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
+def health_payload() -> dict:
+    """Body of /api/health (shared with the ASGI entry point)"""
+    return {
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
-    }), 200
+        'version': '1.0.0',
+        'worker': election.stats() if election is not None else {'pid': os.getpid()}
+    }
 
 
-@app.route('/api/status', methods=['GET'])
-def get_status():
-    """Get API status and uptime"""
-    return jsonify({
+def status_payload() -> dict:
+    """Body of /api/status (shared with the ASGI entry point)"""
+    return {
         'api_status': 'running',
         'dashboard_connected': True,
         'scripts_available': ['system_monitor', 'data_processor', 'file_manager'],
         'timestamp': datetime.now().isoformat()
-    }), 200
+    }
+
+
+@api.route('/api/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify(health_payload()), 200
+
+
+@api.route('/api/status', methods=['GET'])
+def get_status():
+    """Get API status and uptime"""
+    return jsonify(status_payload()), 200
 
 
 # ============== SYSTEM MONITORING ENDPOINTS ==============
 
-@app.route('/api/system/health', methods=['GET'])
+@api.route('/api/system/health', methods=['GET'])
 def get_system_health():
     """Get comprehensive system health report"""
-    print("[v0] API: Fetching system health report")
+    log.debug("API: Fetching system health report")
     try:
-        monitor = SystemMonitor()
-        report = monitor.generate_health_report()
+        report = sampler.snapshot()
         add_to_history('system_health', 'success', {'health': report['overall_health']})
         return jsonify(report), 200
     except Exception as e:
-        print(f"[v0] Error in health endpoint: {str(e)}")
+        log.error("Error in health endpoint: %s", e)
         add_to_history('system_health', 'failed', {'error': str(e)})
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/system/cpu', methods=['GET'])
+def _snapshot_section(section: str) -> dict:
+    """Return one section of the sampler snapshot annotated with its age"""
+    report = sampler.snapshot()
+    stats = dict(report[section])
+    stats['age_seconds'] = report['age_seconds']
+    return stats
+
+
+@api.route('/api/system/cpu', methods=['GET'])
 def get_cpu_stats():
     """Get CPU statistics"""
-    print("[v0] API: Fetching CPU stats")
+    log.debug("API: Fetching CPU stats")
     try:
-        monitor = SystemMonitor()
-        stats = monitor.get_cpu_stats()
+        stats = _snapshot_section('cpu')
         add_to_history('cpu_stats', 'success')
         return jsonify(stats), 200
     except Exception as e:
-        print(f"[v0] Error in CPU endpoint: {str(e)}")
+        log.error("Error in CPU endpoint: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/system/memory', methods=['GET'])
+@api.route('/api/system/memory', methods=['GET'])
 def get_memory_stats():
     """Get memory statistics"""
-    print("[v0] API: Fetching memory stats")
+    log.debug("API: Fetching memory stats")
     try:
-        monitor = SystemMonitor()
-        stats = monitor.get_memory_stats()
+        stats = _snapshot_section('memory')
         add_to_history('memory_stats', 'success')
         return jsonify(stats), 200
     except Exception as e:
-        print(f"[v0] Error in memory endpoint: {str(e)}")
+        log.error("Error in memory endpoint: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/system/disk', methods=['GET'])
+@api.route('/api/system/disk', methods=['GET'])
 def get_disk_stats():
     """Get disk statistics"""
-    print("[v0] API: Fetching disk stats")
+    log.debug("API: Fetching disk stats")
     try:
-        monitor = SystemMonitor()
         path = request.args.get('path', '/')
-        stats = monitor.get_disk_stats(path)
+        if path == '/':
+            stats = _snapshot_section('disk')
+        else:
+            # Only the root filesystem is sampled; other paths are a cheap statvfs
+            stats = sampler.monitor.get_disk_stats(path)
         add_to_history('disk_stats', 'success')
         return jsonify(stats), 200
     except Exception as e:
-        print(f"[v0] Error in disk endpoint: {str(e)}")
+        log.error("Error in disk endpoint: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/system/network', methods=['GET'])
+@api.route('/api/system/network', methods=['GET'])
 def get_network_stats():
     """Get network statistics"""
-    print("[v0] API: Fetching network stats")
+    log.debug("API: Fetching network stats")
     try:
-        monitor = SystemMonitor()
-        stats = monitor.get_network_stats()
+        stats = _snapshot_section('network')
         add_to_history('network_stats', 'success')
         return jsonify(stats), 200
     except Exception as e:
-        print(f"[v0] Error in network endpoint: {str(e)}")
+        log.error("Error in network endpoint: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/system/processes', methods=['GET'])
+@api.route('/api/system/processes', methods=['GET'])
 def get_processes():
-    """Get top processes by memory usage"""
-    print("[v0] API: Fetching top processes")
+    """Get top processes by memory or CPU usage"""
+    log.debug("API: Fetching top processes")
     try:
-        monitor = SystemMonitor()
         top_n = request.args.get('top_n', 5, type=int)
-        processes = monitor.get_process_info(top_n)
+        sort_by = request.args.get('sort', 'memory')
+        stats = _snapshot_section('processes')
+        # Rank the sampler's last process table; no extra walk for other sizes or orders
+        process_sampler = sampler.monitor.process_sampler
+        stats['top_processes'] = process_sampler.top(top_n, sort_by)
+        stats['top_cpu'] = process_sampler.top(top_n, 'cpu')
+        stats['sort_by'] = sort_by
         add_to_history('processes_info', 'success')
-        return jsonify(processes), 200
+        return jsonify(stats), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"[v0] Error in processes endpoint: {str(e)}")
+        log.error("Error in processes endpoint: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-# ============== DATA PROCESSING ENDPOINTS ==============
+def _parse_time_arg(value: str, default: float) -> float:
+    """Parse an epoch-seconds or ISO-8601 query argument"""
+    if value is None or value == '':
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
 
-@app.route('/api/data/upload', methods=['POST'])
-def upload_data():
-    """Upload and process data file"""
-    print("[v0] API: Processing uploaded file")
+
+@api.route('/api/system/history', methods=['GET'])
+def get_system_history():
+    """Get downsampled min/avg/max history for one metric"""
+    log.debug("API: Fetching metric history")
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
+        if not sampler.running:
+            sampler.start()
+        now = datetime.now().timestamp()
+        metric = request.args.get('metric', 'cpu_percent')
+        end = _parse_time_arg(request.args.get('to'), now)
+        start = _parse_time_arg(request.args.get('from'), end - 3600)
+        step = request.args.get('step', type=int)
+
+        series = metrics_store.query(metric, start, end, step)
+        return jsonify(series), 200
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': str(e).strip("'\"")}), 400
+    except Exception as e:
+        log.error("Error in history endpoint: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/stream/metrics', methods=['GET'])
+def stream_metrics():
+    """Stream live system metrics as Server-Sent Events"""
+    log.debug("API: Opening metrics stream")
+    if not sampler.running:
+        sampler.start()
+    subscription = broadcaster.subscribe()
 
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                message = subscription.get(timeout=settings.STREAM_KEEPALIVE_SECONDS)
+                # Comment lines keep proxies from closing idle connections
+                yield message if message is not None else ': keepalive\n\n'
+        finally:
+            broadcaster.unsubscribe(subscription)
+            log.debug("API: Metrics stream closed")
 
-        # Save file
-        upload_dir = Path('uploads')
-        upload_dir.mkdir(exist_ok=True)
-        filepath = upload_dir / file.filename
-        file.save(str(filepath))
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
-        # Process file
-        processor = DataProcessor(str(filepath))
+
+# ============== DATA PROCESSING ENDPOINTS ==============
+
+def _optimize_arg(value) -> bool:
+    """Request flag for the dtype optimizer, falling back to ``OPTIMIZE_DTYPES``"""
+    if value is None:
+        return settings.OPTIMIZE_DTYPES
+    if isinstance(value, str):
+        return value.lower() == 'true'
+    return bool(value)
+
+
+def _analyze_cached(filepath: str, chunksize: int = None, optimize: bool = False):
+    """Run load/clean/analyze on ``filepath``, reusing a cached result when possible"""
+    # Streaming never optimizes (categories would differ chunk to chunk), so it shares one key
+    optimize = optimize and not chunksize
+    key = result_cache.key_for(filepath, {'pipeline': 'analyze', 'chunksize': chunksize, 'optimize': optimize})
+    stats = result_cache.get(key)
+    if stats is not None:
+        return stats, True
+
+    processor = DataProcessor(filepath, chunksize=chunksize)
+    if chunksize:
+        stats = processor.process_stream()
+    else:
         processor.load_data()
-        processor.clean_data()
+        processor.clean_data(optimize=optimize)
         stats = processor.analyze_statistics()
+        if processor.memory_report:
+            stats['memory_optimization'] = processor.memory_report
+    result_cache.put(key, stats, processor.processed_data)
+    return stats, False
+
+
+def _cached_clean_frame(filepath: str, optimize: bool = False):
+    """Cleaned frame (and memory report) stored by an earlier full analyze of the same content"""
+    if not result_cache.store_frames:
+        return None
+    key = result_cache.key_for(filepath, {'pipeline': 'analyze', 'chunksize': None, 'optimize': optimize})
+    frame = result_cache.get_frame(key)
+    if frame is None:
+        return None
+    stats = result_cache.get(key) or {}
+    return frame, stats.get('memory_optimization')
+
+
+def _file_written(path: str, digest: str = None) -> None:
+    """Drop the cached digest of a (re)written file, recording its new one when known"""
+    result_cache.invalidate(path)
+    if digest:
+        result_cache.remember(path, digest)
+
+
+def _register_upload(info: dict, optimize: bool = False, chunksize: int = None):
+    """Record an upload's content hash and analyze it
+
+    Statistics computed while the file streamed in are cached as the
+    chunked analysis of its content; otherwise the file is analyzed now.
+    """
+    path = info['path']
+    _file_written(path, info['content_hash'])
+    duplicate_of = result_cache.find_by_digest(info['content_hash'], exclude=path)
+    stats = info.get('statistics')
+    if stats is not None and not optimize:
+        key = result_cache.key_for(path, {'pipeline': 'analyze', 'chunksize': settings.UPLOAD_PARSE_CHUNKSIZE,
+                                          'optimize': False})
+        result_cache.put(key, stats)
+    else:
+        stats, _ = _analyze_cached(path, chunksize, optimize)
+    return stats, duplicate_of
+
+
+@api.route('/api/data/upload', methods=['POST'])
+def upload_data():
+    """Upload and process data file"""
+    log.debug("API: Processing uploaded file")
+    try:
+        if request.content_length is not None and request.content_length > settings.MAX_CONTENT_LENGTH:
+            return jsonify({'error': 'File too large; use /api/data/uploads for resumable uploads'}), 413
+
+        # optimize needs the whole frame, so the streaming parse would be wasted
+        optimize_arg = request.args.get('optimize')
+        info = receive_upload(
+            request.stream, request.content_type, UPLOAD_DIR, settings.MAX_CONTENT_LENGTH,
+            filename=request.args.get('filename'),
+            parse_chunksize=None if _optimize_arg(optimize_arg) else settings.UPLOAD_PARSE_CHUNKSIZE or None
+        )
+        optimize = _optimize_arg(info['fields'].get('optimize', optimize_arg))
+        stats, duplicate_of = _register_upload(info, optimize)
 
         add_to_history('data_processing', 'success', stats)
 
         return jsonify({
             'status': 'success',
-            'filename': file.filename,
+            'filename': info['filename'],
+            'size_bytes': info['size_bytes'],
+            'content_hash': info['content_hash'],
+            'duplicate_of': duplicate_of,
             'statistics': stats
         }), 200
 
+    except UploadError as e:
+        return _upload_error(e)
+    except Exception as e:
+        log.error("Error in data upload: %s", e)
+        add_to_history('data_processing', 'failed', {'error': str(e)})
+        return jsonify({'error': str(e)}), 500
+
+
+def _upload_error(e: UploadError):
+    body = {'error': str(e)}
+    if isinstance(e, UploadConflict):
+        body['offset'] = e.offset
+    return jsonify(body), e.status
+
+
+@api.route('/api/data/uploads', methods=['POST'])
+def create_upload_session():
+    """Start a resumable upload"""
+    try:
+        data = request.get_json() or {}
+        session = upload_sessions.create(data.get('filename'), data.get('size'))
+        log.debug("API: Upload session %s for %s", session['upload_id'], session['filename'])
+        return jsonify(session), 201
+    except UploadError as e:
+        return _upload_error(e)
+    except Exception as e:
+        log.error("Error creating upload session: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/data/uploads/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    """Current offset of a resumable upload"""
+    try:
+        return jsonify(upload_sessions.status(upload_id)), 200
+    except UploadError as e:
+        return _upload_error(e)
+
+
+@api.route('/api/data/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+def append_upload_chunk(upload_id):
+    """Append the request body to a resumable upload"""
+    try:
+        offset = parse_content_range(request.headers.get('Content-Range'))
+        if offset is None and request.args.get('offset') is not None:
+            offset = request.args.get('offset', type=int)
+        session = upload_sessions.append(upload_id, request.stream, offset, request.content_length)
+        return jsonify(session), 200
+    except UploadError as e:
+        return _upload_error(e)
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'Chunks are limited to {settings.MAX_CONTENT_LENGTH} bytes'}), 413
+    except Exception as e:
+        log.error("Error appending upload chunk: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+def _complete_upload_task(info: dict, optimize: bool = False, job=None) -> dict:
+    """Analyze a finished resumable upload with bounded memory"""
+    if job:
+        job.set_progress(0.1, 'Analyzing upload')
+    stats, duplicate_of = _register_upload(info, optimize, settings.UPLOAD_PARSE_CHUNKSIZE or None)
+    return dict(info, duplicate_of=duplicate_of, statistics=stats)
+
+
+@api.route('/api/data/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """Verify a resumable upload, move it into place and analyze it"""
+    try:
+        data = request.get_json(silent=True) or {}
+        info = upload_sessions.complete(upload_id, data.get('checksum'))
+        log.debug("API: Upload %s complete (%s bytes)", upload_id, info['size_bytes'])
+        if not data.get('analyze', True):
+            _file_written(info['path'], info['content_hash'])
+            add_to_history('data_upload', 'success', info)
+            return jsonify(dict(info, status='success')), 200
+
+        optimize = _optimize_arg(data.get('optimize'))
+        if data.get('async'):
+            job = job_manager.submit('data_process', _complete_upload_task, info, optimize)
+            return _job_accepted(job)
+
+        result = _complete_upload_task(info, optimize)
+        add_to_history('data_processing', 'success', result['statistics'])
+        return jsonify(dict(result, status='success')), 200
+
+    except UploadError as e:
+        return _upload_error(e)
     except Exception as e:
-        print(f"[v0] Error in data upload: {str(e)}")
+        log.error("Error completing upload: %s", e)
         add_to_history('data_processing', 'failed', {'error': str(e)})
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/data/analyze/<filename>', methods=['GET'])
+@api.route('/api/data/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload_session(upload_id):
+    """Discard a resumable upload"""
+    try:
+        upload_sessions.abort(upload_id)
+        return jsonify({'status': 'success', 'message': 'Upload discarded'}), 200
+    except UploadError as e:
+        return _upload_error(e)
+
+
+@api.route('/api/data/analyze/<filename>', methods=['GET'])
 def analyze_file(filename):
     """Analyze existing data file"""
-    print(f"[v0] API: Analyzing file {filename}")
+    log.debug("API: Analyzing file %s", filename)
     try:
-        filepath = Path('uploads') / filename
+        filepath = UPLOAD_DIR / filename
         if not filepath.exists():
             return jsonify({'error': 'File not found'}), 404
 
-        processor = DataProcessor(str(filepath))
-        processor.load_data()
-        processor.clean_data()
-        stats = processor.analyze_statistics()
+        chunksize = request.args.get('chunksize', type=int)
+        optimize = _optimize_arg(request.args.get('optimize'))
+        stats, cache_hit = _analyze_cached(str(filepath), chunksize, optimize)
 
-        add_to_history('data_analysis', 'success')
+        add_to_history('data_analysis', 'success', {'cache_hit': cache_hit})
 
-        return jsonify(stats), 200
+        return jsonify(stats), 200, {'X-Cache': 'HIT' if cache_hit else 'MISS'}
 
     except Exception as e:
-        print(f"[v0] Error analyzing file: {str(e)}")
+        log.error("Error analyzing file: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/data/process', methods=['POST'])
+def _process_data_task(filepath: str, output_path: str, chunksize: int = None, columns: list = None,
+                       filters: list = None, optimize: bool = False, pipeline: Pipeline = None,
+                       dedupe_subset: list = None, job=None) -> dict:
+    """Load, clean and save ``filepath``; shared by the sync and job paths
+
+    With ``pipeline`` its steps replace the built-in cleaning pass. A plain
+    full-file run reuses the cleaned frame cached by an earlier analyze of
+    the same content (``RESULT_CACHE_STORE_FRAMES``) instead of loading and
+    cleaning again.
+    """
+    processor = DataProcessor(filepath, chunksize=chunksize, columns=columns, filters=filters,
+                              dedupe_subset=dedupe_subset)
+    step_progress = (lambda done, total: job.set_progress(0.7 * done / total, f'{done}/{total} pipeline stages')) \
+        if job else None
+    row_progress = (lambda done, total: job.set_progress(done / total if total else job.progress,
+                                                         f'{done}/{total} rows' if total else f'{done} rows')) \
+        if job else None
+    if pipeline is not None:
+        processor.processed_data = pipeline.run(progress=step_progress)
+        if job:
+            job.set_progress(0.7, 'Pipeline finished')
+        if optimize:
+            processor.optimize_memory()
+        if not processor.save_processed_data(output_path):
+            raise IOError(f"Could not write {output_path}")
+    elif chunksize:
+        # Bounded-memory path: load, clean and save chunk by chunk
+        processor.process_stream(output_path, progress=row_progress)
+    else:
+        cached = _cached_clean_frame(filepath, optimize) if not (columns or filters or dedupe_subset) else None
+        if cached is not None:
+            processor.processed_data, processor.memory_report = cached
+        else:
+            if processor.load_data() is None:
+                raise ValueError(f"Could not load {filepath}")
+            if job:
+                job.set_progress(0.4, 'Data loaded')
+            processor.clean_data(optimize=optimize)
+        if job:
+            job.set_progress(0.7, 'Data cleaned')
+        if not processor.save_processed_data(output_path):
+            raise IOError(f"Could not write {output_path}")
+    _file_written(output_path)
+    result = {'output': output_path}
+    if pipeline is not None:
+        result['rows'] = len(processor.processed_data)
+        result['pipeline'] = dict(pipeline.explain(), trace=pipeline.trace)
+    if processor.memory_report:
+        result['memory_optimization'] = processor.memory_report
+    return result
+
+
+@api.route('/api/data/process', methods=['POST'])
 def process_data():
     """Process data with custom parameters"""
-    print("[v0] API: Processing data with custom parameters")
+    log.debug("API: Processing data with custom parameters")
     try:
         data = request.get_json()
         filepath = data.get('filepath')
         output_path = data.get('output_path', 'processed_output.csv')
+        chunksize = data.get('chunksize')
+        columns = data.get('columns')
+        optimize = _optimize_arg(data.get('optimize'))
 
         if not filepath or not Path(filepath).exists():
             return jsonify({'error': 'File not found'}), 404
-
-        processor = DataProcessor(filepath)
-        processor.load_data()
-        processor.clean_data()
-        processor.save_processed_data(output_path)
-
-        add_to_history('data_process', 'success', {'output': output_path})
-
-        return jsonify({
+        if not is_supported_format(filepath) or not is_supported_format(output_path):
+            return jsonify({'error': 'Unsupported file format'}), 400
+        try:
+            filters = validate_filters(data.get('filters'))
+            dedupe_subset = validate_dedupe_subset(data.get('dedupe_subset'), columns)
+            if dedupe_subset:
+                validate_dedupe_subset(dedupe_subset, read_schema(filepath))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        pipeline = None
+        if data.get('pipeline') is not None:
+            if chunksize:
+                return jsonify({'error': "'chunksize' can't be combined with 'pipeline'"}), 400
+            if not isinstance(data['pipeline'], list):
+                return jsonify({'error': "'pipeline' must be a list of steps"}), 400
+            # Top-level filters/columns become the first steps so the optimizer sees them too
+            steps = [{'op': 'filter', 'conditions': filters}] if filters else []
+            steps += [{'op': 'select', 'columns': columns}] if columns else []
+            try:
+                pipeline = Pipeline(filepath, steps + data['pipeline'])
+                if data.get('explain'):
+                    return jsonify(pipeline.explain()), 200
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+        if data.get('async'):
+            job = job_manager.submit('data_process', _process_data_task, filepath, output_path, chunksize,
+                                     columns, filters, optimize, pipeline, dedupe_subset)
+            return _job_accepted(job)
+
+        result = _process_data_task(filepath, output_path, chunksize, columns, filters, optimize, pipeline,
+                                    dedupe_subset)
+
+        add_to_history('data_process', 'success', result)
+
+        response = {
             'status': 'success',
             'output_file': output_path,
             'message': 'Data processed and saved'
-        }), 200
+        }
+        for key in ('rows', 'pipeline', 'memory_optimization'):
+            if key in result:
+                response[key] = result[key]
+        return jsonify(response), 200
 
     except Exception as e:
-        print(f"[v0] Error processing data: {str(e)}")
+        log.error("Error processing data: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-# ============== FILE MANAGEMENT ENDPOINTS ==============
+def _batch_task(directory: str, pattern: str, workers: int = None, manifest_path: str = None,
+                chunksize: int = None, output_format: str = 'csv', job=None) -> dict:
+    """Process every matching file in ``directory`` on a process pool"""
+    def report(done, total):
+        if job:
+            job.set_progress(done / total if total else 1.0, f'{done}/{total} files')
 
-@app.route('/api/files/list', methods=['GET'])
-def list_files():
-    """List files in directory"""
-    print("[v0] API: Listing files")
+    manifest = process_files_in_directory(directory, pattern, workers, manifest_path, chunksize, report,
+                                          output_format=output_format)
+    if job is None:
+        return manifest
+    # Keep the job record small; the full manifest goes to manifest_path
+    return {key: value for key, value in manifest.items() if key not in ('files', 'combined_statistics')}
+
+
+@api.route('/api/data/batch', methods=['POST'])
+def process_batch():
+    """Process all matching files in a directory in parallel"""
+    log.debug("API: Processing batch")
     try:
-        directory = request.args.get('directory', '.')
-        recursive = request.args.get('recursive', 'false').lower() == 'true'
+        data = request.get_json()
+        directory = data.get('directory')
+        pattern = data.get('pattern', '*.csv')
+        workers = data.get('workers')
+        manifest_path = data.get('manifest_path')
+        chunksize = data.get('chunksize')
+        output_format = data.get('output_format', 'csv')
+
+        if not directory or not Path(directory).is_dir():
+            return jsonify({'error': 'Directory not found'}), 404
+        if output_format not in OUTPUT_SUFFIXES:
+            return jsonify({'error': f"Unknown output format '{output_format}'"}), 400
+
+        if data.get('async'):
+            job = job_manager.submit('data_batch', _batch_task, directory, pattern, workers,
+                                     manifest_path, chunksize, output_format)
+            return _job_accepted(job)
+
+        manifest = _batch_task(directory, pattern, workers, manifest_path, chunksize, output_format)
+        add_to_history('data_batch', 'success' if manifest['failed'] == 0 else 'failed', {
+            'total_files': manifest['total_files'],
+            'succeeded': manifest['succeeded'],
+            'failed': manifest['failed']
+        })
+        return jsonify(manifest), 200
+
+    except Exception as e:
+        log.error("Error processing batch: %s", e)
+        add_to_history('data_batch', 'failed', {'error': str(e)})
+        return jsonify({'error': str(e)}), 500
 
-        manager = FileManager(directory)
-        files = manager.list_files(recursive=recursive)
 
-        add_to_history('list_files', 'success', {'count': len(files)})
+def _dedupe_task(paths: list, subset: list = None, output_dir: str = None, chunksize: int = None,
+                 dry_run: bool = False, error_rate: float = None, job=None) -> dict:
+    """Deduplicate ``paths`` as one stream"""
+    def report(done, total):
+        if job:
+            job.set_progress(done / total if total else 1.0, f'{done}/{total} file passes')
 
-        return jsonify({
-            'status': 'success',
-            'count': len(files),
-            'files': files
-        }), 200
+    kwargs = {'error_rate': error_rate} if error_rate else {}
+    return dedupe_files(paths, subset, output_dir, chunksize, dry_run, progress=report, **kwargs)
+
+
+@api.route('/api/data/dedupe', methods=['POST'])
+def dedupe_data():
+    """Remove duplicate rows within and across a set of files"""
+    log.debug("API: Deduplicating files")
+    try:
+        data = request.get_json()
+        paths = data.get('files')
+        if paths is None and data.get('directory'):
+            if not Path(data['directory']).is_dir():
+                return jsonify({'error': 'Directory not found'}), 404
+            paths = sorted(str(f) for f in Path(data['directory']).glob(data.get('pattern', '*.csv'))
+                           if f.is_file() and not f.stem.endswith(('_processed', '_deduped')))
+        if not paths:
+            return jsonify({'error': "Provide 'files' or a 'directory' with matching files"}), 400
+        missing = [p for p in paths if not Path(p).is_file()]
+        if missing:
+            return jsonify({'error': f'File not found: {missing[0]}'}), 404
+        if not all(is_supported_format(p) for p in paths):
+            return jsonify({'error': 'Unsupported file format'}), 400
+        try:
+            subset = validate_dedupe_subset(data.get('subset'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        for path in paths if subset else []:
+            schema = read_schema(path)
+            unknown = [c for c in subset if schema is not None and c not in schema]
+            if unknown:
+                return jsonify({'error': f'Unknown column(s) {unknown} in {path}'}), 400
+        error_rate = data.get('error_rate')
+        if error_rate is not None and (isinstance(error_rate, bool) or not isinstance(error_rate, (int, float))
+                                       or not 0 < error_rate < 1):
+            return jsonify({'error': "'error_rate' must be a number between 0 and 1"}), 400
+        args = (paths, subset, data.get('output_dir'), data.get('chunksize'),
+                bool(data.get('dry_run', False)), error_rate)
+
+        if data.get('async'):
+            job = job_manager.submit('data_dedupe', _dedupe_task, *args)
+            return _job_accepted(job)
+
+        report = _dedupe_task(*args)
+        add_to_history('data_dedupe', 'success', {
+            'files': len(paths),
+            'rows': report['rows'],
+            'duplicates': report['duplicates']
+        })
+        return jsonify(report), 200
 
     except Exception as e:
-        print(f"[v0] Error listing files: {str(e)}")
+        log.error("Error deduplicating files: %s", e)
+        add_to_history('data_dedupe', 'failed', {'error': str(e)})
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/files/size', methods=['GET'])
+@api.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get analysis cache hit/miss counters"""
+    return jsonify(result_cache.stats()), 200
+
+
+@api.route('/api/cache/clear', methods=['POST'])
+def clear_cache():
+    """Drop all cached analysis results"""
+    log.debug("API: Clearing analysis cache")
+    result_cache.clear()
+    return jsonify({'status': 'success', 'message': 'Cache cleared'}), 200
+
+
+# ============== FILE MANAGEMENT ENDPOINTS ==============
+
+LIST_FLUSH_RECORDS = 500
+
+
+def _csv_arg(name: str) -> list:
+    return [value for value in request.args.get(name, '').split(',') if value]
+
+
+@api.route('/api/files/list', methods=['GET'])
+def list_files():
+    """List files in directory, streamed and optionally paginated"""
+    log.debug("API: Listing files")
+    try:
+        directory = request.args.get('directory', '.')
+        recursive = request.args.get('recursive', 'false').lower() == 'true'
+        output_format = request.args.get('format', 'json')
+
+        manager = FileManager(directory, index=file_index)
+        listing = manager.iter_files(
+            recursive=recursive,
+            sort=request.args.get('sort', 'path'),
+            descending=request.args.get('order', 'asc').lower() == 'desc',
+            limit=request.args.get('limit', type=int),
+            cursor=request.args.get('cursor'),
+            extensions=_csv_arg('ext'),
+            min_size=request.args.get('min_size', type=int),
+            max_size=request.args.get('max_size', type=int),
+            min_age_days=request.args.get('min_age_days', type=float),
+            max_age_days=request.args.get('max_age_days', type=float),
+            exclude=_csv_arg('exclude'),
+            max_depth=request.args.get('max_depth', type=int),
+            threads=request.args.get('threads', settings.FILE_WALK_THREADS, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.error("Error listing files: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+    def generate_json():
+        # Same shape as before ({status, count, files}), written incrementally
+        yield '{"status":"success","files":['
+        buffer, separator = [], ''
+        for record in listing:
+            buffer.append(json.dumps(record))
+            if len(buffer) >= LIST_FLUSH_RECORDS:
+                yield separator + ','.join(buffer)
+                buffer, separator = [], ','
+        if buffer:
+            yield separator + ','.join(buffer)
+        yield f'],"count":{listing.count},"next_cursor":{json.dumps(listing.next_cursor)}}}'
+        add_to_history('list_files', 'success', {'count': listing.count})
+
+    def generate_ndjson():
+        buffer = []
+        for record in listing:
+            buffer.append(json.dumps(record))
+            if len(buffer) >= LIST_FLUSH_RECORDS:
+                yield '\n'.join(buffer) + '\n'
+                buffer = []
+        if buffer:
+            yield '\n'.join(buffer) + '\n'
+        # Trailer line so clients know where to resume
+        yield json.dumps({'count': listing.count, 'next_cursor': listing.next_cursor}) + '\n'
+        add_to_history('list_files', 'success', {'count': listing.count})
+
+    if output_format == 'ndjson':
+        return Response(generate_ndjson(), mimetype='application/x-ndjson')
+    return Response(generate_json(), mimetype='application/json')
+
+
+@api.route('/api/files/size', methods=['GET'])
 def get_directory_size():
     """Get directory size"""
-    print("[v0] API: Calculating directory size")
+    log.debug("API: Calculating directory size")
     try:
         directory = request.args.get('directory', '.')
-        manager = FileManager()
-        size_info = manager.get_directory_size(directory)
+        threads = request.args.get('threads', settings.FILE_WALK_THREADS, type=int)
+        manager = FileManager(index=file_index)
+        size_info = manager.get_directory_size(directory, threads=threads)
 
         add_to_history('directory_size', 'success')
 
         return jsonify(size_info), 200
 
     except Exception as e:
-        print(f"[v0] Error calculating size: {str(e)}")
+        log.error("Error calculating size: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/files/index', methods=['GET'])
+def get_file_index():
+    """Get file index status per watched root"""
+    if file_index is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify({'enabled': True, **file_index.stats()}), 200
+
+
+@api.route('/api/files/index/watch', methods=['POST'])
+def watch_directory():
+    """Add a directory to the file index"""
+    log.debug("API: Adding directory to file index")
+    if file_index is None:
+        return jsonify({'error': 'File index is disabled (set FILE_INDEX_ENABLED=true)'}), 400
+    try:
+        data = request.get_json() or {}
+        root = file_index.watch(data.get('directory', '.'))
+        add_to_history('index_watch', 'success', {'directory': root})
+        return jsonify({'status': 'success', 'root': root}), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.error("Error adding index root: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/files/cleanup', methods=['POST'])
+@api.route('/api/files/index/reconcile', methods=['POST'])
+def reconcile_file_index():
+    """Queue a rescan of one indexed root, or all of them"""
+    if file_index is None:
+        return jsonify({'error': 'File index is disabled (set FILE_INDEX_ENABLED=true)'}), 400
+    data = request.get_json(silent=True) or {}
+    file_index.reconcile(data.get('directory'))
+    return jsonify({'status': 'success', 'message': 'Reconcile queued'}), 202
+
+
+def _plan_summary(plan: dict) -> dict:
+    """Plan without the full path list, plus a preview of the first few paths"""
+    summary = {key: value for key, value in plan.items() if key not in ('files', 'cutoff_timestamp')}
+    summary['preview'] = plan['files'][:settings.CLEANUP_PREVIEW_FILES]
+    summary['truncated'] = len(plan['files']) > settings.CLEANUP_PREVIEW_FILES
+    return summary
+
+
+def _cleanup_task(directory: str, days: int, extensions: list = None, dry_run: bool = False,
+                  workers: int = None, batch_size: int = None, max_files_per_second: float = None,
+                  job=None) -> dict:
+    """Plan and (unless ``dry_run``) delete old files; shared by the sync and job paths"""
+    manager = FileManager(index=file_index)
+    if job:
+        job.set_progress(0.0, 'Planning')
+    plan = manager.plan_cleanup(directory, days, extensions)
+    summary = _plan_summary(plan)
+    if dry_run:
+        return {'dry_run': True, 'plan': summary}
+
+    def progress(done, total):
+        if job:
+            job.set_progress(done / total if total else 1.0, f'{done}/{total} files')
+
+    report = manager.execute_cleanup(
+        plan,
+        workers=workers or settings.CLEANUP_WORKERS,
+        batch_size=batch_size or settings.CLEANUP_BATCH_SIZE,
+        max_files_per_second=max_files_per_second or settings.CLEANUP_MAX_FILES_PER_SECOND or None,
+        progress=progress
+    )
+    report['errors'] = report['errors'][:settings.CLEANUP_PREVIEW_FILES]
+    summary.pop('preview')
+    summary.pop('truncated')
+    return {'dry_run': False, 'plan': summary, **report}
+
+
+@api.route('/api/files/cleanup', methods=['POST'])
 def cleanup_files():
-    """Cleanup old files"""
-    print("[v0] API: Cleaning up old files")
+    """Cleanup old files, or preview the cleanup with dry_run"""
+    log.debug("API: Cleaning up old files")
     try:
         data = request.get_json()
         directory = data.get('directory', '.')
         days = data.get('days', 30)
         extensions = data.get('extensions')
+        options = {
+            'dry_run': bool(data.get('dry_run', False)),
+            'workers': data.get('workers'),
+            'batch_size': data.get('batch_size'),
+            'max_files_per_second': data.get('max_files_per_second')
+        }
+
+        if data.get('async'):
+            job = job_manager.submit('cleanup_files', _cleanup_task, directory, days, extensions, **options)
+            return _job_accepted(job)
 
-        manager = FileManager()
-        deleted_count = manager.cleanup_old_files(directory, days, extensions)
+        result = _cleanup_task(directory, days, extensions, **options)
 
-        add_to_history('cleanup_files', 'success', {'deleted': deleted_count})
+        if result['dry_run']:
+            add_to_history('cleanup_files', 'dry_run', {
+                'file_count': result['plan']['file_count'],
+                'total_bytes': result['plan']['total_bytes']
+            })
+            return jsonify({'status': 'success', **result}), 200
+
+        add_to_history('cleanup_files', 'success', {
+            'deleted': result['deleted'],
+            'bytes_freed': result['bytes_freed']
+        })
 
         return jsonify({
             'status': 'success',
-            'deleted_count': deleted_count
+            'deleted_count': result['deleted'],
+            **result
         }), 200
 
     except Exception as e:
-        print(f"[v0] Error cleaning up: {str(e)}")
+        log.error("Error cleaning up: %s", e)
         add_to_history('cleanup_files', 'failed', {'error': str(e)})
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/files/organize', methods=['POST'])
+def _organize_task(directory: str, collisions: str = 'rename', resume: bool = False, undo: bool = False,
+                   dry_run: bool = False, workers: int = 4, job=None) -> dict:
+    """Organize files by extension (or preview/undo it); raises so failed jobs are reported as such"""
+    manager = FileManager(index=file_index)
+    progress = (lambda done, total: job.set_progress(done / total if total else 1.0, f'{done}/{total} files')) \
+        if job else None
+    if dry_run:
+        plan = manager.plan_organize(directory, collisions)
+        moves = plan.pop('moves')
+        plan['move_count'] = len(moves)
+        plan['preview'] = moves[:settings.CLEANUP_PREVIEW_FILES]
+        return {'dry_run': True, 'plan': plan}
+    if undo:
+        report = manager.undo_organize(directory, progress=progress)
+    else:
+        report = manager.organize_files(directory, collisions=collisions, workers=workers,
+                                        resume=resume, progress=progress)
+    if not report['success']:
+        raise RuntimeError(f"{len(report['errors'])} errors, e.g. {report['errors'][0]}")
+    return report
+
+
+@api.route('/api/files/organize', methods=['POST'])
 def organize_files():
     """Organize files by extension"""
-    print("[v0] API: Organizing files")
+    log.debug("API: Organizing files")
     try:
         data = request.get_json()
         directory = data.get('directory', '.')
+        options = {
+            'collisions': data.get('collisions', 'rename'),
+            'resume': bool(data.get('resume', False)),
+            'undo': bool(data.get('undo', False)),
+            'dry_run': bool(data.get('dry_run', False)),
+            'workers': data.get('workers', 4)
+        }
 
-        manager = FileManager()
-        success = manager.organize_by_extension(directory)
-
-        if success:
-            add_to_history('organize_files', 'success')
-            return jsonify({'status': 'success', 'message': 'Files organized'}), 200
-        else:
-            add_to_history('organize_files', 'failed')
-            return jsonify({'error': 'Failed to organize files'}), 500
+        if data.get('async'):
+            job = job_manager.submit('organize_files', _organize_task, directory, **options)
+            return _job_accepted(job)
+
+        try:
+            result = _organize_task(directory, **options)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except RuntimeError as e:
+            add_to_history('organize_files', 'failed', {'error': str(e)})
+            return jsonify({'error': str(e)}), 500
+
+        if not result.get('dry_run'):
+            add_to_history('organize_files', 'success', {
+                key: result[key] for key in ('moved', 'restored') if key in result
+            })
+        message = 'Organize planned' if options['dry_run'] else 'Organize undone' if options['undo'] else 'Files organized'
+        return jsonify({'status': 'success', 'message': message, **result}), 200
 
     except Exception as e:
-        print(f"[v0] Error organizing: {str(e)}")
+        log.error("Error organizing: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/files/backup', methods=['POST'])
+def _backup_task(source: str, destination: str, incremental: bool = False, verify_hash: bool = False,
+                 workers: int = 4, job=None) -> dict:
+    """Back up ``source`` to ``destination``; raises so failed jobs are reported as such"""
+    manager = FileManager(index=file_index)
+    progress = (lambda done, total: job.set_progress(done / total if total else 1.0, f'{done}/{total} files')) \
+        if job else None
+    if incremental:
+        report = manager.incremental_backup(source, destination, verify_hash, workers, progress=progress)
+        if not report['success']:
+            raise RuntimeError(f"Backup failed: {'; '.join(report['errors'][:5])}")
+        return report
+    if not manager.backup_directory(source, destination, progress=progress):
+        raise RuntimeError('Backup failed')
+    return {}
+
+
+@api.route('/api/files/backup', methods=['POST'])
 def backup_files():
     """Backup directory"""
-    print("[v0] API: Creating backup")
+    log.debug("API: Creating backup")
     try:
         data = request.get_json()
         source = data.get('source')
@@ -348,88 +1193,311 @@ def backup_files():
         if not source or not destination:
             return jsonify({'error': 'Source and destination required'}), 400
 
-        manager = FileManager()
-        success = manager.backup_directory(source, destination)
+        options = {
+            'incremental': bool(data.get('incremental', False)),
+            'verify_hash': bool(data.get('verify_hash', False)),
+            'workers': int(data.get('workers', 4))
+        }
 
-        if success:
-            add_to_history('backup_files', 'success')
-            return jsonify({'status': 'success', 'message': 'Backup completed'}), 200
-        else:
+        if data.get('async'):
+            job = job_manager.submit('backup_files', _backup_task, source, destination, **options)
+            return _job_accepted(job)
+
+        try:
+            report = _backup_task(source, destination, **options)
+        except RuntimeError as e:
             add_to_history('backup_files', 'failed')
-            return jsonify({'error': 'Backup failed'}), 500
+            return jsonify({'error': str(e)}), 500
+
+        add_to_history('backup_files', 'success', report)
+        response = {'status': 'success', 'message': 'Backup completed'}
+        if report:
+            response['report'] = report
+        return jsonify(response), 200
 
     except Exception as e:
-        print(f"[v0] Error backing up: {str(e)}")
+        log.error("Error backing up: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-# ============== EXECUTION HISTORY ENDPOINTS ==============
+# ============== JOB ENDPOINTS ==============
 
-@app.route('/api/history', methods=['GET'])
-def get_history():
-    """Get task execution history"""
-    print("[v0] API: Fetching execution history")
+def _job_accepted(job):
+    """202 response for a newly queued job"""
+    return jsonify({
+        'status': 'accepted',
+        'job_id': job.id,
+        'job': job.to_dict()
+    }), 202
+
+
+@api.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List background jobs"""
+    status = request.args.get('status')
+    job_type = request.args.get('type')
     limit = request.args.get('limit', 50, type=int)
+    jobs = job_manager.list_jobs(status=status, job_type=job_type, limit=limit)
     return jsonify({
         'status': 'success',
-        'count': len(execution_history),
-        'history': execution_history[-limit:]
+        'counts': job_manager.counts(),
+        'jobs': [job.to_dict() for job in jobs]
     }), 200
 
 
-@app.route('/api/history/clear', methods=['POST'])
+@api.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get status and progress of one job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@api.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    log.debug("API: Cancelling job %s", job_id)
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not job_manager.cancel(job_id):
+        return jsonify({'error': f'Job already {job.status}'}), 409
+    return jsonify({'status': 'success', 'job': job.to_dict()}), 200
+
+
+# ============== EXECUTION HISTORY ENDPOINTS ==============
+
+@api.route('/api/history', methods=['GET'])
+def get_history():
+    """Get task execution history, newest page first, optionally filtered"""
+    log.debug("API: Fetching execution history")
+    try:
+        limit = min(max(request.args.get('limit', 50, type=int), 1), settings.HISTORY_PAGE_MAX)
+        filters = {
+            'task': request.args.get('task') or None,
+            'status': request.args.get('status') or None,
+            'since': parse_time(request.args.get('since')),
+            'until': parse_time(request.args.get('until'))
+        }
+        before = request.args.get('before', type=int)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        entries, next_cursor = history_store.query(before=before, limit=limit, **filters)
+        return jsonify({
+            'status': 'success',
+            'count': history_store.count(**filters),
+            'history': entries,
+            'next_cursor': next_cursor
+        }), 200
+
+    except Exception as e:
+        log.error("Error fetching history: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/history/summary', methods=['GET'])
+def get_history_summary():
+    """Get task counts by status and by task"""
+    log.debug("API: Summarizing execution history")
+    try:
+        summary = history_store.counts()
+        summary['store'] = history_store.stats()
+        return jsonify({'status': 'success', **summary}), 200
+
+    except Exception as e:
+        log.error("Error summarizing history: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/history/clear', methods=['POST'])
 def clear_history():
-    """Clear execution history"""
-    print("[v0] API: Clearing execution history")
-    global execution_history
-    execution_history.clear()
-    return jsonify({'status': 'success', 'message': 'History cleared'}), 200
+    """Clear execution history, or only the entries matching task/status/before"""
+    log.debug("API: Clearing execution history")
+    data = request.get_json(silent=True) or {}
+    try:
+        before = parse_time(data.get('before'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        removed = history_store.delete(task=data.get('task'), status=data.get('status'), until=before)
+        return jsonify({'status': 'success', 'message': 'History cleared', 'removed': removed}), 200
+
+    except Exception as e:
+        log.error("Error clearing history: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/history/prune', methods=['POST'])
+def prune_history():
+    """Apply the configured retention limits now"""
+    log.debug("API: Pruning execution history")
+    try:
+        removed = history_store.prune()
+        return jsonify({'status': 'success', 'removed': removed, 'store': history_store.stats()}), 200
+
+    except Exception as e:
+        log.error("Error pruning history: %s", e)
+        return jsonify({'error': str(e)}), 500
 
 
 # ============== DASHBOARD STATS ENDPOINTS ==============
 
-@app.route('/api/dashboard/summary', methods=['GET'])
+@api.route('/api/dashboard/summary', methods=['GET'])
 def get_dashboard_summary():
     """Get dashboard summary data"""
-    print("[v0] API: Generating dashboard summary")
+    log.debug("API: Generating dashboard summary")
     try:
-        monitor = SystemMonitor()
-        health = monitor.generate_health_report()
+        health = sampler.snapshot()
+
+        counts = history_store.counts()
 
         summary = {
-            'total_tasks': len(execution_history),
-            'successful_tasks': sum(1 for h in execution_history if h['status'] == 'success'),
-            'failed_tasks': sum(1 for h in execution_history if h['status'] == 'failed'),
+            'total_tasks': counts['total'],
+            'successful_tasks': counts['by_status'].get('success', 0),
+            'failed_tasks': counts['by_status'].get('failed', 0),
             'system_health': health['overall_health'],
             'cpu_usage': health['cpu']['usage_percent'],
             'memory_usage': health['memory']['percent'],
             'disk_usage': health['disk']['percent'],
+            'metrics_age_seconds': health['age_seconds'],
             'timestamp': datetime.now().isoformat()
         }
 
         return jsonify(summary), 200
 
     except Exception as e:
-        print(f"[v0] Error generating summary: {str(e)}")
+        log.error("Error generating summary: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+# ============== METRICS ENDPOINT ==============
+
+def metrics_payload() -> str:
+    """Prometheus text for every worker (shared with the ASGI entry point)"""
+    dump = telemetry_exporter.collect() if telemetry_exporter is not None else telemetry_registry.dump()
+    return render_metrics(dump)
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request latency, in-flight and error counts and stage timings in Prometheus text format"""
+    try:
+        return Response(metrics_payload(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    except Exception as e:
+        log.error("Error rendering metrics: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+# ============== PROFILING ENDPOINTS ==============
+
+def _profile_admin_denied():
+    if settings.PROFILE_TOKEN and request.headers.get(TOKEN_HEADER) != settings.PROFILE_TOKEN:
+        return jsonify({'error': f"Missing or wrong {TOKEN_HEADER}"}), 403
+    return None
+
+
+@api.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """List stored request profiles, newest first"""
+    denied = _profile_admin_denied()
+    if denied:
+        return denied
+    try:
+        limit = request.args.get('limit', 100, type=int)
+        profiles = profile_store.list(limit)
+        return jsonify({
+            'profiles': profiles,
+            'count': len(profiles),
+            'enabled': settings.PROFILING_ENABLED
+        }), 200
+    except Exception as e:
+        log.error("Error listing profiles: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """Download a profile (pstats or collapsed stacks), or ?format=text for a readable summary"""
+    denied = _profile_admin_denied()
+    if denied:
+        return denied
+    try:
+        meta = profile_store.get(profile_id)
+    except KeyError:
+        return jsonify({'error': f"Unknown profile: {profile_id}"}), 404
+    try:
+        if request.args.get('format') == 'text':
+            summary = profile_store.summary(meta, sort=request.args.get('sort', 'cumulative'),
+                                            limit=request.args.get('limit', 50, type=int))
+            return Response(summary, mimetype='text/plain')
+        path = profile_store.file_path(meta)
+        return send_file(os.path.abspath(path), as_attachment=True, download_name=os.path.basename(path),
+                         mimetype='application/octet-stream' if meta['mode'] == 'cprofile' else 'text/plain')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.error("Error reading profile: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/admin/profiles/<profile_id>', methods=['DELETE'])
+def delete_profile(profile_id):
+    """Delete a stored profile"""
+    denied = _profile_admin_denied()
+    if denied:
+        return denied
+    try:
+        profile_store.delete(profile_id)
+        return jsonify({'status': 'success', 'deleted': profile_id}), 200
+    except KeyError:
+        return jsonify({'error': f"Unknown profile: {profile_id}"}), 404
+    except Exception as e:
+        log.error("Error deleting profile: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
 # ============== ERROR HANDLERS ==============
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
     return jsonify({'error': 'Endpoint not found'}), 404
 
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
     return jsonify({'error': 'Internal server error'}), 500
 
 
+def create_app(config_name: str = None) -> Flask:
+    """Build the Flask application
+
+    ``config_name`` selects the Flask settings from ``config_by_name``. The
+    services above are shared by every app in the process and configured
+    from ``APP_ENV``, so servers set that before importing this module (see
+    ``serve.py``).
+    """
+    flask_app = Flask(__name__)
+    flask_app.config.from_object(get_config(config_name))
+    CORS(flask_app)
+    flask_app.register_blueprint(api)
+    if settings.PROFILING_ENABLED:
+        flask_app.wsgi_app = RequestProfiler(flask_app.wsgi_app, profile_store, profile_limiter,
+                                             token=settings.PROFILE_TOKEN,
+                                             sample_interval=settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+    return flask_app
+
+
+app = create_app()
+
+
 if __name__ == '__main__':
-    print("[v0] Starting Flask API server...")
-    print("[v0] API available at http://localhost:8000")
-    print("[v0] Dashboard at http://localhost:3000")
-    app.run(debug=True, port=8000, host='0.0.0.0')
+    log.info("Starting Flask API server...")
+    log.info("API available at http://localhost:8000")
+    log.info("Dashboard at http://localhost:3000")
+    app.run(debug=app.config['DEBUG'], port=8000, host='0.0.0.0')
@@ -0,0 +1,235 @@
+"""
+ASGI Entry Point
+Serves cheap and streaming routes on the event loop and the rest of the Flask app on bounded thread pools
+"""
+
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from a2wsgi import WSGIMiddleware
+
+import app as app_module
+from log import get_logger
+from telemetry import registry as telemetry_registry, request_finished, request_started
+
+log = get_logger('asgi')
+
+settings = app_module.settings
+
+# Route classes for bridged Flask routes; each gets its own thread pool so a
+# burst of data processing can't hold up system or file requests
+ROUTE_CLASSES = (
+    ('system', ('/api/system/', '/api/dashboard/')),
+    ('files', ('/api/files/',)),
+    ('data', ('/api/data/', '/api/cache/')),
+)
+
+# Snapshot-backed system endpoints answered on the loop: path -> (section, history task)
+SNAPSHOT_ROUTES = {
+    '/api/system/health': (None, 'system_health'),
+    '/api/system/cpu': ('cpu', 'cpu_stats'),
+    '/api/system/memory': ('memory', 'memory_stats'),
+    '/api/system/network': ('network', 'network_stats'),
+}
+
+shed_requests = telemetry_registry.counter('asgi_requests_shed_total', 'Requests refused because a pool queue was full',
+                                          ('pool',))
+
+Handler = Callable[[Dict, Callable, Callable], Awaitable[None]]
+
+
+def _headers(content_type: str, extra: Optional[List[Tuple[str, str]]] = None) -> List[Tuple[bytes, bytes]]:
+    # Same CORS policy as flask_cors' default on the Flask routes
+    headers = [('content-type', content_type), ('access-control-allow-origin', '*')] + (extra or [])
+    return [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+async def send_json(send: Callable, payload: Dict, status: int = 200,
+                    headers: Optional[List[Tuple[str, str]]] = None) -> None:
+    body = json.dumps(payload, default=str).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': _headers('application/json', [('content-length', str(len(body)))] + (headers or []))})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AsyncAPI:
+    """ASGI application with the same routes as ``app.create_app()``
+
+    Health, status, the sampler-snapshot system endpoints and the live
+    metrics stream run as coroutines: they only read in-memory state, so
+    they answer at once however busy the pools are, and each SSE client is a
+    queue instead of a thread. Every other request goes to the Flask app
+    through a2wsgi on the thread pool of its route class (``system``,
+    ``files``, ``data`` or ``default``), where the blocking psutil, walk and
+    pandas work runs. At most ``queue_limit`` requests wait for each pool;
+    beyond that the client gets 503 with ``Retry-After`` rather than an
+    unbounded backlog.
+    """
+
+    def __init__(self, flask_app, pool_threads: Dict[str, int], queue_limit: int = 64):
+        self.queue_limit = queue_limit
+        self.pool_threads = dict(pool_threads)
+        self.bridges = {name: WSGIMiddleware(flask_app, workers=threads) for name, threads in pool_threads.items()}
+        self.pending = {name: 0 for name in pool_threads}
+        # History writes from loop handlers are handed off so SQLite never blocks the loop
+        self._history = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history')
+        self._system = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sampler-prime')
+        self.routes: Dict[Tuple[str, str], Handler] = {
+            ('GET', '/api/health'): self.health,
+            ('GET', '/api/status'): self.status,
+            ('GET', '/api/stream/metrics'): self.stream_metrics,
+        }
+        for path in SNAPSHOT_ROUTES:
+            self.routes[('GET', path)] = self.system_snapshot
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is not None:
+            await self.serve_native(handler, scope, receive, send)
+            return
+        await self.bridge(scope, receive, send)
+
+    async def serve_native(self, handler: Handler, scope: Dict, receive: Callable, send: Callable) -> None:
+        """Run a loop-native route with the same request metrics as the Flask routes"""
+        route = scope['path']
+        started = time.perf_counter()
+        responded = False
+
+        async def send_and_record(message: Dict) -> None:
+            nonlocal responded
+            if message['type'] == 'http.response.start':
+                responded = True
+                # Latency until the response starts, as for Flask (streams stay open much longer)
+                request_finished(scope['method'], route, message['status'], time.perf_counter() - started)
+            await send(message)
+
+        request_started(route)
+        try:
+            await handler(scope, receive, send_and_record)
+        except Exception as e:
+            log.error("Error in async endpoint %s: %s", route, e)
+            if not responded:
+                await send_json(send_and_record, {'error': str(e)}, 500)
+        finally:
+            if not responded:
+                # Client went away before anything was sent
+                request_finished(scope['method'], route, 499, time.perf_counter() - started)
+
+    async def lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                app_module.start_worker()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._history.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def route_class(self, path: str) -> str:
+        for name, prefixes in ROUTE_CLASSES:
+            if path.startswith(prefixes):
+                return name
+        return 'default'
+
+    async def bridge(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        """Run a Flask route on its class's pool, shedding load past the queue limit"""
+        name = self.route_class(scope['path'])
+        if name not in self.bridges:
+            name = 'default'
+        bridge = self.bridges[name]
+        if self.pending[name] >= self.queue_limit:
+            shed_requests.inc(name)
+            await send_json(send, {'error': f"Too many pending {name} requests"}, 503, [('retry-after', '1')])
+            return
+        self.pending[name] += 1
+        try:
+            await bridge(scope, receive, send)
+        finally:
+            self.pending[name] -= 1
+
+    # -- loop-native routes ------------------------------------------------
+
+    async def health(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        payload = app_module.health_payload()
+        payload['pools'] = {name: {'pending': self.pending[name], 'threads': self.pool_threads[name]}
+                            for name in self.bridges}
+        await send_json(send, payload)
+
+    async def status(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        await send_json(send, app_module.status_payload())
+
+    async def _snapshot(self) -> Dict:
+        sampler = app_module.sampler
+        if sampler.ready:
+            return sampler.snapshot()
+        # Starting or priming the sampler sleeps briefly; keep that off the loop
+        return await asyncio.get_running_loop().run_in_executor(self._system, sampler.snapshot)
+
+    async def system_snapshot(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        section, task = SNAPSHOT_ROUTES[scope['path']]
+        try:
+            report = await self._snapshot()
+        except Exception as e:
+            log.error("Error in %s endpoint: %s", task, e)
+            if section is None:
+                self._history.submit(app_module.add_to_history, task, 'failed', {'error': str(e)})
+            await send_json(send, {'error': str(e)}, 500)
+            return
+        if section is None:
+            payload = report
+            details = {'health': report['overall_health']}
+        else:
+            payload = dict(report[section])
+            payload['age_seconds'] = report['age_seconds']
+            details = None
+        self._history.submit(app_module.add_to_history, task, 'success', details)
+        await send_json(send, payload)
+
+    async def stream_metrics(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        """Server-Sent Events, one coroutine and queue per client"""
+        log.debug("API: Opening metrics stream")
+        sampler = app_module.sampler
+        if not sampler.running:
+            sampler.start()
+        broadcaster = app_module.broadcaster
+        subscription = broadcaster.subscribe(loop=asyncio.get_running_loop())
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': _headers(
+                'text/event-stream', [('cache-control', 'no-cache'), ('x-accel-buffering', 'no')])})
+            await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+            while True:
+                message = asyncio.ensure_future(subscription.get(timeout=settings.STREAM_KEEPALIVE_SECONDS))
+                await asyncio.wait({message, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    message.cancel()
+                    break
+                # Comment lines keep proxies from closing idle connections
+                body = message.result() or ': keepalive\n\n'
+                await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+        finally:
+            disconnected.cancel()
+            broadcaster.unsubscribe(subscription)
+            log.debug("API: Metrics stream closed")
+
+    @staticmethod
+    async def _wait_disconnect(receive: Callable) -> None:
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+
+def create_asgi_app(config_name: str = None) -> AsyncAPI:
+    """ASGI counterpart of ``app.create_app``"""
+    return AsyncAPI(app_module.create_app(config_name), settings.ASGI_POOL_THREADS, settings.ASGI_POOL_QUEUE)
+
+
+application = create_asgi_app()
@@ -18,27 +18,127 @@ class Config:
     # File uploads
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'uploads')
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max file size
+    # Resumable upload sessions (POST /api/data/uploads) for larger files
+    UPLOAD_SESSION_MAX_BYTES = int(os.environ.get('UPLOAD_SESSION_MAX_BYTES', 50 * 1024 ** 3))
+    UPLOAD_SESSION_TTL_SECONDS = float(os.environ.get('UPLOAD_SESSION_TTL_SECONDS', 24 * 3600))
+    # Rows per chunk when CSV/JSON Lines uploads are parsed as they stream in (0 = parse after upload)
+    UPLOAD_PARSE_CHUNKSIZE = int(os.environ.get('UPLOAD_PARSE_CHUNKSIZE', 100000))
+    
+    # Analysis result cache
+    RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR') or os.path.join(os.path.dirname(__file__), '..', '.cache', 'results')
+    RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    RESULT_CACHE_STORE_FRAMES = os.environ.get('RESULT_CACHE_STORE_FRAMES', 'false').lower() == 'true'
+    
+    # Shrink in-memory frames to compact dtypes (category, downcast ints, Arrow strings) after cleaning
+    OPTIMIZE_DTYPES = os.environ.get('OPTIMIZE_DTYPES', 'false').lower() == 'true'
     
     # API
     JSON_SORT_KEYS = False
     
+    # System metrics sampler
+    METRICS_SAMPLE_INTERVAL = float(os.environ.get('METRICS_SAMPLE_INTERVAL', 5))
+    ALERT_THRESHOLD = float(os.environ.get('ALERT_THRESHOLD', 80))
+    
+    # Directory walks: >0 scans directories on that many threads (helps on NFS/SMB)
+    FILE_WALK_THREADS = int(os.environ.get('FILE_WALK_THREADS', 0))
+    
+    # Cleanup executor: 0 = no rate limit
+    CLEANUP_WORKERS = int(os.environ.get('CLEANUP_WORKERS', 4))
+    CLEANUP_BATCH_SIZE = int(os.environ.get('CLEANUP_BATCH_SIZE', 500))
+    CLEANUP_MAX_FILES_PER_SECOND = float(os.environ.get('CLEANUP_MAX_FILES_PER_SECOND', 0))
+    CLEANUP_PREVIEW_FILES = 100
+    
+    # Persistent file metadata index (inotify-maintained); roots separated by os.pathsep
+    FILE_INDEX_ENABLED = os.environ.get('FILE_INDEX_ENABLED', 'false').lower() == 'true'
+    FILE_INDEX_PATH = os.environ.get('FILE_INDEX_PATH') or os.path.join(os.path.dirname(__file__), '..', '.cache', 'file-index.db')
+    FILE_INDEX_ROOTS = [root for root in os.environ.get('FILE_INDEX_ROOTS', '').split(os.pathsep) if root]
+    FILE_INDEX_RECONCILE_SECONDS = float(os.environ.get('FILE_INDEX_RECONCILE_SECONDS', 300))
+    
+    # Background jobs
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+    JOB_TYPE_LIMITS = {
+        'data_process': 2,
+        'data_batch': 1,
+        'data_dedupe': 1,
+        'backup_files': 1,
+        'cleanup_files': 1,
+        'organize_files': 1
+    }
+    
+    # Execution history: 'sqlite' (durable, shared by every worker) or 'memory' (per process)
+    HISTORY_BACKEND = os.environ.get('HISTORY_BACKEND', 'sqlite')
+    HISTORY_PATH = os.environ.get('HISTORY_PATH') or os.path.join(os.path.dirname(__file__), '..', '.cache', 'history.db')
+    # Retention: 0 = no limit
+    HISTORY_MAX_ENTRIES = int(os.environ.get('HISTORY_MAX_ENTRIES', 1000000))
+    HISTORY_MAX_AGE_DAYS = float(os.environ.get('HISTORY_MAX_AGE_DAYS', 90))
+    HISTORY_PAGE_MAX = 1000
+    
+    # Logging: DEBUG, INFO, WARNING, ERROR or OFF; buffered records are written by a background thread
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_BUFFERED = os.environ.get('LOG_BUFFERED', 'true').lower() == 'true'
+    
+    # /metrics: with SHARED_STATE, seconds between each worker's metric publications
+    TELEMETRY_FLUSH_SECONDS = float(os.environ.get('TELEMETRY_FLUSH_SECONDS', 5))
+    
+    # On-demand request profiling (X-Profile: cprofile|sample); with a token set, requests and
+    # /api/admin/profiles must send it in X-Profile-Token
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(os.path.dirname(__file__), '..', '.cache', 'profiles')
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    PROFILE_RATE_PER_MINUTE = float(os.environ.get('PROFILE_RATE_PER_MINUTE', 6))
+    PROFILE_MAX_CONCURRENT = int(os.environ.get('PROFILE_MAX_CONCURRENT', 1))
+    PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 200))
+    PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5))
+    
+    # Live metrics stream
+    STREAM_MAX_QUEUE = 16
+    STREAM_KEEPALIVE_SECONDS = 15
+    
+    # ASGI entry point (api/asgi.py): threads per route class for the Flask routes it
+    # bridges, and how many requests may wait for one before new ones get 503
+    ASGI_POOL_THREADS = {
+        'system': 4,
+        'files': 4,
+        'data': 4,
+        'default': 8
+    }
+    ASGI_POOL_QUEUE = int(os.environ.get('ASGI_POOL_QUEUE', 64))
+    
+    # Multi-worker deployments: one elected worker samples metrics and maintains
+    # the file index, and the result cache and jobs are kept in STATE_DIR
+    SHARED_STATE = os.environ.get('SHARED_STATE', 'false').lower() == 'true'
+    STATE_DIR = os.environ.get('STATE_DIR') or os.path.join(os.path.dirname(__file__), '..', '.cache', 'state')
+    
+    # Production server (api/serve.py)
+    SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', min(2 * (os.cpu_count() or 1) + 1, 9)))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))
+    SERVER_PRELOAD = os.environ.get('SERVER_PRELOAD', 'true').lower() == 'true'
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 120))
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 0))
+    
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     TESTING = False
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG')
 
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     TESTING = False
+    SHARED_STATE = os.environ.get('SHARED_STATE', 'true').lower() == 'true'
 
 
 class TestingConfig(Config):
     """Testing configuration"""
     DEBUG = True
     TESTING = True
+    HISTORY_BACKEND = os.environ.get('HISTORY_BACKEND', 'memory')
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'WARNING')
 
 
 config_by_name = {
@@ -47,3 +147,11 @@ config_by_name = {
     'testing': TestingConfig,
     'default': DevelopmentConfig
 }
+
+
+def get_config(name: str = None):
+    """Configuration class for ``name``, defaulting to ``APP_ENV`` (or ``FLASK_ENV``)"""
+    name = name or os.environ.get('APP_ENV') or os.environ.get('FLASK_ENV') or 'default'
+    if name not in config_by_name:
+        raise ValueError(f"Unknown configuration '{name}'. Use one of: {', '.join(config_by_name)}")
+    return config_by_name[name]
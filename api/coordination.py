@@ -0,0 +1,136 @@
+"""
+Worker Coordination
+Leader election and a shared metrics snapshot for multi-worker deployments
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional
+
+from log import get_logger
+
+log = get_logger('coordination')
+
+
+class LeaderElection:
+    """Elects one worker process per host through an exclusive ``flock``
+
+    Every worker calls ``start``. The first one to take the lock becomes
+    leader and runs the ``on_elected`` callbacks; the others retry every
+    ``retry_interval`` seconds and take over when the leader exits, since
+    the kernel releases the lock with the process. Must be started after
+    forking: a lock taken before fork would be shared by every child.
+    """
+
+    def __init__(self, lock_path: str, retry_interval: float = 5.0):
+        self.lock_path = lock_path
+        self.retry_interval = retry_interval
+        self._callbacks: List[Callable[[], None]] = []
+        self._fd = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fd is not None and self._pid == os.getpid()
+
+    def on_elected(self, callback: Callable[[], None]) -> None:
+        """Register a callback run (once) when this process becomes leader"""
+        self._callbacks.append(callback)
+
+    def start(self) -> None:
+        """Try for leadership now and keep retrying in the background (idempotent per process)"""
+        if self._pid == os.getpid():
+            return
+        # State inherited from a parent process is not ours
+        self._pid = os.getpid()
+        self._fd = None
+        self._stop.clear()
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        if self._try_acquire():
+            return
+        self._thread = threading.Thread(target=self._run, name='leader-election', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.retry_interval):
+            if self._try_acquire():
+                return
+
+    def _try_acquire(self) -> bool:
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        log.info("Worker %s elected leader", os.getpid())
+        for callback in list(self._callbacks):
+            try:
+                callback()
+            except Exception as e:
+                log.error("Leader callback error: %s", e)
+        return True
+
+    def stats(self) -> Dict:
+        leader_pid = None
+        try:
+            with open(self.lock_path) as f:
+                leader_pid = int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            pass
+        return {'pid': os.getpid(), 'is_leader': self.is_leader, 'leader_pid': leader_pid}
+
+
+class SharedSnapshot:
+    """Latest metrics report, published by the leader to a file every worker reads
+
+    Writes go to a temporary file that is renamed into place, so readers
+    never see a partial report. ``read_new`` only parses the file when its
+    mtime changed since the last call, so polling it is a single ``stat``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._seen = None
+
+    def write(self, report: Dict, extra: Optional[Dict] = None) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'report': report, 'extra': extra or {}}, f, default=str)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def read_new(self) -> Optional[Dict]:
+        """``{'report', 'extra'}`` if the snapshot changed since the last call, else None"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime == self._seen:
+            return None
+        try:
+            with open(self.path) as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._seen = mtime
+        return payload
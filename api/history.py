@@ -0,0 +1,396 @@
+"""
+Execution History Store
+Append-only task history with rolling counters, in memory or in SQLite
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    task TEXT NOT NULL,
+    status TEXT NOT NULL,
+    details TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_ts ON history(ts);
+CREATE INDEX IF NOT EXISTS history_task ON history(task, id);
+CREATE INDEX IF NOT EXISTS history_task_status ON history(task, status, id);
+CREATE INDEX IF NOT EXISTS history_status ON history(status, id);
+CREATE TABLE IF NOT EXISTS counters (
+    task TEXT NOT NULL,
+    status TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (task, status)
+);
+"""
+
+# Retention runs after this many inserts rather than on every write
+PRUNE_EVERY = 1000
+DELETE_BATCH = 50000
+
+
+def parse_time(value) -> Optional[float]:
+    """Epoch seconds from an epoch number or an ISO-8601 string (None passes through)"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}'. Use epoch seconds or ISO-8601")
+
+
+def _entry(entry_id: int, ts: float, task: str, status: str, details: Dict) -> Dict:
+    return {
+        'id': entry_id,
+        'timestamp': datetime.fromtimestamp(ts).isoformat(),
+        'task': task,
+        'status': status,
+        'details': details
+    }
+
+
+def _summarize(counts: Dict[Tuple[str, str], int]) -> Dict:
+    by_status = Counter()
+    by_task = Counter()
+    for (task, status), count in counts.items():
+        by_status[status] += count
+        by_task[task] += count
+    return {
+        'total': sum(by_status.values()),
+        'by_status': dict(by_status),
+        'by_task': dict(by_task)
+    }
+
+
+class HistoryStore:
+    """Interface shared by the history backends
+
+    Entries get increasing ids, which double as pagination cursors:
+    ``query`` returns the newest matching entries older than ``before`` in
+    chronological order, plus the cursor for the next (older) page. Counts
+    per (task, status) are kept up to date on every write and every
+    retention pass, so summaries never scan the history.
+
+    Retention drops the oldest entries beyond ``max_entries`` and entries
+    older than ``max_age_seconds`` (either may be None for no limit).
+    """
+
+    backend = None
+
+    def __init__(self, max_entries: Optional[int] = None, max_age_seconds: Optional[float] = None):
+        self.max_entries = max_entries or None
+        self.max_age_seconds = max_age_seconds or None
+
+    def add(self, task: str, status: str, details: Optional[Dict] = None,
+            timestamp: Optional[float] = None) -> Dict:
+        raise NotImplementedError
+
+    def query(self, task: Optional[str] = None, status: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, before: Optional[int] = None,
+              limit: int = 50) -> Tuple[List[Dict], Optional[int]]:
+        raise NotImplementedError
+
+    def count(self, task: Optional[str] = None, status: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None) -> int:
+        raise NotImplementedError
+
+    def counts(self) -> Dict:
+        """``total`` plus totals ``by_status`` and ``by_task``"""
+        raise NotImplementedError
+
+    def delete(self, task: Optional[str] = None, status: Optional[str] = None,
+               until: Optional[float] = None) -> int:
+        """Remove matching entries (every entry when no filter is given)"""
+        raise NotImplementedError
+
+    def prune(self) -> int:
+        """Apply the retention limits now; returns the number of entries removed"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {'backend': self.backend, 'max_entries': self.max_entries, 'max_age_seconds': self.max_age_seconds}
+
+    def _age_cutoff(self) -> Optional[float]:
+        return time.time() - self.max_age_seconds if self.max_age_seconds else None
+
+
+class MemoryHistoryStore(HistoryStore):
+    """Bounded in-process history (lost on restart, not shared across workers)"""
+
+    backend = 'memory'
+
+    def __init__(self, max_entries: Optional[int] = 10000, max_age_seconds: Optional[float] = None):
+        super().__init__(max_entries, max_age_seconds)
+        self._entries = deque()
+        self._counts: Counter = Counter()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def add(self, task: str, status: str, details: Optional[Dict] = None,
+            timestamp: Optional[float] = None) -> Dict:
+        with self._lock:
+            record = (self._next_id, timestamp or time.time(), task, status, details or {})
+            self._next_id += 1
+            self._entries.append(record)
+            self._counts[(task, status)] += 1
+            self._prune_locked()
+        return _entry(*record)
+
+    def _matching(self, task, status, since, until, before):
+        for record in reversed(self._entries):
+            entry_id, ts, entry_task, entry_status, _ = record
+            if before is not None and entry_id >= before:
+                continue
+            if since is not None and ts < since:
+                # Timestamps only grow, so nothing older can match
+                break
+            if ((task is None or entry_task == task) and (status is None or entry_status == status)
+                    and (until is None or ts < until)):
+                yield record
+
+    def query(self, task=None, status=None, since=None, until=None, before=None, limit=50):
+        with self._lock:
+            page = []
+            for record in self._matching(task, status, since, until, before):
+                if len(page) == limit:
+                    return [_entry(*r) for r in reversed(page)], page[-1][0]
+                page.append(record)
+        return [_entry(*r) for r in reversed(page)], None
+
+    def count(self, task=None, status=None, since=None, until=None) -> int:
+        with self._lock:
+            if since is None and until is None:
+                return sum(count for (t, s), count in self._counts.items()
+                           if (task is None or t == task) and (status is None or s == status))
+            return sum(1 for _ in self._matching(task, status, since, until, None))
+
+    def counts(self) -> Dict:
+        with self._lock:
+            return _summarize(self._counts)
+
+    def delete(self, task=None, status=None, until=None) -> int:
+        with self._lock:
+            kept = deque()
+            removed = 0
+            for record in self._entries:
+                _, ts, entry_task, entry_status, _ = record
+                if ((task is None or entry_task == task) and (status is None or entry_status == status)
+                        and (until is None or ts < until)):
+                    self._counts[(entry_task, entry_status)] -= 1
+                    removed += 1
+                else:
+                    kept.append(record)
+            self._entries = kept
+            self._counts = +self._counts
+            return removed
+
+    def prune(self) -> int:
+        with self._lock:
+            return self._prune_locked()
+
+    def _prune_locked(self) -> int:
+        removed = 0
+        cutoff = self._age_cutoff()
+        while self._entries and ((self.max_entries and len(self._entries) > self.max_entries)
+                                 or (cutoff is not None and self._entries[0][1] < cutoff)):
+            _, _, task, status, _ = self._entries.popleft()
+            self._counts[(task, status)] -= 1
+            if not self._counts[(task, status)]:
+                del self._counts[(task, status)]
+            removed += 1
+        return removed
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """Durable history in a WAL-mode SQLite database
+
+    Several processes (e.g. gunicorn workers) can share one database file:
+    WAL lets readers run alongside the single writer, and each insert
+    updates the ``counters`` table in the same transaction, so every worker
+    sees the same counts. Entries are indexed by time, by task, by task and
+    status, and by status, each ending in the id, so filtered pages are
+    index range scans that stay fast with millions of rows.
+    Retention runs on first use and every ``PRUNE_EVERY`` inserts, and
+    deletes in batches to keep write locks short. Each process opens its
+    own connection on first use (and again after a fork).
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, db_path: str, max_entries: Optional[int] = 1000000,
+                 max_age_seconds: Optional[float] = None):
+        super().__init__(max_entries, max_age_seconds)
+        self.path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._db = None
+        self._db_pid = None
+        self._inherited = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per process, opened on first use; the first one applies retention
+        if self._db is None or self._db_pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            # Keep an inherited connection referenced: closing it could disturb the parent's
+            self._inherited, self._db, self._db_pid = self._db, conn, os.getpid()
+            if self._inherited is None:
+                self._prune_locked()
+        return self._db
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front so concurrent workers wait
+        # on busy_timeout instead of failing to upgrade a read transaction
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def add(self, task: str, status: str, details: Optional[Dict] = None,
+            timestamp: Optional[float] = None) -> Dict:
+        details = details or {}
+        ts = timestamp or time.time()
+        payload = json.dumps(details, default=str)
+        with self._lock:
+            with self._transaction():
+                cursor = self._conn.execute('INSERT INTO history (ts, task, status, details) VALUES (?, ?, ?, ?)',
+                                            (ts, task, status, payload))
+                self._conn.execute('INSERT INTO counters (task, status, count) VALUES (?, ?, 1) '
+                                   'ON CONFLICT (task, status) DO UPDATE SET count = count + 1', (task, status))
+            entry_id = cursor.lastrowid
+            self._inserts += 1
+            if self._inserts % PRUNE_EVERY == 0:
+                self._prune_locked()
+        return _entry(entry_id, ts, task, status, details)
+
+    @staticmethod
+    def _where(task, status, since, until, before=None) -> Tuple[str, list]:
+        clauses, params = [], []
+        for clause, value in (('task = ?', task), ('status = ?', status), ('ts >= ?', since),
+                              ('ts < ?', until), ('id < ?', before)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query(self, task=None, status=None, since=None, until=None, before=None, limit=50):
+        where, params = self._where(task, status, since, until, before)
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT id, ts, task, status, details FROM history{where} ORDER BY id DESC LIMIT ?',
+                params + [limit + 1]).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+        entries = [_entry(entry_id, ts, entry_task, entry_status, json.loads(details))
+                   for entry_id, ts, entry_task, entry_status, details in reversed(rows)]
+        return entries, next_cursor
+
+    def count(self, task=None, status=None, since=None, until=None) -> int:
+        with self._lock:
+            if since is None and until is None:
+                where, params = self._where(task, status, None, None)
+                row = self._conn.execute(f'SELECT COALESCE(SUM(count), 0) FROM counters{where}', params).fetchone()
+            else:
+                where, params = self._where(task, status, since, until)
+                row = self._conn.execute(f'SELECT COUNT(*) FROM history{where}', params).fetchone()
+        return row[0]
+
+    def counts(self) -> Dict:
+        with self._lock:
+            rows = self._conn.execute('SELECT task, status, count FROM counters').fetchall()
+        return _summarize({(task, status): count for task, status, count in rows})
+
+    def delete(self, task=None, status=None, until=None) -> int:
+        with self._lock:
+            if task is None and status is None and until is None:
+                with self._transaction():
+                    removed = self._conn.execute('DELETE FROM history').rowcount
+                    self._conn.execute('DELETE FROM counters')
+                return removed
+            where, params = self._where(task, status, None, until)
+            removed = 0
+            while True:
+                ids = [row[0] for row in self._conn.execute(
+                    f'SELECT id FROM history{where} ORDER BY id LIMIT ?', params + [DELETE_BATCH])]
+                if not ids:
+                    return removed
+                removed += self._delete_ids(f'id IN ({",".join("?" * len(ids))})', ids)
+
+    def prune(self) -> int:
+        with self._lock:
+            return self._prune_locked()
+
+    def _prune_locked(self) -> int:
+        """Delete every entry up to the newest id that falls outside a retention limit"""
+        last = 0
+        if self.max_entries:
+            row = self._conn.execute('SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?',
+                                     (self.max_entries,)).fetchone()
+            if row:
+                last = row[0]
+        cutoff = self._age_cutoff()
+        if cutoff is not None:
+            row = self._conn.execute('SELECT MAX(id) FROM history WHERE ts < ?', (cutoff,)).fetchone()
+            if row[0]:
+                last = max(last, row[0])
+        removed = 0
+        while last:
+            first = self._conn.execute('SELECT MIN(id) FROM history').fetchone()[0]
+            if first is None or first > last:
+                break
+            upper = min(last, first + DELETE_BATCH - 1)
+            removed += self._delete_ids('id BETWEEN ? AND ?', [first, upper])
+        return removed
+
+    def _delete_ids(self, condition: str, params: list) -> int:
+        """Delete one batch and take its entries off the counters"""
+        with self._transaction():
+            grouped = self._conn.execute(
+                f'SELECT task, status, COUNT(*) FROM history WHERE {condition} GROUP BY task, status',
+                params).fetchall()
+            self._conn.executemany('UPDATE counters SET count = count - ? WHERE task = ? AND status = ?',
+                                   [(count, task, status) for task, status, count in grouped])
+            self._conn.execute('DELETE FROM counters WHERE count <= 0')
+            return self._conn.execute(f'DELETE FROM history WHERE {condition}', params).rowcount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = sum(os.path.getsize(self.path + suffix) for suffix in ('', '-wal')
+                       if os.path.exists(self.path + suffix))
+        stats = super().stats()
+        stats.update({'path': self.path, 'size_bytes': size})
+        return stats
+
+
+def create_history_store(backend: str, path: Optional[str] = None, max_entries: Optional[int] = None,
+                         max_age_seconds: Optional[float] = None) -> HistoryStore:
+    """Build the configured backend (``memory`` or ``sqlite``)"""
+    if backend == 'memory':
+        return MemoryHistoryStore(max_entries, max_age_seconds)
+    if backend == 'sqlite':
+        return SQLiteHistoryStore(path, max_entries, max_age_seconds)
+    raise ValueError(f"Unknown history backend '{backend}'. Use 'memory' or 'sqlite'")
@@ -0,0 +1,374 @@
+"""
+Background Job Queue
+Runs long-running API tasks on a bounded worker pool
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from log import get_logger
+
+log = get_logger('jobs')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Running jobs publish progress to a shared registry at most this often
+SYNC_INTERVAL = 1.0
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when cancellation was requested"""
+
+
+class Job:
+    """A single unit of queued work and its observable state"""
+
+    def __init__(self, job_type: str, fn: Callable, args: tuple, kwargs: dict):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = None
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._cancel_event = threading.Event()
+        self._sync: Optional[Callable[['Job'], None]] = None
+        self._synced_at = 0.0
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> 'Job':
+        """Read-only view of a job owned by another process"""
+        job = cls(state['type'], None, (), {})
+        job.id = state['job_id']
+        for field in ('status', 'progress', 'message', 'result', 'error', 'created_at', 'started_at', 'finished_at'):
+            setattr(job, field, state.get(field))
+        return job
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self) -> None:
+        """Cooperative cancellation point for job functions"""
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def set_progress(self, fraction: float, message: Optional[str] = None) -> None:
+        """Report progress in [0, 1]; also acts as a cancellation point"""
+        self.progress = round(min(max(float(fraction), 0.0), 1.0), 4)
+        if message is not None:
+            self.message = message
+        if self._sync is not None and time.monotonic() - self._synced_at >= SYNC_INTERVAL:
+            self._synced_at = time.monotonic()
+            self._sync(self)
+        self.check_cancelled()
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'type': self.type,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+REGISTRY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner_pid INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_updated ON jobs(updated_at);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+"""
+
+
+class JobRegistry:
+    """Job state shared by every worker process through SQLite
+
+    The process that runs a job stays its owner; the registry only mirrors
+    its state so any worker can report it, and carries cancellation requests
+    back to the owner, which picks them up at the job's next progress
+    checkpoint. Each process opens its own connection on first use.
+    """
+
+    def __init__(self, db_path: str, max_finished: int = 500):
+        self.db_path = db_path
+        self.max_finished = max_finished
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+        self._inherited = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None or self._db_pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(REGISTRY_SCHEMA)
+            # Keep an inherited connection referenced: closing it could disturb the parent's
+            self._inherited, self._db, self._db_pid = self._db, conn, os.getpid()
+        return self._db
+
+    def save(self, job: Job) -> None:
+        state = json.dumps(job.to_dict(), default=str)
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, type, status, owner_pid, state, updated_at) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET status = excluded.status, state = excluded.state, '
+                'updated_at = excluded.updated_at',
+                (job.id, job.type, job.status, os.getpid(), state, time.time()))
+            if job.status in FINISHED_STATES:
+                self._conn.execute(
+                    'DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE status IN (?, ?, ?) '
+                    'ORDER BY updated_at DESC LIMIT -1 OFFSET ?)', FINISHED_STATES + (self.max_finished,))
+
+    def load(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute('SELECT state, owner_pid FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._view(*row) if row else None
+
+    def list_jobs(self, status: Optional[str] = None, job_type: Optional[str] = None,
+                  limit: int = 50) -> List[Job]:
+        query, params = 'SELECT state, owner_pid FROM jobs', []
+        clauses = [(clause, value) for clause, value in (('status = ?', status), ('type = ?', job_type)) if value]
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clause for clause, _ in clauses)
+            params = [value for _, value in clauses]
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY rowid DESC LIMIT ?', params + [limit]).fetchall()
+        return [self._view(state, owner_pid) for state, owner_pid in reversed(rows)]
+
+    def _view(self, state: str, owner_pid: int) -> Job:
+        """Job view, failing unfinished jobs whose owner process is gone (e.g. a recycled worker)"""
+        job = Job.from_dict(json.loads(state))
+        if job.status not in FINISHED_STATES and owner_pid != os.getpid() and not _process_alive(owner_pid):
+            job.status = FAILED
+            job.error = 'Worker process exited before the job finished'
+            job.finished_at = datetime.now().isoformat()
+            self.save(job)
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        counts = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+        with self._lock:
+            for status, count in self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'):
+                counts[status] = count
+        return counts
+
+    def request_cancel(self, job_id: str) -> bool:
+        """Flag an unfinished job for cancellation by its owner"""
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status NOT IN (?, ?, ?)',
+                (job_id,) + FINISHED_STATES)
+        return cursor.rowcount > 0
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+
+class JobManager:
+    """Bounded pool with per-job-type concurrency limits
+
+    Jobs wait in a FIFO until both a pool slot and a slot for their type are
+    free, so a burst of backups can't occupy every worker and starve data
+    processing. Work runs on threads: job functions share progress state with
+    the API and spend their time in pandas/file I/O, which releases the GIL.
+    Job functions are called as ``fn(*args, job=job, **kwargs)``.
+
+    With a ``registry`` every job's state is mirrored to it, so lookups,
+    listings and cancellation work from any worker process; concurrency
+    limits still apply per process.
+    """
+
+    def __init__(self, max_workers: int = 4, type_limits: Optional[Dict[str, int]] = None,
+                 max_finished: int = 500, registry: Optional[JobRegistry] = None):
+        self.max_workers = max_workers
+        self.type_limits = dict(type_limits or {})
+        self.max_finished = max_finished
+        self.registry = registry
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._pending = deque()
+        self._running_by_type: Dict[str, int] = {}
+        self._running = 0
+        self._listeners: List[Callable[[Job], None]] = []
+
+    def add_listener(self, callback: Callable[[Job], None]) -> None:
+        """Register a callback invoked when a job finishes (any final state)"""
+        self._listeners.append(callback)
+
+    def submit(self, job_type: str, fn: Callable, *args, **kwargs) -> Job:
+        job = Job(job_type, fn, args, kwargs)
+        if self.registry is not None:
+            job._sync = self._sync
+            self.registry.save(job)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._pending.append(job)
+        self._dispatch()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.registry is not None:
+            return self.registry.load(job_id)
+        return job
+
+    def list_jobs(self, status: Optional[str] = None, job_type: Optional[str] = None,
+                  limit: int = 50) -> List[Job]:
+        if self.registry is not None:
+            return self.registry.list_jobs(status, job_type, limit)
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if status:
+            jobs = [job for job in jobs if job.status == status]
+        if job_type:
+            jobs = [job for job in jobs if job.type == job_type]
+        return jobs[-limit:]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job immediately, or ask a running one to stop"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None and self.registry is not None:
+                return self.registry.request_cancel(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return False
+            job._cancel_event.set()
+            if job.status != QUEUED:
+                return True
+            self._pending.remove(job)
+            self._finish(job, CANCELLED)
+        self._notify(job)
+        return True
+
+    def counts(self) -> Dict[str, int]:
+        if self.registry is not None:
+            return self.registry.counts()
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            for job in self._pending:
+                job._cancel_event.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _dispatch(self) -> None:
+        """Start queued jobs whose type still has capacity"""
+        with self._lock:
+            for job in list(self._pending):
+                if self._running >= self.max_workers:
+                    break
+                limit = self.type_limits.get(job.type)
+                if limit is not None and self._running_by_type.get(job.type, 0) >= limit:
+                    continue
+                self._pending.remove(job)
+                self._running += 1
+                self._running_by_type[job.type] = self._running_by_type.get(job.type, 0) + 1
+                job.status = RUNNING
+                job.started_at = datetime.now().isoformat()
+                self._executor.submit(self._run, job)
+
+    def _run(self, job: Job) -> None:
+        status = SUCCEEDED
+        try:
+            if self.registry is not None:
+                self._sync(job)
+            job.check_cancelled()
+            job.result = job._fn(*job._args, job=job, **job._kwargs)
+            job.progress = 1.0
+        except JobCancelled:
+            status = CANCELLED
+        except Exception as e:
+            log.error("Job %s (%s) failed: %s", job.id, job.type, e)
+            job.error = str(e)
+            status = FAILED
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._running_by_type[job.type] -= 1
+                self._finish(job, status)
+            self._notify(job)
+            self._dispatch()
+
+    def _finish(self, job: Job, status: str) -> None:
+        """Record the final state and trim old finished jobs (lock held)"""
+        job.status = status
+        job.finished_at = datetime.now().isoformat()
+        # Drop references to arguments so large inputs can be freed
+        job._args, job._kwargs = (), {}
+        finished = [j for j in self._jobs.values() if j.status in FINISHED_STATES]
+        for old in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[old.id]
+
+    def _sync(self, job: Job) -> None:
+        """Publish a running job's state and pick up cancellation requested elsewhere"""
+        try:
+            self.registry.save(job)
+            if self.registry.cancel_requested(job.id):
+                job._cancel_event.set()
+        except sqlite3.Error as e:
+            log.error("Job registry error: %s", e)
+
+    def _notify(self, job: Job) -> None:
+        if self.registry is not None:
+            try:
+                self.registry.save(job)
+            except sqlite3.Error as e:
+                log.error("Job registry error: %s", e)
+        for callback in list(self._listeners):
+            try:
+                callback(job)
+            except Exception as e:
+                log.error("Job listener error: %s", e)
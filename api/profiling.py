@@ -0,0 +1,352 @@
+"""
+Request Profiling
+On-demand cProfile and sampling profiles of single requests, stored for download
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from log import get_logger
+
+log = get_logger('profiling')
+
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+MODES = (CPROFILE, SAMPLE)
+# Profile file suffix per mode: pstats dump, or collapsed stacks (flamegraph.pl, speedscope)
+SUFFIXES = {CPROFILE: '.prof', SAMPLE: '.folded'}
+# pstats.SortKey values plus the aliases sort_stats also accepts (tottime, cumtime, ncalls, ...)
+SORT_KEYS = tuple(sorted(pstats.Stats.sort_arg_dict_default))
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY = '_profile'
+TOKEN_HEADER = 'X-Profile-Token'
+
+
+class RateLimiter:
+    """Token bucket plus a cap on concurrent holders; never blocks
+
+    ``try_acquire`` takes a token and a concurrency slot or returns False,
+    in which case the request simply runs unprofiled.
+    """
+
+    def __init__(self, per_minute: float, max_concurrent: int = 1):
+        self.rate = per_minute / 60.0
+        self.burst = max(1.0, per_minute)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1 or self.active >= self.max_concurrent:
+                return False
+            self.tokens -= 1
+            self.active += 1
+            return True
+
+    def release(self) -> None:
+        with self.lock:
+            self.active -= 1
+
+
+class StackSampler:
+    """Wall-clock sampling of one thread's Python stack
+
+    A daemon thread reads the target thread's frame from
+    ``sys._current_frames()`` every ``interval`` seconds and counts each
+    distinct stack, so blocking I/O shows up as well as CPU time. The cost to
+    the profiled request is one GIL hand-off per sample.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format: ``root;...;leaf count`` per line"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Profiles on disk: ``<id>.prof`` / ``<id>.folded`` with a ``<id>.json`` sidecar
+
+    Keeps at most ``max_files`` profiles, deleting the oldest first.
+    """
+
+    def __init__(self, directory: str, max_files: int = 200):
+        self.directory = directory
+        self.max_files = max_files
+        self.lock = threading.Lock()
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        if not profile_id or os.path.basename(profile_id) != profile_id or profile_id.startswith('.'):
+            raise KeyError(profile_id)
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def save(self, meta: Dict, write: Callable[[str], None]) -> Dict:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(meta['id'], SUFFIXES[meta['mode']])
+        write(path)
+        meta['size_bytes'] = os.path.getsize(path)
+        with open(self._path(meta['id'], '.json'), 'w') as f:
+            json.dump(meta, f)
+        self.prune()
+        return meta
+
+    def list(self, limit: Optional[int] = None) -> List[Dict]:
+        """Metadata of stored profiles, newest first"""
+        profiles = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        profiles.sort(key=lambda meta: meta.get('created', ''), reverse=True)
+        return profiles[:limit] if limit else profiles
+
+    def get(self, profile_id: str) -> Dict:
+        try:
+            with open(self._path(profile_id, '.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise KeyError(profile_id)
+
+    def file_path(self, meta: Dict) -> str:
+        return self._path(meta['id'], SUFFIXES[meta['mode']])
+
+    def delete(self, profile_id: str) -> bool:
+        meta = self.get(profile_id)
+        for path in (self.file_path(meta), self._path(profile_id, '.json')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def prune(self) -> int:
+        removed = 0
+        with self.lock:
+            for meta in self.list()[self.max_files:]:
+                try:
+                    self.delete(meta['id'])
+                    removed += 1
+                except KeyError:
+                    pass
+        return removed
+
+    def summary(self, meta: Dict, sort: str = 'cumulative', limit: int = 50) -> str:
+        """Readable report: pstats table for cProfile, heaviest stacks for samples"""
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort '{sort}'. Use one of: {', '.join(SORT_KEYS)}")
+        path = self.file_path(meta)
+        if meta['mode'] == CPROFILE:
+            out = io.StringIO()
+            pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+            return out.getvalue()
+        with open(path) as f:
+            return ''.join(f.readlines()[:limit])
+
+
+class _ProfiledBody:
+    """Response iterable that keeps the profiler running until the body is sent"""
+
+    def __init__(self, body: Iterable[bytes], session: '_Session'):
+        self._body = body
+        self._iterator = iter(body)
+        self._session = session
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        self._session.resume()
+        try:
+            return next(self._iterator)
+        finally:
+            self._session.pause()
+
+    def close(self) -> None:
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._session.finish()
+
+
+class _Session:
+    """One profiled request"""
+
+    def __init__(self, profiler: 'RequestProfiler', mode: str, environ: Dict):
+        self.profiler = profiler
+        self.mode = mode
+        self.id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = environ.get('REQUEST_METHOD', '')
+        self.path = environ.get('PATH_INFO', '')
+        self.query = environ.get('QUERY_STRING', '')
+        self.status = None
+        self.started = time.perf_counter()
+        self.finished = False
+        self._cprofile = cProfile.Profile() if mode == CPROFILE else None
+        self._sampler = StackSampler(threading.get_ident(), profiler.sample_interval) if mode == SAMPLE else None
+
+    def start(self) -> None:
+        self.resume()
+        if self._sampler:
+            self._sampler.start()
+
+    def resume(self) -> None:
+        if self._cprofile:
+            self._cprofile.enable()
+
+    def pause(self) -> None:
+        if self._cprofile:
+            self._cprofile.disable()
+
+    def finish(self) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        self.pause()
+        if self._sampler:
+            self._sampler.stop()
+        try:
+            meta = {
+                'id': self.id,
+                'mode': self.mode,
+                'method': self.method,
+                'path': self.path,
+                'query': self.query,
+                'status': self.status,
+                'duration_ms': round((time.perf_counter() - self.started) * 1000, 2),
+                'created': datetime.now().isoformat(),
+                'pid': os.getpid()
+            }
+            if self._sampler:
+                meta['samples'] = self._sampler.samples
+                self.profiler.store.save(meta, lambda path: _write_text(path, self._sampler.collapsed()))
+            else:
+                self.profiler.store.save(meta, self._cprofile.dump_stats)
+            log.info("Profiled %s %s (%s) as %s", self.method, self.path, self.mode, self.id)
+        except Exception as e:
+            log.error("Could not save profile %s: %s", self.id, e)
+        finally:
+            self.profiler.limiter.release()
+
+
+def _write_text(path: str, text: str) -> None:
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+class RequestProfiler:
+    """WSGI middleware that profiles requests asking for it
+
+    A request opts in with ``X-Profile: cprofile|sample`` or
+    ``?_profile=cprofile|sample`` (and ``X-Profile-Token`` when a ``token`` is
+    configured). The request and its response body run under the profiler;
+    the response carries ``X-Profile-Id``, or ``X-Profile: rate-limited``
+    when the limiter said no, in which case the request runs normally. Every
+    other request pays only a header lookup.
+    """
+
+    def __init__(self, wsgi_app, store: ProfileStore, limiter: RateLimiter, token: Optional[str] = None,
+                 sample_interval: float = 0.005):
+        self.wsgi_app = wsgi_app
+        self.store = store
+        self.limiter = limiter
+        self.token = token
+        self.sample_interval = sample_interval
+
+    def requested_mode(self, environ: Dict) -> Optional[str]:
+        mode = environ.get('HTTP_X_PROFILE')
+        if mode is None and PROFILE_QUERY in environ.get('QUERY_STRING', ''):
+            for pair in environ['QUERY_STRING'].split('&'):
+                key, _, value = pair.partition('=')
+                if key == PROFILE_QUERY:
+                    mode = value or CPROFILE
+        if mode is None:
+            return None
+        mode = mode.strip().lower()
+        return mode if mode in MODES else None
+
+    def authorized(self, environ: Dict) -> bool:
+        return not self.token or environ.get('HTTP_X_PROFILE_TOKEN') == self.token
+
+    def __call__(self, environ: Dict, start_response: Callable):
+        mode = self.requested_mode(environ)
+        if mode is None or not self.authorized(environ):
+            return self.wsgi_app(environ, start_response)
+        if not self.limiter.try_acquire():
+            def limited_start_response(status, headers, exc_info=None):
+                return start_response(status, headers + [(PROFILE_HEADER, 'rate-limited')], exc_info)
+            return self.wsgi_app(environ, limited_start_response)
+
+        session = _Session(self, mode, environ)
+        try:
+            session.start()
+        except Exception as e:
+            # e.g. another profiler already active in this interpreter
+            log.warning("Could not start %s profile: %s", mode, e)
+            self.limiter.release()
+            return self.wsgi_app(environ, start_response)
+
+        def profiled_start_response(status, headers, exc_info=None):
+            session.status = int(status.split(' ', 1)[0])
+            return start_response(status, headers + [('X-Profile-Id', session.id)], exc_info)
+
+        try:
+            try:
+                body = self.wsgi_app(environ, profiled_start_response)
+            finally:
+                session.pause()
+        except BaseException:
+            session.finish()
+            raise
+        return _ProfiledBody(body, session)
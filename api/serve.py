@@ -0,0 +1,112 @@
+"""
+Production Server
+Runs the API under gunicorn with multiple worker processes
+"""
+
+import argparse
+import os
+import sys
+
+# Services are configured when app.py is imported, so pick the config first
+os.environ.setdefault('APP_ENV', 'production')
+
+from gunicorn.app.base import BaseApplication
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from config import get_config
+from log import get_logger
+
+log = get_logger('serve')
+
+
+def post_worker_init(worker):
+    """Join the leader election as soon as a worker is up, not on its first request"""
+    import app as app_module
+    app_module.start_worker()
+
+
+class APIServer(BaseApplication):
+    """gunicorn application serving ``app.create_app()``
+
+    With ``preload`` the app (pandas, numpy, the metric rings) is imported
+    once in the master and shared copy-on-write by every worker, and each
+    worker finishes its own startup after the fork. ``threads`` > 1 uses the
+    gthread worker so one worker serves several requests at once; data work
+    releases the GIL in pandas/numpy and file I/O.
+
+    With ``asgi`` the workers are uvicorn workers running ``asgi.py``: one
+    event loop per process serves the cheap and streaming routes, and the
+    other routes run on that module's per-class thread pools.
+
+    Signals go to the master: HUP starts fresh workers and retires the old
+    ones gracefully (in-flight requests get ``graceful_timeout`` seconds);
+    with ``preload`` code changes need USR2 (start a new master) followed by
+    TERM to the old master. TTIN/TTOU add or remove a worker.
+    """
+
+    def __init__(self, options: dict, asgi: bool = False):
+        self.options = options
+        self.asgi = asgi
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        if self.asgi:
+            import asgi
+            return asgi.create_asgi_app(os.environ['APP_ENV'])
+        import app as app_module
+        return app_module.create_app(os.environ['APP_ENV'])
+
+
+def build_options(args: argparse.Namespace) -> dict:
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'uvicorn.workers.UvicornWorker' if args.asgi else ('gthread' if args.threads > 1 else 'sync'),
+        'preload_app': args.preload,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10 if args.max_requests else 0,
+        'reload': args.reload,
+        'post_worker_init': post_worker_init,
+        'accesslog': '-' if args.access_log else None,
+    }
+
+
+def main():
+    settings = get_config()
+    parser = argparse.ArgumentParser(description='Serve the automation API with gunicorn')
+    parser.add_argument('--bind', default=settings.SERVER_BIND, help='host:port or unix:/path')
+    parser.add_argument('--workers', type=int, default=settings.SERVER_WORKERS, help='Worker processes')
+    parser.add_argument('--threads', type=int, default=settings.SERVER_THREADS, help='Threads per worker')
+    parser.add_argument('--preload', action=argparse.BooleanOptionalAction, default=settings.SERVER_PRELOAD,
+                        help='Import the app once in the master before forking workers')
+    parser.add_argument('--timeout', type=int, default=settings.SERVER_TIMEOUT,
+                        help='Restart a worker silent for this many seconds')
+    parser.add_argument('--graceful-timeout', type=int, default=settings.SERVER_GRACEFUL_TIMEOUT,
+                        help='Seconds workers get to finish requests on reload or shutdown')
+    parser.add_argument('--max-requests', type=int, default=settings.SERVER_MAX_REQUESTS,
+                        help='Recycle a worker after this many requests (0 = never)')
+    parser.add_argument('--asgi', action='store_true',
+                        help='Serve asgi.py with uvicorn workers (async routes, per-class thread pools)')
+    parser.add_argument('--reload', action='store_true', help='Restart workers when code changes (development)')
+    parser.add_argument('--access-log', action='store_true', help='Log requests to stdout')
+    args = parser.parse_args()
+    if args.reload and args.preload:
+        # Code reloading re-imports the app in the workers, which preloading prevents
+        args.preload = False
+
+    mode = 'asgi' if args.asgi else f"{args.threads} threads"
+    log.info("Serving API on %s (%s workers x %s, config=%s)", args.bind, args.workers, mode, os.environ['APP_ENV'])
+    APIServer(build_options(args), asgi=args.asgi).run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,454 @@
+"""
+Streaming Uploads
+Writes request bodies straight to disk while hashing and parsing them
+"""
+
+import fcntl
+import io
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+import pandas as pd
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+from data_processor import DEFAULT_CHUNKSIZE, StreamingCleaner
+from log import get_logger
+from result_cache import content_hasher
+
+log = get_logger('uploads')
+
+STREAM_BLOCK_BYTES = 1024 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+PARSEABLE_SUFFIXES = ('.csv', '.jsonl', '.ndjson')
+PARTIAL_DIR = '.partial'
+
+
+class UploadError(Exception):
+    """Invalid upload request; ``status`` is the HTTP status to answer with"""
+    status = 400
+
+
+class UploadTooLarge(UploadError):
+    status = 413
+
+
+class UploadConflict(UploadError):
+    """A chunk didn't start at the session's current offset"""
+    status = 409
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadNotFound(UploadError):
+    status = 404
+
+
+def safe_filename(name: Optional[str]) -> str:
+    filename = secure_filename(name or '')
+    if not filename:
+        raise UploadError('A file name is required')
+    return filename
+
+
+class _HashingFile:
+    """File sink that hashes what it writes and enforces a size limit"""
+
+    def __init__(self, path: Path, max_bytes: Optional[int], mode: str = 'wb', hasher=None, size: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hasher = hasher or content_hasher()
+        self.size = size
+        self._file = open(path, mode)
+
+    def write(self, data: bytes) -> None:
+        if self.max_bytes is not None and self.size + len(data) > self.max_bytes:
+            raise UploadTooLarge(f'Upload exceeds the {self.max_bytes} byte limit')
+        self._file.write(data)
+        self.hasher.update(data)
+        self.size += len(data)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _PipeReader(io.RawIOBase):
+    """Readable end of an in-process pipe fed with byte blocks (None ends it)"""
+
+    def __init__(self, max_blocks: int = 8):
+        self.blocks: 'queue.Queue[Optional[bytes]]' = queue.Queue(max_blocks)
+        self._current = memoryview(b'')
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._current:
+            if self._eof:
+                return 0
+            block = self.blocks.get()
+            if block is None:
+                self._eof = True
+                return 0
+            self._current = memoryview(block)
+        n = min(len(buffer), len(self._current))
+        buffer[:n] = self._current[:n]
+        self._current = self._current[n:]
+        return n
+
+
+class StreamingParser:
+    """Cleans and analyzes a CSV/JSON Lines upload on a thread while it arrives
+
+    Blocks are handed over through a bounded queue, so a slow parser slows
+    the upload instead of buffering it. If parsing fails the upload carries
+    on and ``finish`` returns None.
+    """
+
+    def __init__(self, filename: str, chunksize: int = DEFAULT_CHUNKSIZE):
+        self.filename = filename
+        self.chunksize = chunksize
+        self.cleaner = StreamingCleaner()
+        self.error: Optional[str] = None
+        self._pipe = _PipeReader()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='upload-parse', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def supports(filename: str) -> bool:
+        return filename.lower().endswith(PARSEABLE_SUFFIXES)
+
+    def _run(self) -> None:
+        try:
+            stream = io.BufferedReader(self._pipe, STREAM_BLOCK_BYTES)
+            if self.filename.lower().endswith('.csv'):
+                reader = pd.read_csv(stream, chunksize=self.chunksize)
+            else:
+                reader = pd.read_json(stream, lines=True, chunksize=self.chunksize)
+            with reader:
+                for chunk in reader:
+                    self.cleaner.update(chunk)
+        except Exception as e:
+            self.error = str(e)
+            log.error("Streaming parse of %s failed: %s", self.filename, self.error)
+        finally:
+            self._done.set()
+
+    def feed(self, block: Optional[bytes]) -> None:
+        while not self._done.is_set():
+            try:
+                self._pipe.blocks.put(block, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self) -> Optional[Dict]:
+        """End of input; the statistics, or None if parsing failed"""
+        self.feed(None)
+        self._thread.join()
+        return None if self.error else self.cleaner.stats.summary()
+
+    def abort(self) -> None:
+        self.error = self.error or 'aborted'
+        self.feed(None)
+
+
+def parse_content_range(header: Optional[str]) -> Optional[int]:
+    """Start offset from a ``Content-Range: bytes start-end/total`` header"""
+    if not header:
+        return None
+    unit, _, spec = header.strip().partition(' ')
+    start = spec.split('-', 1)[0]
+    if unit != 'bytes' or not start.isdigit():
+        raise UploadError(f'Invalid Content-Range: {header}')
+    return int(start)
+
+
+def _read_blocks(stream: BinaryIO, limit: Optional[int] = None):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        block = stream.read(STREAM_BLOCK_BYTES if remaining is None else min(STREAM_BLOCK_BYTES, remaining))
+        if not block:
+            return
+        if remaining is not None:
+            remaining -= len(block)
+        yield block
+
+
+def receive_upload(stream: BinaryIO, content_type: str, upload_dir: Path, max_bytes: Optional[int] = None,
+                   filename: Optional[str] = None, parse_chunksize: Optional[int] = DEFAULT_CHUNKSIZE) -> Dict:
+    """Stream one uploaded file to ``upload_dir`` in a single pass
+
+    ``multipart/form-data`` bodies are decoded incrementally. The first
+    file part is the upload, and small form fields are returned in
+    ``fields``. Any other body is the file itself, named by ``filename``.
+    Each block is written to a temporary file, hashed, and handed to a
+    ``StreamingParser`` (CSV/JSON Lines, unless ``parse_chunksize`` is
+    None) before the next block is read. The finished file is renamed into
+    place, so readers never see a partial upload.
+    """
+    partial_dir = upload_dir / PARTIAL_DIR
+    partial_dir.mkdir(parents=True, exist_ok=True)
+    temp_path = partial_dir / f"{uuid.uuid4().hex}.upload"
+    sink = None
+    parser = None
+    fields = {}
+
+    def open_sink(name: str) -> None:
+        nonlocal sink, parser, filename
+        filename = safe_filename(name)
+        sink = _HashingFile(temp_path, max_bytes)
+        if parse_chunksize and StreamingParser.supports(filename):
+            parser = StreamingParser(filename, parse_chunksize)
+
+    def write(block: bytes) -> None:
+        sink.write(block)
+        if parser:
+            parser.feed(block)
+
+    try:
+        mimetype, options = parse_options_header(content_type or '')
+        if mimetype == 'multipart/form-data':
+            boundary = options.get('boundary')
+            if not boundary:
+                raise UploadError('Missing multipart boundary')
+            decoder = MultipartDecoder(boundary.encode('latin-1'))
+            part = None
+            field_data = []
+            for block in _read_blocks(stream):
+                decoder.receive_data(block)
+                event = decoder.next_event()
+                while not isinstance(event, (NeedData, Epilogue)):
+                    if isinstance(event, File) and sink is None:
+                        part = 'file'
+                        open_sink(event.filename)
+                    elif isinstance(event, (Field, File)):
+                        part, field_data = event.name, []
+                    elif isinstance(event, Data):
+                        if part == 'file':
+                            write(event.data)
+                        else:
+                            field_data.append(event.data)
+                            if sum(len(d) for d in field_data) > MAX_FIELD_BYTES:
+                                raise UploadTooLarge(f"Form field '{part}' is too large")
+                        if not event.more_data:
+                            if part != 'file':
+                                fields[part] = b''.join(field_data).decode('utf-8', 'replace')
+                            part = None
+                    event = decoder.next_event()
+            if sink is None:
+                raise UploadError('No file provided')
+        else:
+            open_sink(filename)
+            for block in _read_blocks(stream):
+                write(block)
+
+        sink.close()
+        statistics = parser.finish() if parser else None
+        final_path = upload_dir / filename
+        os.replace(temp_path, final_path)
+        return {
+            'filename': filename,
+            'path': str(final_path),
+            'size_bytes': sink.size,
+            'content_hash': sink.hasher.hexdigest(),
+            'fields': fields,
+            'statistics': statistics,
+            'parse_error': parser.error if parser else None
+        }
+    except BaseException:
+        if parser:
+            parser.abort()
+        if sink:
+            sink.close()
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+class UploadSessions:
+    """Resumable, chunked uploads for files beyond a single request's size limit
+
+    A session is a ``.part`` file plus a small JSON record under
+    ``<upload_dir>/.partial``. Chunks must be appended in order. The file's
+    length on disk is the session offset, so after a dropped connection or
+    a server restart a client asks for the offset and resends from there.
+    The running content hash is kept in memory with the offset it covers.
+    If that doesn't match the file (after a restart, or when another worker
+    process took the previous chunk), it is rebuilt from the bytes on disk.
+    Appends, completion and aborts hold an ``flock`` on the session record,
+    so worker processes never interleave writes to one ``.part`` file.
+    """
+
+    def __init__(self, upload_dir: Path, max_bytes: Optional[int] = None, ttl_seconds: float = 24 * 3600):
+        self.upload_dir = Path(upload_dir)
+        self.partial_dir = self.upload_dir / PARTIAL_DIR
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._hashers: Dict[str, tuple] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, upload_id: str):
+        if not upload_id or not upload_id.isalnum():
+            raise UploadNotFound('Unknown upload')
+        return self.partial_dir / f"{upload_id}.json", self.partial_dir / f"{upload_id}.part"
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    @contextmanager
+    def _locked(self, upload_id: str):
+        """Hold the session's thread lock and an exclusive flock on its record"""
+        meta_path, _ = self._paths(upload_id)
+        with self._session_lock(upload_id):
+            try:
+                fd = os.open(meta_path, os.O_RDONLY)
+            except FileNotFoundError:
+                raise UploadNotFound('Unknown upload')
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                # Closing the descriptor releases the flock
+                os.close(fd)
+
+    def _load(self, upload_id: str) -> Dict:
+        meta_path, part_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                session = json.load(f)
+        except FileNotFoundError:
+            raise UploadNotFound('Unknown upload')
+        session['offset'] = part_path.stat().st_size if part_path.exists() else 0
+        return session
+
+    def create(self, filename: str, size: Optional[int] = None) -> Dict:
+        self.sweep()
+        if size is not None and (not isinstance(size, int) or size < 0):
+            raise UploadError("'size' must be a non-negative integer")
+        if size is not None and self.max_bytes is not None and size > self.max_bytes:
+            raise UploadTooLarge(f'Upload exceeds the {self.max_bytes} byte limit')
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        session = {
+            'upload_id': upload_id,
+            'filename': safe_filename(filename),
+            'size': size,
+            'created_at': datetime.now().isoformat()
+        }
+        meta_path, part_path = self._paths(upload_id)
+        part_path.touch()
+        with open(meta_path, 'w') as f:
+            json.dump(session, f)
+        self._hashers[upload_id] = (content_hasher(), 0)
+        session['offset'] = 0
+        return session
+
+    def status(self, upload_id: str) -> Dict:
+        return self._load(upload_id)
+
+    def append(self, upload_id: str, stream: BinaryIO, offset: Optional[int] = None,
+               length: Optional[int] = None) -> Dict:
+        """Append the request body at ``offset`` (default: the current end)"""
+        with self._locked(upload_id):
+            session = self._load(upload_id)
+            current = session['offset']
+            if offset is not None and offset != current:
+                raise UploadConflict(f'Expected offset {current}, got {offset}', current)
+            limit = self.max_bytes if session['size'] is None else session['size']
+            sink = _HashingFile(self._paths(upload_id)[1], limit, mode='ab',
+                                hasher=self._hasher(upload_id, current), size=current)
+            try:
+                for block in _read_blocks(stream, length):
+                    sink.write(block)
+            finally:
+                sink.close()
+                self._hashers[upload_id] = (sink.hasher, sink.size)
+                os.utime(self._paths(upload_id)[0])
+            session['offset'] = sink.size
+            return session
+
+    def _hasher(self, upload_id: str, offset: int):
+        hasher, hashed = self._hashers.get(upload_id, (None, None))
+        if hashed != offset:
+            hasher = content_hasher()
+            with open(self._paths(upload_id)[1], 'rb') as f:
+                for block in _read_blocks(f, offset):
+                    hasher.update(block)
+            self._hashers[upload_id] = (hasher, offset)
+        return hasher
+
+    def complete(self, upload_id: str, checksum: Optional[str] = None) -> Dict:
+        """Verify the upload and move it into ``upload_dir``"""
+        with self._locked(upload_id):
+            session = self._load(upload_id)
+            meta_path, part_path = self._paths(upload_id)
+            if session['size'] is not None and session['offset'] != session['size']:
+                raise UploadConflict(f"Upload incomplete: {session['offset']} of {session['size']} bytes",
+                                     session['offset'])
+            digest = self._hasher(upload_id, session['offset']).hexdigest()
+            if checksum and checksum.lower() != digest:
+                raise UploadError(f'Checksum mismatch: received data hashes to {digest}')
+            final_path = self.upload_dir / session['filename']
+            os.replace(part_path, final_path)
+            meta_path.unlink(missing_ok=True)
+            self._forget(upload_id)
+        return {
+            'upload_id': upload_id,
+            'filename': session['filename'],
+            'path': str(final_path),
+            'size_bytes': session['offset'],
+            'content_hash': digest
+        }
+
+    def abort(self, upload_id: str) -> None:
+        with self._locked(upload_id):
+            meta_path, part_path = self._paths(upload_id)
+            if not meta_path.exists():
+                raise UploadNotFound('Unknown upload')
+            part_path.unlink(missing_ok=True)
+            meta_path.unlink(missing_ok=True)
+            self._forget(upload_id)
+
+    def _forget(self, upload_id: str) -> None:
+        self._hashers.pop(upload_id, None)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+
+    def sweep(self) -> int:
+        """Delete sessions idle for longer than ``ttl_seconds``; returns how many
+
+        Temporary files left by interrupted single-request uploads go too.
+        """
+        if not self.partial_dir.exists():
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        expired = 0
+        for meta_path in self.partial_dir.glob('*.json'):
+            try:
+                if meta_path.stat().st_mtime < cutoff:
+                    self.abort(meta_path.stem)
+                    expired += 1
+            except (OSError, UploadNotFound):
+                continue
+        for temp_path in self.partial_dir.glob('*.upload'):
+            try:
+                if temp_path.stat().st_mtime < cutoff:
+                    temp_path.unlink()
+            except OSError:
+                continue
+        return expired
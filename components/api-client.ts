@@ -26,6 +26,18 @@ export interface SystemHealth {
   }
 }
 
+export interface MetricHistory {
+  metric: string
+  from: number
+  to: number
+  step: number
+  resolution: number
+  timestamps: number[]
+  min: number[]
+  avg: number[]
+  max: number[]
+}
+
 export interface DashboardSummary {
   total_tasks: number
   successful_tasks: number
@@ -37,6 +49,24 @@ export interface DashboardSummary {
   timestamp: string
 }
 
+type MetricsSnapshot = SystemHealth & Record<string, unknown>
+
+function applyDelta(target: Record<string, any>, delta: Record<string, any>): Record<string, any> {
+  const result: Record<string, any> = { ...target }
+  for (const key of delta["$removed"] ?? []) {
+    delete result[key]
+  }
+  for (const [key, value] of Object.entries(delta)) {
+    if (key === "$removed") continue
+    if (value !== null && typeof value === "object" && !Array.isArray(value) && typeof result[key] === "object" && result[key] !== null) {
+      result[key] = applyDelta(result[key], value)
+    } else {
+      result[key] = value
+    }
+  }
+  return result
+}
+
 class APIClient {
   private baseURL: string
 
@@ -98,14 +128,51 @@ class APIClient {
     return this.request("/api/system/network")
   }
 
-  async getProcesses(topN = 5) {
-    return this.request(`/api/system/processes?top_n=${topN}`)
+  async getProcesses(topN = 5, sort: "memory" | "cpu" = "memory") {
+    return this.request(`/api/system/processes?top_n=${topN}&sort=${sort}`)
+  }
+
+  async getSystemHistory(metric = "cpu_percent", from?: number, to?: number, step?: number): Promise<MetricHistory> {
+    const params = new URLSearchParams({ metric })
+    if (from !== undefined) params.set("from", String(from))
+    if (to !== undefined) params.set("to", String(to))
+    if (step !== undefined) params.set("step", String(step))
+    return this.request(`/api/system/history?${params.toString()}`)
+  }
+
+  /**
+   * Subscribe to live metrics pushed over Server-Sent Events.
+   * Deltas are merged into the last full snapshot before calling onUpdate.
+   * Returns a function that closes the stream.
+   */
+  subscribeMetrics(onUpdate: (snapshot: MetricsSnapshot) => void, onError?: (error: Event) => void): () => void {
+    const source = new EventSource(`${this.baseURL}/api/stream/metrics`)
+    let current: MetricsSnapshot | null = null
+
+    source.addEventListener("snapshot", (event) => {
+      current = JSON.parse((event as MessageEvent).data) as MetricsSnapshot
+      onUpdate(current)
+    })
+
+    source.addEventListener("delta", (event) => {
+      if (current === null) return
+      current = applyDelta(current, JSON.parse((event as MessageEvent).data)) as MetricsSnapshot
+      onUpdate(current)
+    })
+
+    source.onerror = (error) => {
+      console.error("[v0] Metrics stream error:", error)
+      onError?.(error)
+    }
+
+    return () => source.close()
   }
 
   // Data Processing
-  async uploadData(file: File) {
+  async uploadData(file: File, optimize?: boolean) {
     const formData = new FormData()
     formData.append("file", file)
+    if (optimize !== undefined) formData.append("optimize", String(optimize))
 
     return this.request("/api/data/upload", {
       method: "POST",
@@ -114,41 +181,206 @@ class APIClient {
     })
   }
 
-  async analyzeFile(filename: string) {
-    return this.request(`/api/data/analyze/${filename}`)
+  async createUploadSession(filename: string, size?: number) {
+    return this.request<{ upload_id: string; offset: number }>("/api/data/uploads", {
+      method: "POST",
+      body: JSON.stringify({ filename, size }),
+    })
   }
 
-  async processData(filepath: string, outputPath: string) {
+  async getUploadSession(uploadId: string) {
+    return this.request<{ upload_id: string; offset: number }>(`/api/data/uploads/${uploadId}`)
+  }
+
+  async uploadChunk(uploadId: string, chunk: Blob, offset: number, total: number) {
+    return this.request<{ upload_id: string; offset: number }>(`/api/data/uploads/${uploadId}`, {
+      method: "PUT",
+      body: chunk,
+      headers: {
+        "Content-Type": "application/octet-stream",
+        "Content-Range": `bytes ${offset}-${offset + chunk.size - 1}/${total}`,
+      },
+    })
+  }
+
+  async completeUpload(
+    uploadId: string,
+    options: { checksum?: string; analyze?: boolean; optimize?: boolean; async?: boolean } = {},
+  ) {
+    return this.request(`/api/data/uploads/${uploadId}/complete`, {
+      method: "POST",
+      body: JSON.stringify(options),
+    })
+  }
+
+  async abortUpload(uploadId: string) {
+    return this.request(`/api/data/uploads/${uploadId}`, { method: "DELETE" })
+  }
+
+  // Sends a file in chunks, resuming from the server's offset after a failed chunk
+  async uploadResumable(
+    file: File,
+    chunkSize = 8 * 1024 * 1024,
+    onProgress?: (sent: number, total: number) => void,
+    maxRetries = 3,
+  ) {
+    const session = await this.createUploadSession(file.name, file.size)
+    let offset = session.offset
+    let failures = 0
+    while (offset < file.size) {
+      try {
+        const chunk = file.slice(offset, offset + chunkSize)
+        offset = (await this.uploadChunk(session.upload_id, chunk, offset, file.size)).offset
+        failures = 0
+      } catch (error) {
+        if (++failures > maxRetries) throw error
+        offset = (await this.getUploadSession(session.upload_id)).offset
+      }
+      onProgress?.(offset, file.size)
+    }
+    return this.completeUpload(session.upload_id)
+  }
+
+  async analyzeFile(filename: string, options: { chunksize?: number; optimize?: boolean } = {}) {
+    const params = new URLSearchParams()
+    if (options.chunksize) params.set("chunksize", String(options.chunksize))
+    if (options.optimize !== undefined) params.set("optimize", String(options.optimize))
+    const query = params.toString()
+    return this.request(`/api/data/analyze/${filename}${query ? `?${query}` : ""}`)
+  }
+
+  async processData(
+    filepath: string,
+    outputPath: string,
+    options: {
+      columns?: string[]
+      filters?: [string, string, unknown][]
+      chunksize?: number
+      optimize?: boolean
+      pipeline?: Record<string, unknown>[]
+      explain?: boolean
+      dedupe_subset?: string[]
+    } = {},
+  ) {
     return this.request("/api/data/process", {
       method: "POST",
-      body: JSON.stringify({ filepath, output_path: outputPath }),
+      body: JSON.stringify({ filepath, output_path: outputPath, ...options }),
+    })
+  }
+
+  async processBatch(directory: string, pattern = "*.csv", workers?: number, manifestPath?: string, runAsync = true) {
+    return this.request("/api/data/batch", {
+      method: "POST",
+      body: JSON.stringify({ directory, pattern, workers, manifest_path: manifestPath, async: runAsync }),
+    })
+  }
+
+  async dedupeFiles(
+    files: string[],
+    options: {
+      subset?: string[]
+      output_dir?: string
+      chunksize?: number
+      dry_run?: boolean
+      error_rate?: number
+      async?: boolean
+    } = {},
+  ) {
+    return this.request("/api/data/dedupe", {
+      method: "POST",
+      body: JSON.stringify({ files, ...options }),
+    })
+  }
+
+  async getCacheStats() {
+    return this.request("/api/cache/stats")
+  }
+
+  async clearCache() {
+    return this.request("/api/cache/clear", {
+      method: "POST",
     })
   }
 
   // File Management
-  async listFiles(directory = ".", recursive = false) {
-    return this.request(`/api/files/list?directory=${directory}&recursive=${recursive}`)
+  async listFiles(
+    directory = ".",
+    recursive = false,
+    options: {
+      sort?: "path" | "name" | "size" | "modified"
+      order?: "asc" | "desc"
+      limit?: number
+      cursor?: string
+      ext?: string[]
+      minSize?: number
+      maxSize?: number
+    } = {},
+  ) {
+    const params = new URLSearchParams({ directory, recursive: String(recursive) })
+    if (options.sort) params.set("sort", options.sort)
+    if (options.order) params.set("order", options.order)
+    if (options.limit !== undefined) params.set("limit", String(options.limit))
+    if (options.cursor) params.set("cursor", options.cursor)
+    if (options.ext?.length) params.set("ext", options.ext.join(","))
+    if (options.minSize !== undefined) params.set("min_size", String(options.minSize))
+    if (options.maxSize !== undefined) params.set("max_size", String(options.maxSize))
+    return this.request(`/api/files/list?${params}`)
   }
 
   async getDirectorySize(directory = ".") {
     return this.request(`/api/files/size?directory=${directory}`)
   }
 
-  async cleanupFiles(directory: string, days: number, extensions?: string[]) {
+  async getFileIndex() {
+    return this.request("/api/files/index")
+  }
+
+  async watchDirectory(directory: string) {
+    return this.request("/api/files/index/watch", {
+      method: "POST",
+      body: JSON.stringify({ directory }),
+    })
+  }
+
+  async cleanupFiles(
+    directory: string,
+    days: number,
+    extensions?: string[],
+    options: { dryRun?: boolean; maxFilesPerSecond?: number; async?: boolean } = {},
+  ) {
     return this.request("/api/files/cleanup", {
       method: "POST",
       body: JSON.stringify({
         directory,
         days,
         extensions,
+        dry_run: options.dryRun,
+        max_files_per_second: options.maxFilesPerSecond,
+        async: options.async,
       }),
     })
   }
 
-  async organizeFiles(directory: string) {
+  async organizeFiles(
+    directory: string,
+    options: {
+      collisions?: "rename" | "skip" | "overwrite" | "error"
+      dryRun?: boolean
+      resume?: boolean
+      undo?: boolean
+      async?: boolean
+    } = {},
+  ) {
     return this.request("/api/files/organize", {
       method: "POST",
-      body: JSON.stringify({ directory }),
+      body: JSON.stringify({
+        directory,
+        collisions: options.collisions,
+        dry_run: options.dryRun,
+        resume: options.resume,
+        undo: options.undo,
+        async: options.async,
+      }),
     })
   }
 
@@ -159,17 +391,71 @@ class APIClient {
     })
   }
 
+  // Background Jobs
+  async getJobs(status?: string, type?: string, limit = 50) {
+    const params = new URLSearchParams({ limit: String(limit) })
+    if (status) params.set("status", status)
+    if (type) params.set("type", type)
+    return this.request(`/api/jobs?${params.toString()}`)
+  }
+
+  async getJob(jobId: string) {
+    return this.request(`/api/jobs/${jobId}`)
+  }
+
+  async cancelJob(jobId: string) {
+    return this.request(`/api/jobs/${jobId}/cancel`, {
+      method: "POST",
+    })
+  }
+
   // History
-  async getHistory(limit = 50) {
-    return this.request(`/api/history?limit=${limit}`)
+  async getHistory(
+    limit = 50,
+    filters: { task?: string; status?: string; since?: string | number; until?: string | number; before?: number } = {},
+  ) {
+    const params = new URLSearchParams({ limit: limit.toString() })
+    for (const [key, value] of Object.entries(filters)) {
+      if (value !== undefined) params.append(key, value.toString())
+    }
+    return this.request(`/api/history?${params.toString()}`)
+  }
+
+  async getHistorySummary() {
+    return this.request("/api/history/summary")
   }
 
-  async clearHistory() {
+  async clearHistory(filters: { task?: string; status?: string; before?: string | number } = {}) {
     return this.request("/api/history/clear", {
       method: "POST",
+      body: JSON.stringify(filters),
     })
   }
 
+  async pruneHistory() {
+    return this.request("/api/history/prune", {
+      method: "POST",
+    })
+  }
+
+  // Profiling
+  async listProfiles(limit = 100, token?: string) {
+    return this.request(`/api/admin/profiles?limit=${limit}`, {
+      headers: token ? { "X-Profile-Token": token } : {},
+    })
+  }
+
+  async deleteProfile(profileId: string, token?: string) {
+    return this.request(`/api/admin/profiles/${profileId}`, {
+      method: "DELETE",
+      headers: token ? { "X-Profile-Token": token } : {},
+    })
+  }
+
+  profileDownloadURL(profileId: string) {
+    return `${this.baseURL}/api/admin/profiles/${profileId}`
+  }
+
   // Dashboard
   async getDashboardSummary(): Promise<DashboardSummary> {
     return this.request("/api/dashboard/summary")
@@ -7,106 +7,774 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Optional, Tuple
+import argparse
 import json
+import multiprocessing
+import os
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from deduplicator import DEFAULT_ERROR_RATE, Deduplicator, DigestSet, row_digests
+from log import get_logger
+from streaming_stats import StatsAccumulator
+from telemetry import timed
+
+log = get_logger('data_processor')
+
+DEFAULT_CHUNKSIZE = 100_000
+
+# Columnar formats and the pyarrow.dataset format name for each extension
+COLUMNAR_FORMATS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'ipc',
+    '.feather': 'ipc',
+    '.ipc': 'ipc',
+}
+TEXT_FORMATS = ('.csv', '.json', '.jsonl', '.ndjson')
+FILTER_OPS = ('==', '=', '!=', '<', '<=', '>', '>=', 'in', 'not in')
+OUTPUT_SUFFIXES = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+
+def _columnar_format(path: str) -> Optional[str]:
+    return COLUMNAR_FORMATS.get(os.path.splitext(path)[1].lower())
+
+
+def is_supported_format(path: str) -> bool:
+    """Whether DataProcessor can read/write ``path`` based on its extension"""
+    return _columnar_format(path) is not None or path.lower().endswith(TEXT_FORMATS)
+
+
+def validate_filters(filters: Optional[List]) -> Optional[List[Tuple]]:
+    """Normalize ``[[column, op, value], ...]`` filters (AND-ed together)"""
+    if not filters:
+        return None
+    normalized = []
+    for item in filters:
+        if not isinstance(item, (list, tuple)) or len(item) != 3:
+            raise ValueError(f"Filter must be [column, op, value], got {item!r}")
+        column, op, value = item
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unknown filter operator '{op}'. Use one of: {', '.join(FILTER_OPS)}")
+        if op in ('in', 'not in') and not isinstance(value, (list, tuple, set)):
+            raise ValueError(f"Filter operator '{op}' needs a list of values")
+        normalized.append((column, '==' if op == '=' else op, value))
+    return normalized
+
+
+def read_schema(path: str) -> Optional[List[str]]:
+    """Column names of ``path`` without reading its rows (None if unknown)
+
+    Parquet and Arrow files answer from their footer/schema; CSV and JSON
+    Lines from the first line. A plain ``.json`` document would have to be
+    parsed in full, so its schema is left unknown.
+    """
+    file_format = _columnar_format(path)
+    if file_format:
+        return list(ds.dataset(path, format=file_format).schema.names)
+    if path.endswith('.csv'):
+        return list(pd.read_csv(path, nrows=0).columns)
+    if path.endswith(('.jsonl', '.ndjson')):
+        return [str(c) for c in pd.read_json(path, lines=True, nrows=1).columns]
+    return None
+
+
+def validate_dedupe_subset(subset, columns: Optional[List[str]] = None) -> Optional[List[str]]:
+    """Normalize a dedupe key (a column name or a list of them), checking it against ``columns`` when known"""
+    if subset is None or subset == []:
+        return None
+    if isinstance(subset, str):
+        subset = [subset]
+    if not isinstance(subset, (list, tuple)) or not all(isinstance(column, str) for column in subset):
+        raise ValueError("Dedupe subset must be a column name or a list of column names")
+    if columns is not None:
+        unknown = [column for column in subset if column not in columns]
+        if unknown:
+            raise ValueError(f"Unknown column(s) {unknown} in dedupe subset")
+    return list(subset)
+
+
+def _filter_expression(filters: List[Tuple]):
+    """pyarrow expression for pushdown into Parquet/Arrow scans"""
+    return pq.filters_to_expression([tuple(f) for f in filters])
+
+
+def _filter_frame(frame: pd.DataFrame, filters: Optional[List[Tuple]]) -> pd.DataFrame:
+    """Apply the same filters to a frame read from a text format"""
+    if not filters:
+        return frame
+    mask = np.ones(len(frame), dtype=bool)
+    for column, op, value in filters:
+        series = frame[column]
+        if op == '==':
+            mask &= (series == value).to_numpy()
+        elif op == '!=':
+            mask &= (series != value).to_numpy()
+        elif op == '<':
+            mask &= (series < value).to_numpy()
+        elif op == '<=':
+            mask &= (series <= value).to_numpy()
+        elif op == '>':
+            mask &= (series > value).to_numpy()
+        elif op == '>=':
+            mask &= (series >= value).to_numpy()
+        elif op == 'in':
+            mask &= series.isin(list(value)).to_numpy()
+        else:
+            mask &= (~series.isin(list(value))).to_numpy()
+    return frame[mask]
+
+
+def optimize_dtypes(frame: pd.DataFrame, category_threshold: float = 0.5) -> Tuple[pd.DataFrame, dict]:
+    """Shrink ``frame`` to the smallest dtypes that keep every value intact
+    
+    - string columns with few distinct values (at most ``category_threshold``
+      of the rows) become ``category``; other string columns become
+      Arrow-backed ``string[pyarrow]``
+    - integers are downcast to the narrowest signed width that fits
+    - floats holding only whole numbers (typically ints with NaNs) become
+      nullable integers; other floats become float32 only if that round-trips
+      exactly
+    
+    Mixed-type object columns are left alone. Returns the new frame and a
+    report of dtype and bytes per column before and after.
+    """
+    columns = {}
+    optimized = {}
+    rows = len(frame)
+    for col in frame.columns:
+        series = frame[col]
+        before = int(series.memory_usage(index=False, deep=True))
+        converted = series
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'string':
+            if rows and series.nunique(dropna=True) <= category_threshold * rows:
+                converted = series.astype('category')
+            else:
+                converted = series.astype('string[pyarrow]')
+        elif pd.api.types.is_integer_dtype(series) and not pd.api.types.is_extension_array_dtype(series):
+            converted = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series) and not pd.api.types.is_extension_array_dtype(series):
+            values = series.to_numpy()
+            present = values[~np.isnan(values)]
+            peak = np.abs(present).max() if len(present) else None
+            if peak is not None and peak < 2 ** 31 and np.array_equal(present, np.trunc(present)):
+                converted = series.astype('Int8' if peak < 2 ** 7 else 'Int16' if peak < 2 ** 15 else 'Int32')
+            else:
+                narrow = values.astype(np.float32)
+                if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+                    converted = series.astype(np.float32)
+        after = int(converted.memory_usage(index=False, deep=True))
+        if after >= before:
+            converted, after = series, before
+        optimized[col] = converted
+        columns[str(col)] = {
+            'dtype_before': str(series.dtype),
+            'dtype_after': str(converted.dtype),
+            'bytes_before': before,
+            'bytes_after': after
+        }
+    
+    result = pd.DataFrame(optimized, index=frame.index)
+    total_before = sum(c['bytes_before'] for c in columns.values())
+    total_after = sum(c['bytes_after'] for c in columns.values())
+    report = {
+        'bytes_before': total_before,
+        'bytes_after': total_after,
+        'reduction_ratio': round(total_before / total_after, 2) if total_after else None,
+        'columns': columns
+    }
+    return result, report
+
+
+class _ChunkWriter:
+    """Writes processed chunks to one output file as they arrive
+    
+    Text formats are appended to; a ``.json`` file becomes one array of
+    records, opened by the first chunk and closed by ``close``. Parquet and
+    Arrow keep a writer open so every chunk becomes a row group / record
+    batch of the same file. The first chunk fixes the schema and later
+    chunks are cast to it.
+    """
+    
+    def __init__(self, output_file: str):
+        self.output_file = output_file
+        self.format = _columnar_format(output_file)
+        if self.format is None and not output_file.lower().endswith(TEXT_FORMATS):
+            raise ValueError("Unsupported output format")
+        self._writer = None
+        self._schema = None
+        self._started = False
+    
+    def write(self, chunk: pd.DataFrame) -> None:
+        if self.format is not None:
+            table = pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.format == 'parquet':
+                    self._writer = pq.ParquetWriter(self.output_file, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.output_file, self._schema)
+            self._writer.write_table(table)
+        elif self.output_file.endswith('.csv'):
+            chunk.to_csv(self.output_file, mode='a' if self._started else 'w', header=not self._started, index=False)
+        elif self.output_file.endswith('.json'):
+            records = chunk.to_json(orient='records')[1:-1]
+            if records:
+                with open(self.output_file, 'a' if self._started else 'w') as f:
+                    f.write((',' if self._started else '[') + records)
+                self._started = True
+            return
+        else:
+            lines = chunk.to_json(orient='records', lines=True)
+            with open(self.output_file, 'a' if self._started else 'w') as f:
+                f.write(lines if lines.endswith('\n') else lines + '\n')
+        self._started = True
+    
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.output_file.endswith('.json'):
+            # Close the array (or write an empty one) so the file is a valid document
+            with open(self.output_file, 'a' if self._started else 'w') as f:
+                f.write(']' if self._started else '[]')
+            self._started = True
+
+
+class StreamingCleaner:
+    """Chunk-at-a-time equivalent of clean_data + analyze_statistics
+    
+    Each chunk has its duplicates removed, both within itself and against
+    earlier chunks. It is then forward-filled, carrying each column's last
+    value across chunk boundaries, and added to the statistics. Duplicates
+    are filtered by ``deduplicator`` (an already observed two-pass
+    ``Deduplicator``) when given. Otherwise, for input that can be read only
+    once, they are checked against a ``DigestSet`` of every distinct row.
+    """
+    
+    def __init__(self, deduplicator: Optional[Deduplicator] = None, dedupe_subset: Optional[List[str]] = None):
+        self.deduplicator = deduplicator
+        self.dedupe_subset = dedupe_subset
+        self.seen = DigestSet() if deduplicator is None else None
+        self.stats = StatsAccumulator()
+        self.rows = 0
+        self.missing = 0
+        self._carry = None
+    
+    def update(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Clean ``chunk`` and add it to the statistics; returns the cleaned rows"""
+        self.rows += len(chunk)
+        if self.deduplicator is not None:
+            chunk = self.deduplicator.filter(chunk)
+        elif len(chunk):
+            digests = row_digests(chunk, self.dedupe_subset)
+            keep = ~(pd.Series(digests).duplicated().to_numpy() | self.seen.contains(digests))
+            self.seen.add(digests[keep])
+            chunk = chunk[keep]
+        if chunk.empty:
+            return chunk
+        
+        self.missing += int(chunk.isnull().sum().sum())
+        chunk = chunk.ffill()
+        if self._carry is not None:
+            chunk = chunk.fillna(self._carry)
+        self._carry = chunk.iloc[-1]
+        self.stats.update(chunk)
+        return chunk
+    
+    @property
+    def duplicates(self) -> int:
+        return self.rows - self.stats.total_rows
+
 
 class DataProcessor:
-    """Main data processing class"""
+    """Main data processing class
+    
+    ``columns`` limits loading to those columns and ``filters`` (a list of
+    ``(column, op, value)`` conditions, AND-ed) keeps only matching rows.
+    For Parquet and Arrow inputs both are pushed into the scan, so skipped
+    columns are never read and row groups whose statistics rule out a match
+    are skipped; text formats apply them after parsing. ``dedupe_subset``
+    makes cleaning treat rows as duplicates when those columns match
+    (default: all columns).
+    """
     
-    def __init__(self, input_file: str):
+    def __init__(self, input_file: str, chunksize: Optional[int] = None,
+                 columns: Optional[List[str]] = None, filters: Optional[List] = None,
+                 dedupe_subset: Optional[List[str]] = None):
         self.input_file = input_file
+        self.chunksize = chunksize
+        self.columns = list(columns) if columns else None
+        self.filters = validate_filters(filters)
+        self.dedupe_subset = validate_dedupe_subset(dedupe_subset, self.columns)
         self.data = None
         self.processed_data = None
+        self.stream_stats = None
+        self.accumulator = None
+        self.memory_report = None
+        self.dedupe_stats = None
         
+    @timed('data_processor', 'load')
     def load_data(self) -> pd.DataFrame:
-        """Load data from CSV or JSON file"""
-        print(f"[v0] Loading data from {self.input_file}")
+        """Load data from CSV, JSON, Parquet or Arrow/Feather file"""
+        log.info("Loading data from %s", self.input_file)
         try:
-            if self.input_file.endswith('.csv'):
-                self.data = pd.read_csv(self.input_file)
+            if _columnar_format(self.input_file):
+                self.data = self.load_table().to_pandas(split_blocks=True)
+            elif self.input_file.endswith('.csv'):
+                frame = pd.read_csv(self.input_file, usecols=self._read_columns())
+                self.data = self._project(_filter_frame(frame, self.filters))
             elif self.input_file.endswith('.json'):
-                self.data = pd.read_json(self.input_file)
+                self.data = self._project(_filter_frame(pd.read_json(self.input_file), self.filters))
+            elif self.input_file.endswith(('.jsonl', '.ndjson')):
+                self.data = self._project(_filter_frame(pd.read_json(self.input_file, lines=True), self.filters))
             else:
                 raise ValueError("Unsupported file format")
             
-            print(f"[v0] Data loaded successfully. Shape: {self.data.shape}")
+            log.info("Data loaded successfully. Shape: %s", self.data.shape)
             return self.data
         except Exception as e:
-            print(f"[v0] Error loading data: {str(e)}")
+            log.error("Error loading data: %s", e)
             return None
     
-    def clean_data(self) -> pd.DataFrame:
-        """Clean and validate data"""
-        print("[v0] Starting data cleaning process")
+    def load_table(self) -> pa.Table:
+        """Read a Parquet or Arrow/Feather input as a pyarrow Table
+        
+        Files are memory-mapped. Uncompressed Arrow files (what
+        ``save_processed_data`` writes) are then read without copying: the
+        table's buffers point into the page cache.
+        """
+        file_format = _columnar_format(self.input_file)
+        if file_format == 'parquet':
+            return pq.read_table(self.input_file, columns=self.columns, filters=self.filters, memory_map=True)
+        if file_format == 'ipc':
+            table = feather.read_table(self.input_file, memory_map=True)
+            if self.filters:
+                table = table.filter(_filter_expression(self.filters))
+            return table.select(self.columns) if self.columns else table
+        raise ValueError("Unsupported file format")
+    
+    def _read_columns(self) -> Optional[List[str]]:
+        """Columns a text reader must parse: the projection plus the columns filters test"""
+        if not self.columns:
+            return None
+        return self.columns + [c for c, _, _ in self.filters or [] if c not in self.columns]
+    
+    def _project(self, frame: pd.DataFrame) -> pd.DataFrame:
+        return frame[self.columns] if self.columns else frame
+    
+    def iter_chunks(self) -> Iterator[pd.DataFrame]:
+        """Yield the input file in chunks of ``self.chunksize`` rows
+        
+        CSV and JSON Lines are read incrementally. Parquet and Arrow files are
+        scanned batch by batch with projection and filters pushed down. A
+        plain ``.json`` document cannot be parsed piecewise, so it is loaded
+        once and sliced.
+        """
+        chunksize = self.chunksize or DEFAULT_CHUNKSIZE
+        file_format = _columnar_format(self.input_file)
+        if file_format:
+            dataset = ds.dataset(self.input_file, format=file_format)
+            scan_filter = _filter_expression(self.filters) if self.filters else None
+            for batch in dataset.to_batches(columns=self.columns, filter=scan_filter, batch_size=chunksize):
+                if batch.num_rows:
+                    yield batch.to_pandas()
+        elif self.input_file.endswith('.csv'):
+            with pd.read_csv(self.input_file, chunksize=chunksize, usecols=self._read_columns()) as reader:
+                for chunk in reader:
+                    yield self._project(_filter_frame(chunk, self.filters))
+        elif self.input_file.endswith(('.jsonl', '.ndjson')):
+            with pd.read_json(self.input_file, lines=True, chunksize=chunksize) as reader:
+                for chunk in reader:
+                    yield self._project(_filter_frame(chunk, self.filters))
+        elif self.input_file.endswith('.json'):
+            data = self._project(_filter_frame(pd.read_json(self.input_file), self.filters))
+            for start in range(0, len(data), chunksize):
+                yield data.iloc[start:start + chunksize]
+        else:
+            raise ValueError("Unsupported file format")
+    
+    @timed('data_processor', 'stream')
+    def process_stream(self, output_file: Optional[str] = None,
+                       progress: Optional[Callable[[int, int], None]] = None) -> dict:
+        """Clean, analyze and optionally save the input one chunk at a time
+        
+        Matches load_data/clean_data/analyze_statistics/save_processed_data.
+        With a ``dedupe_subset``, duplicates are found with a ``Deduplicator``:
+        a first pass reads only the key columns into a Bloom filter, then the
+        main pass drops repeats after confirming them by value, for about
+        1.2 bytes per row plus the rows that may repeat. Without one the key
+        is the whole row, so a pre-pass would parse the file twice; the single
+        pass checks rows against a ``DigestSet`` instead (8 bytes per distinct
+        row). Forward-fill carries each column's last value across chunk
+        boundaries. Peak memory is one chunk plus the dedupe state.
+        
+        ``progress(rows, total)`` is called after every chunk of each pass
+        (``rows`` is 0 during the key pre-pass). ``total`` is the row count
+        of unfiltered Parquet/Arrow inputs and 0 when it isn't known without
+        reading the file. An exception it raises (e.g. job cancellation)
+        stops the run.
+        """
+        log.info("Streaming %s in chunks of %s rows", self.input_file, self.chunksize or DEFAULT_CHUNKSIZE)
+        total = self._row_count() if progress else 0
+        deduplicator = None
+        if self.dedupe_subset is not None:
+            deduplicator = Deduplicator(self.dedupe_subset)
+            for chunk in self._key_chunks():
+                deduplicator.observe(chunk)
+                if progress:
+                    progress(0, total)
+        cleaner = StreamingCleaner(deduplicator)
+        writer = _ChunkWriter(output_file) if output_file else None
+        
+        if output_file and Path(output_file).exists():
+            Path(output_file).unlink()
+        
+        try:
+            for chunk in self.iter_chunks():
+                chunk = cleaner.update(chunk)
+                if writer and not chunk.empty:
+                    writer.write(chunk)
+                if progress:
+                    progress(cleaner.rows, total)
+        finally:
+            if writer:
+                writer.close()
+        
+        log.info("Removed %s duplicate rows", cleaner.duplicates)
+        log.info("Handled %s missing values", cleaner.missing)
+        if deduplicator is not None:
+            self.dedupe_stats = deduplicator.stats()
+        else:
+            self.dedupe_stats = {'rows': cleaner.rows, 'kept': cleaner.stats.total_rows,
+                                 'duplicates': cleaner.duplicates, 'subset': None,
+                                 'digest_bytes': cleaner.seen.nbytes}
+        self.accumulator = cleaner.stats
+        self.stream_stats = cleaner.stats.summary()
+        return self.stream_stats
+    
+    def _row_count(self) -> int:
+        """Rows in the input when its metadata says so without a scan (0 otherwise)"""
+        file_format = _columnar_format(self.input_file)
+        if file_format is None or self.filters:
+            return 0
+        return ds.dataset(self.input_file, format=file_format).count_rows()
+    
+    def _key_chunks(self) -> Iterator[pd.DataFrame]:
+        """Chunks holding just the dedupe key columns (``dedupe_subset`` must be set)"""
+        schema = read_schema(self.input_file) if self.columns is None else self.columns
+        validate_dedupe_subset(self.dedupe_subset, schema)
+        return DataProcessor(self.input_file, self.chunksize, self.dedupe_subset, self.filters).iter_chunks()
+    
+    @timed('data_processor', 'clean')
+    def clean_data(self, optimize: bool = False) -> pd.DataFrame:
+        """Clean and validate data
+        
+        With ``optimize=True`` the cleaned frame is also passed through
+        ``optimize_dtypes``; the per-column savings end up in ``memory_report``.
+        """
+        log.debug("Starting data cleaning process")
         if self.data is None:
-            print("[v0] Error: No data loaded")
+            log.error("Error: No data loaded")
             return None
         
         # Remove duplicates
         initial_rows = len(self.data)
-        self.processed_data = self.data.drop_duplicates()
-        print(f"[v0] Removed {initial_rows - len(self.processed_data)} duplicate rows")
+        self.processed_data = self.data.drop_duplicates(subset=self.dedupe_subset)
+        log.info("Removed %s duplicate rows", initial_rows - len(self.processed_data))
         
         # Handle missing values
         missing_before = self.processed_data.isnull().sum().sum()
         self.processed_data = self.processed_data.fillna(method='ffill')
-        print(f"[v0] Handled {missing_before} missing values")
+        log.info("Handled %s missing values", missing_before)
+        
+        if optimize:
+            self.optimize_memory()
         
         return self.processed_data
     
+    @timed('data_processor', 'optimize')
+    def optimize_memory(self, category_threshold: float = 0.5) -> dict:
+        """Convert ``processed_data`` to compact dtypes; see ``optimize_dtypes``"""
+        if self.processed_data is None:
+            log.error("Error: No processed data available")
+            return {}
+        self.processed_data, self.memory_report = optimize_dtypes(self.processed_data, category_threshold)
+        # The raw frame is no longer needed and would otherwise double the footprint
+        self.data = None
+        log.info("Optimized dtypes: %s -> %s bytes",
+                 self.memory_report['bytes_before'], self.memory_report['bytes_after'])
+        return self.memory_report
+    
+    @timed('data_processor', 'analyze')
     def analyze_statistics(self) -> dict:
         """Generate statistical analysis"""
-        print("[v0] Analyzing data statistics")
+        log.debug("Analyzing data statistics")
+        if self.processed_data is None and self.stream_stats is not None:
+            return self.stream_stats
         if self.processed_data is None:
-            print("[v0] Error: No processed data available")
+            log.error("Error: No processed data available")
             return {}
         
-        stats = {
-            'total_rows': len(self.processed_data),
-            'total_columns': len(self.processed_data.columns),
-            'memory_usage': str(self.processed_data.memory_usage(deep=True).sum()),
-            'numeric_summary': self.processed_data.describe().to_dict(),
-            'data_types': self.processed_data.dtypes.to_dict(),
-        }
+        # One pass, no full sort: quantiles come from a mergeable KLL sketch
+        self.accumulator = StatsAccumulator().update(self.processed_data)
+        stats = self.accumulator.summary()
         
-        print("[v0] Statistics generated successfully")
+        log.debug("Statistics generated successfully")
         return stats
     
+    @timed('data_processor', 'save')
     def save_processed_data(self, output_file: str) -> bool:
         """Save processed data to file"""
-        print(f"[v0] Saving processed data to {output_file}")
+        log.info("Saving processed data to %s", output_file)
         try:
-            if output_file.endswith('.csv'):
+            if self.processed_data is None and self.chunksize:
+                self.process_stream(output_file)
+                log.info("Data saved successfully")
+                return True
+            file_format = _columnar_format(output_file)
+            if file_format == 'parquet':
+                self.processed_data.to_parquet(output_file, index=False)
+            elif file_format == 'ipc':
+                # Uncompressed so load_table can memory-map it without a copy
+                feather.write_feather(self.processed_data, output_file, compression='uncompressed')
+            elif output_file.endswith('.csv'):
                 self.processed_data.to_csv(output_file, index=False)
             elif output_file.endswith('.json'):
                 self.processed_data.to_json(output_file)
-            print(f"[v0] Data saved successfully")
+            elif output_file.endswith(('.jsonl', '.ndjson')):
+                self.processed_data.to_json(output_file, orient='records', lines=True)
+            else:
+                raise ValueError("Unsupported output format")
+            log.info("Data saved successfully")
             return True
         except Exception as e:
-            print(f"[v0] Error saving data: {str(e)}")
+            log.error("Error saving data: %s", e)
             return False
 
 
-def process_files_in_directory(directory: str, pattern: str = "*.csv"):
-    """Process multiple files in a directory"""
-    print(f"[v0] Processing files in {directory} with pattern {pattern}")
-    path = Path(directory)
+def _process_one_file(filepath: str, chunksize: Optional[int] = None, output_format: str = 'csv') -> dict:
+    """Process a single file for a batch run; never raises
     
-    for file in path.glob(pattern):
-        processor = DataProcessor(str(file))
-        processor.load_data()
+    Runs inside a worker process. The stats accumulator is returned so the
+    parent can merge it into the batch summary.
+    """
+    started = time.perf_counter()
+    file = Path(filepath)
+    output_file = str(file.with_name(f"{file.stem}_processed{OUTPUT_SUFFIXES[output_format]}"))
+    record = {
+        'file': str(file),
+        'size_bytes': file.stat().st_size if file.exists() else None,
+        'output': output_file,
+    }
+    try:
+        processor = DataProcessor(str(file), chunksize=chunksize)
+        if chunksize:
+            stats = processor.process_stream(output_file)
+        else:
+            if processor.load_data() is None:
+                raise ValueError(f"Could not load {file.name}")
+            processor.clean_data()
+            stats = processor.analyze_statistics()
+            if not processor.save_processed_data(output_file):
+                raise IOError(f"Could not write {output_file}")
+        record.update({'status': 'success', 'rows': stats.get('total_rows'), 'statistics': stats,
+                       'accumulator': processor.accumulator})
+        log.info("Completed processing: %s", file.name)
+    except Exception as e:
+        log.error("Failed processing %s: %s", file.name, e)
+        record.update({'status': 'failed', 'error': str(e)})
+    record['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def process_files_in_directory(directory: str, pattern: str = "*.csv", workers: Optional[int] = None,
+                               manifest_path: Optional[str] = None, chunksize: Optional[int] = None,
+                               progress: Optional[Callable[[int, int], None]] = None,
+                               output_format: str = 'csv') -> dict:
+    """Process multiple files in a directory in parallel
+    
+    Files are handed to a process pool largest first so one big file doesn't
+    start last and stretch the tail of the batch. Each file is isolated: a
+    failure is recorded in the manifest and the rest of the batch continues.
+    ``workers=1`` runs inline without a pool. Returns a manifest with
+    per-file results plus statistics merged across all successful files;
+    if ``manifest_path`` is given the manifest is also written there as JSON.
+    Outputs are written next to each input as ``<stem>_processed`` in
+    ``output_format`` (``csv``, ``parquet`` or ``feather``).
+    """
+    if output_format not in OUTPUT_SUFFIXES:
+        raise ValueError(f"Unknown output format '{output_format}'. Use one of: {', '.join(OUTPUT_SUFFIXES)}")
+    log.info("Processing files in %s with pattern %s", directory, pattern)
+    started_at = datetime.now()
+    started = time.perf_counter()
+    files = [f for f in Path(directory).glob(pattern)
+             if f.is_file() and not f.stem.endswith('_processed')]
+    files.sort(key=lambda f: f.stat().st_size, reverse=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(files) or 1))
+    
+    combined = StatsAccumulator()
+    records = []
+    
+    def collect(record: dict) -> None:
+        accumulator = record.pop('accumulator', None)
+        if accumulator is not None:
+            combined.merge(accumulator)
+        records.append(record)
+        if progress:
+            progress(len(records), len(files))
+    
+    if workers == 1:
+        for file in files:
+            collect(_process_one_file(str(file), chunksize, output_format))
+    else:
+        # spawn, not fork: callers such as the API run this from a threaded process
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            futures = {executor.submit(_process_one_file, str(file), chunksize, output_format): file
+                       for file in files}
+            for future in as_completed(futures):
+                try:
+                    collect(future.result())
+                except Exception as e:
+                    # The worker itself died (e.g. killed for memory); isolate that file too
+                    collect({'file': str(futures[future]), 'status': 'failed', 'error': str(e)})
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+    
+    succeeded = sum(1 for r in records if r['status'] == 'success')
+    manifest = {
+        'directory': str(directory),
+        'pattern': pattern,
+        'output_format': output_format,
+        'workers': workers,
+        'started_at': started_at.isoformat(),
+        'finished_at': datetime.now().isoformat(),
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+        'total_files': len(files),
+        'succeeded': succeeded,
+        'failed': len(records) - succeeded,
+        'files': records,
+        'combined_statistics': combined.summary()
+    }
+    
+    if manifest_path:
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2, default=str)
+        log.info("Batch manifest written to %s", manifest_path)
+    log.info("Batch finished: %s/%s files succeeded", succeeded, len(files))
+    return manifest
+
+
+def dedupe_files(paths: List[str], subset: Optional[List[str]] = None, output_dir: Optional[str] = None,
+                 chunksize: Optional[int] = None, dry_run: bool = False, error_rate: float = DEFAULT_ERROR_RATE,
+                 progress: Optional[Callable[[int, int], None]] = None) -> dict:
+    """Drop rows repeated anywhere in ``paths``, keeping each row's first occurrence
+    
+    The files are treated as one stream in the given order, so a row that
+    already appeared in an earlier file is a duplicate. Both passes of
+    ``Deduplicator`` read chunk by chunk: the first reads only the key
+    columns, the second writes ``<stem>_deduped`` next to each input (or
+    into ``output_dir``) in the input's format (``.json`` as an array of
+    records, which loads back like the input). ``dry_run`` only counts.
+    ``progress(done, total)`` counts file passes.
+    """
+    deduplicator = Deduplicator(subset, error_rate)
+    chunksize = chunksize or DEFAULT_CHUNKSIZE
+    total = len(paths) * 2
+    done = 0
+    started = time.perf_counter()
+    
+    for path in paths:
+        for chunk in DataProcessor(path, chunksize, columns=subset).iter_chunks():
+            deduplicator.observe(chunk)
+        done += 1
+        if progress:
+            progress(done, total)
+    
+    files = []
+    for source, path in enumerate(paths):
+        file = Path(path)
+        record = {'file': str(file), 'rows': 0, 'kept': 0, 'output': None}
+        before = (deduplicator.duplicates_within, deduplicator.duplicates_across)
+        writer = None
+        if not dry_run:
+            target = Path(output_dir) if output_dir else file.parent
+            target.mkdir(parents=True, exist_ok=True)
+            record['output'] = str(target / f"{file.stem}_deduped{file.suffix}")
+            writer = _ChunkWriter(record['output'])
+        try:
+            # In a dry run only the key columns are needed to count
+            reader = DataProcessor(path, chunksize, columns=subset if dry_run else None)
+            for chunk in reader.iter_chunks():
+                kept = deduplicator.filter(chunk, source)
+                record['rows'] += len(chunk)
+                record['kept'] += len(kept)
+                # An all-duplicate file still gets an (empty) output with its header/schema
+                if writer and (len(kept) or not record['kept']):
+                    writer.write(kept)
+        finally:
+            if writer:
+                writer.close()
+        record['duplicates_within_file'] = deduplicator.duplicates_within - before[0]
+        record['duplicates_across_files'] = deduplicator.duplicates_across - before[1]
+        files.append(record)
+        done += 1
+        if progress:
+            progress(done, total)
+    
+    report = deduplicator.stats()
+    report.update({
+        'dry_run': dry_run,
+        'files': files,
+        'elapsed_seconds': round(time.perf_counter() - started, 3)
+    })
+    log.info("Deduplicated %s files: %s of %s rows were duplicates",
+             len(paths), report['duplicates'], report['rows'])
+    return report
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Clean and analyze CSV/JSON/Parquet/Arrow data files")
+    parser.add_argument('input', nargs='?', default='sample_data.csv',
+                        help="file to process, or directory with --batch")
+    parser.add_argument('-o', '--output', default='processed_data.csv', help="output file (single-file mode)")
+    parser.add_argument('--chunksize', type=int, help="process in chunks of N rows")
+    parser.add_argument('--batch', action='store_true', help="process every matching file in a directory")
+    parser.add_argument('--pattern', default='*.csv', help="glob for --batch (default: *.csv)")
+    parser.add_argument('--workers', type=int, help="worker processes for --batch (default: CPU count)")
+    parser.add_argument('--manifest', help="write the batch manifest JSON here")
+    parser.add_argument('--output-format', choices=sorted(OUTPUT_SUFFIXES), default='csv',
+                        help="output format for --batch (default: csv)")
+    parser.add_argument('--columns', help="comma-separated columns to load (default: all)")
+    parser.add_argument('--dedupe-on', help="comma-separated columns that identify a duplicate (default: all)")
+    args = parser.parse_args(argv)
+    
+    if args.batch:
+        manifest = process_files_in_directory(args.input, args.pattern, args.workers,
+                                              args.manifest, args.chunksize,
+                                              output_format=args.output_format)
+        return 0 if manifest['failed'] == 0 else 1
+    
+    columns = args.columns.split(',') if args.columns else None
+    dedupe_subset = args.dedupe_on.split(',') if args.dedupe_on else None
+    processor = DataProcessor(args.input, chunksize=args.chunksize, columns=columns, dedupe_subset=dedupe_subset)
+    if not args.chunksize:
+        if processor.load_data() is None:
+            return 1
         processor.clean_data()
-        stats = processor.analyze_statistics()
-        
-        output_file = str(file).replace(file.suffix, '_processed.csv')
-        processor.save_processed_data(output_file)
-        
-        print(f"[v0] Completed processing: {file.name}")
+    return 0 if processor.save_processed_data(args.output) else 1
 
 
 if __name__ == "__main__":
-    # Example usage
-    processor = DataProcessor("sample_data.csv")
-    processor.load_data()
-    processor.clean_data()
-    stats = processor.analyze_statistics()
-    processor.save_processed_data("processed_data.csv")
+    sys.exit(main())
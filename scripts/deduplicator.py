@@ -0,0 +1,265 @@
+"""
+Row Deduplication
+Key-aware duplicate detection for chunk streams and file sets that don't fit in memory
+"""
+
+import math
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_ERROR_RATE = 0.01
+DEFAULT_INITIAL_CAPACITY = 1_000_000
+
+
+def row_digests(frame: pd.DataFrame, subset: Optional[Sequence[str]] = None) -> np.ndarray:
+    """64-bit digest per row over ``subset`` (default: every column)
+
+    One vectorized hashing pass (``hash_pandas_object``). Integer and bool
+    columns are hashed as float64 so a column read as int64 in one chunk or
+    file and float64 in another (because of NaNs) still produces the same
+    digests. Without ``subset`` columns are hashed in name order, so files
+    whose columns appear in different orders still match.
+    """
+    columns = list(subset) if subset else sorted(frame.columns, key=str)
+    normalized = frame[columns].copy(deep=False)
+    for col in columns:
+        if pd.api.types.is_integer_dtype(normalized[col]) or pd.api.types.is_bool_dtype(normalized[col]):
+            normalized[col] = normalized[col].astype('float64')
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+def _key_tuples(frame: pd.DataFrame, subset: Optional[Sequence[str]]) -> List[tuple]:
+    """Comparable key values per row (NaN/NA as None so missing values match)"""
+    columns = list(subset) if subset else sorted(frame.columns, key=str)
+    values = frame[columns].astype(object)
+    values = values.where(values.notna(), None)
+    return list(values.itertuples(index=False, name=None))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 64-bit digests, numpy-backed
+
+    The ``k`` bit positions come from double hashing the digest's two 32-bit
+    halves, so membership needs no further hashing. Batches are added and
+    queried as arrays.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = DEFAULT_ERROR_RATE):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        bits = math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.size = max(64, -(-bits // 8) * 8)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = np.zeros(self.size // 8, dtype=np.uint8)
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def _positions(self, digests: np.ndarray) -> np.ndarray:
+        digests = digests.astype(np.uint64, copy=False)
+        low = digests & np.uint64(0xFFFFFFFF)
+        high = (digests >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        return (low[:, None] + steps[None, :] * high[:, None]) % np.uint64(self.size)
+
+    def add(self, digests: np.ndarray) -> None:
+        if len(digests) == 0:
+            return
+        positions = self._positions(digests).ravel()
+        index = positions >> np.uint64(3)
+        masks = np.left_shift(np.uint8(1), (positions & np.uint64(7)).astype(np.uint8))
+        # Several positions can share a byte; OR them together before writing
+        order = np.argsort(index, kind='stable')
+        index, masks = index[order], masks[order]
+        starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        self.bits[index[starts]] |= np.bitwise_or.reduceat(masks, starts)
+        self.count += len(digests)
+
+    def might_contain(self, digests: np.ndarray) -> np.ndarray:
+        if len(digests) == 0:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(digests)
+        bytes_ = self.bits[positions >> np.uint64(3)]
+        return ((bytes_ >> (positions & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1).astype(bool)
+
+
+class ScalableBloomFilter:
+    """Bloom filter that grows without knowing the row count up front
+
+    When the current slice is full a new one with twice the capacity and
+    half the error rate is added, which keeps the overall false-positive
+    rate below twice ``error_rate`` (Almeida et al., 2007).
+    """
+
+    def __init__(self, initial_capacity: int = DEFAULT_INITIAL_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE):
+        self.error_rate = error_rate
+        self.slices = [BloomFilter(initial_capacity, error_rate / 2)]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(s.nbytes for s in self.slices)
+
+    @property
+    def count(self) -> int:
+        return sum(s.count for s in self.slices)
+
+    def add(self, digests: np.ndarray) -> None:
+        start = 0
+        while start < len(digests):
+            current = self.slices[-1]
+            room = current.capacity - current.count
+            if room <= 0:
+                current = BloomFilter(current.capacity * 2, current.error_rate / 2)
+                self.slices.append(current)
+                room = current.capacity
+            current.add(digests[start:start + room])
+            start += room
+
+    def might_contain(self, digests: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(digests), dtype=bool)
+        for bloom in self.slices:
+            found |= bloom.might_contain(digests)
+        return found
+
+
+class DigestSet:
+    """Exact set of 64-bit digests stored as sorted numpy runs
+
+    For streams that can be read only once, where a Bloom pre-pass isn't
+    possible. Each digest costs 8 bytes, against roughly 60 for a Python
+    set of ints. New digests form a run, and runs merge whenever the
+    previous one is at most twice as large, so there are O(log n) runs and
+    each lookup is a ``searchsorted`` per run.
+    """
+
+    def __init__(self):
+        self._runs: List[np.ndarray] = []
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return sum(run.nbytes for run in self._runs)
+
+    def contains(self, digests: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(digests), dtype=bool)
+        for run in self._runs:
+            index = np.minimum(np.searchsorted(run, digests), len(run) - 1)
+            found |= run[index] == digests
+        return found
+
+    def add(self, digests: np.ndarray) -> None:
+        """Add digests not already in the set"""
+        if len(digests) == 0:
+            return
+        run = np.unique(digests.astype(np.uint64, copy=False))
+        self._count += len(run)
+        while self._runs and len(self._runs[-1]) <= 2 * len(run):
+            run = np.sort(np.concatenate([self._runs.pop(), run]), kind='mergesort')
+        self._runs.append(run)
+
+
+class Deduplicator:
+    """Two-pass, bounded-memory deduplication over chunks from one or more sources
+
+    Pass 1 (``observe``) streams every chunk's digests through a Bloom
+    filter. A digest that may have been seen before, or repeats within its
+    chunk, becomes a *candidate*. Only candidates are kept exactly, so
+    memory is about 1.2 bytes per row for the filter plus 8 bytes per
+    candidate, instead of a set holding every distinct row.
+
+    Pass 2 (``filter``) re-reads the same chunks in the same order. Rows
+    whose digest is not a candidate are unique and pass straight through.
+    Candidate rows are confirmed by comparing key values with the first
+    occurrence, so Bloom false positives and digest collisions never drop a
+    distinct row. The first occurrence is kept. ``source`` labels chunks
+    (e.g. a file index) so duplicates can be counted within and across
+    sources.
+    """
+
+    def __init__(self, subset: Optional[Sequence[str]] = None, error_rate: float = DEFAULT_ERROR_RATE,
+                 initial_capacity: int = DEFAULT_INITIAL_CAPACITY):
+        self.subset = list(subset) if subset else None
+        self.bloom = ScalableBloomFilter(initial_capacity, error_rate)
+        self._candidates: Optional[np.ndarray] = None
+        self._candidate_chunks: List[np.ndarray] = []
+        self._first: Dict[int, List[tuple]] = {}
+        self._occurrences: Dict[int, int] = {}
+        self.rows = 0
+        self.kept = 0
+        self.duplicates_within = 0
+        self.duplicates_across = 0
+        self.hash_collisions = 0
+
+    def observe(self, chunk: pd.DataFrame) -> None:
+        """Pass 1: record the chunk's digests"""
+        if chunk.empty:
+            return
+        digests = row_digests(chunk, self.subset)
+        candidates = self.bloom.might_contain(digests) | pd.Series(digests).duplicated(keep=False).to_numpy()
+        if candidates.any():
+            self._candidate_chunks.append(np.unique(digests[candidates]))
+        self.bloom.add(digests)
+
+    def _finish_observing(self) -> np.ndarray:
+        if self._candidates is None:
+            chunks = self._candidate_chunks
+            self._candidates = np.unique(np.concatenate(chunks)) if chunks else np.zeros(0, dtype=np.uint64)
+            self._candidate_chunks = []
+        return self._candidates
+
+    def filter(self, chunk: pd.DataFrame, source: int = 0) -> pd.DataFrame:
+        """Pass 2: the chunk without rows already seen (in any earlier source or chunk)"""
+        candidates = self._finish_observing()
+        self.rows += len(chunk)
+        if chunk.empty or len(candidates) == 0:
+            self.kept += len(chunk)
+            return chunk
+        digests = row_digests(chunk, self.subset)
+        rows = np.flatnonzero(np.isin(digests, candidates))
+        if len(rows) == 0:
+            self.kept += len(chunk)
+            return chunk
+
+        keep = np.ones(len(chunk), dtype=bool)
+        keys = _key_tuples(chunk.iloc[rows], self.subset)
+        for row, digest, key in zip(rows.tolist(), digests[rows].tolist(), keys):
+            self._occurrences[digest] = self._occurrences.get(digest, 0) + 1
+            firsts = self._first.setdefault(digest, [])
+            match = next((first_source for first_key, first_source in firsts if first_key == key), None)
+            if match is None:
+                if firsts:
+                    self.hash_collisions += 1
+                firsts.append((key, source))
+            else:
+                keep[row] = False
+                if match == source:
+                    self.duplicates_within += 1
+                else:
+                    self.duplicates_across += 1
+        self.kept += int(keep.sum())
+        return chunk[keep] if not keep.all() else chunk
+
+    def stats(self) -> Dict:
+        candidates = self._finish_observing()
+        # Candidates seen only once in pass 2 were Bloom false positives
+        false_positives = sum(1 for count in self._occurrences.values() if count == 1)
+        return {
+            'rows': self.rows,
+            'kept': self.kept,
+            'duplicates': self.duplicates_within + self.duplicates_across,
+            'duplicates_within_file': self.duplicates_within,
+            'duplicates_across_files': self.duplicates_across,
+            'subset': self.subset,
+            'candidates': int(len(candidates)),
+            'false_positive_candidates': false_positives,
+            'hash_collisions': self.hash_collisions,
+            'bloom_bytes': self.bloom.nbytes
+        }
+
@@ -0,0 +1,564 @@
+"""
+File Metadata Index
+SQLite index of watched directory trees, kept current by inotify
+"""
+
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import sqlite3
+import stat as stat_module
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from file_walker import walk_files
+from log import get_logger
+
+log = get_logger('file_index')
+
+# inotify(7) event bits
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+_EVENT_HEADER = struct.Struct('iIII')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roots (
+    path TEXT PRIMARY KEY,
+    last_reconcile REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    total_bytes INTEGER NOT NULL,
+    file_count INTEGER NOT NULL
+);
+"""
+
+
+def _subtree(path: str) -> Tuple[str, str]:
+    """Bounds of a half-open range matching every path below ``path``
+
+    '/' sorts immediately before '0', so this is an index range scan.
+    """
+    base = path.rstrip('/')
+    return base + '/', base + '0'
+
+
+def _ancestors(directory: str, root: str) -> Iterable[str]:
+    """``directory`` and each parent up to and including ``root``"""
+    while True:
+        yield directory
+        if directory == root or len(directory) <= len(root):
+            return
+        directory = os.path.dirname(directory)
+
+
+class _Inotify:
+    """Minimal ctypes binding for inotify_init1/add_watch/rm_watch"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+    def add_watch(self, path: str) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float) -> List[Tuple[int, int, int, str]]:
+        """``(wd, mask, cookie, name)`` for every queued event, waiting up to ``timeout``"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        events = []
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buffer, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FileIndex:
+    """Persistent path/size/mtime index with per-directory subtree totals
+
+    Watched roots are fully scanned once per writer start (a reconcile only
+    rewrites rows that changed), then kept current from inotify events;
+    ``dirs`` holds the recursive byte and file counts of every directory and
+    is adjusted by each change instead of being recomputed. A periodic
+    reconcile catches anything inotify can't report: queue overflows, the
+    watch limit being reached, changes behind symlinks, or platforms without
+    inotify (where it is the only update mechanism).
+
+    All writes happen on one background thread; queries may come from any
+    thread. Queries return None for paths outside a ready root so callers can
+    fall back to walking the filesystem.
+
+    Several processes may open the same database. The one that calls
+    ``start`` is the writer; the others only read, taking root readiness from
+    the database, and their ``watch``/``reconcile`` calls reach the writer
+    through the ``roots`` table.
+    """
+
+    def __init__(self, db_path: str, reconcile_interval: float = 300.0):
+        self.db_path = db_path
+        self.reconcile_interval = reconcile_interval
+        parent = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(parent, exist_ok=True)
+        self._db = None
+        self._db_pid = None
+        self._inherited = None
+        self._lock = threading.Lock()
+        self._roots: Dict[str, Dict] = {}
+        self._pending_roots: List[str] = []
+        self._wd_paths: Dict[int, str] = {}
+        self._path_wds: Dict[str, int] = {}
+        self._inotify = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self.events_processed = 0
+        for (path,) in self._conn.execute('SELECT path FROM roots'):
+            self._add_root(path)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per process: a connection must not be used across fork
+        if self._db is None or self._db_pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            # Keep an inherited connection referenced: closing it could disturb the parent's
+            self._inherited, self._db, self._db_pid = self._db, conn, os.getpid()
+        return self._db
+
+    @property
+    def writer(self) -> bool:
+        """Whether this process maintains the index (otherwise it only reads it)"""
+        return self._thread is not None
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        try:
+            self._inotify = _Inotify()
+        except (OSError, AttributeError) as e:
+            log.warning("inotify unavailable, index will poll every %ss: %s", self.reconcile_interval, e)
+            self._inotify = None
+        with self._lock:
+            for info in self._roots.values():
+                info['mode'] = 'inotify' if self._inotify is not None else 'polling'
+            # Readers in other processes wait for this process's first scan
+            self._conn.execute('UPDATE roots SET last_reconcile = NULL')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='file-index', daemon=True)
+        self._thread.start()
+        log.info("File index started (%s roots)", len(self._roots))
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+            self._wd_paths.clear()
+            self._path_wds.clear()
+
+    def watch(self, directory: str) -> str:
+        """Start indexing ``directory``; it becomes queryable after its first scan"""
+        path = os.path.abspath(directory)
+        if not os.path.isdir(path):
+            raise ValueError(f"Not a directory: {directory}")
+        with self._lock:
+            if self._outer_root(path) is None:
+                self._conn.execute('INSERT OR IGNORE INTO roots (path) VALUES (?)', (path,))
+                self._add_root(path)
+        self._wake.set()
+        return path
+
+    def reconcile(self, directory: Optional[str] = None) -> None:
+        """Queue a full rescan of one root (or of all roots)"""
+        with self._lock:
+            targets = [os.path.abspath(directory)] if directory else list(self._roots)
+            if not self.writer:
+                # The writer process notices the cleared timestamp and rescans
+                self._conn.executemany('UPDATE roots SET last_reconcile = NULL WHERE path = ?',
+                                       [(path,) for path in targets])
+            for path in targets:
+                if path in self._roots and path not in self._pending_roots:
+                    self._pending_roots.append(path)
+        self._wake.set()
+
+    # -- queries -----------------------------------------------------------
+
+    def covers(self, directory: str) -> bool:
+        path = os.path.abspath(directory)
+        with self._lock:
+            if not self.writer:
+                self._sync_roots()
+            root = self._outer_root(path)
+            return root is not None and self._roots[root]['ready']
+
+    def directory_size(self, directory: str) -> Optional[Dict]:
+        """Subtree byte and file counts, or None if the index can't answer"""
+        path = os.path.abspath(directory)
+        if not self.covers(path):
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT total_bytes, file_count FROM dirs WHERE path = ?', (path,)).fetchone()
+        total_bytes, file_count = row or (0, 0)
+        return {'total_bytes': total_bytes, 'file_count': file_count}
+
+    def files(self, directory: str, max_depth: Optional[int] = None,
+              exclude: Optional[List[str]] = None) -> Optional[List[Tuple[str, int, float]]]:
+        """``(relative_path, size, mtime)`` for files under ``directory``
+
+        Same depth and exclude semantics as ``walk_files``.
+        """
+        path = os.path.abspath(directory)
+        if not self.covers(path):
+            return None
+        with self._lock:
+            if max_depth == 0:
+                rows = self._conn.execute('SELECT path, size, mtime FROM files WHERE dir = ?', (path,)).fetchall()
+            else:
+                rows = self._conn.execute('SELECT path, size, mtime FROM files WHERE path >= ? AND path < ?',
+                                          _subtree(path)).fetchall()
+        prefix = len(path.rstrip('/')) + 1
+        result = []
+        for file_path, size, mtime in rows:
+            rel = file_path[prefix:]
+            if max_depth is not None and rel.count('/') > max_depth:
+                continue
+            if exclude and any(fnmatch.fnmatch(part, pattern) for part in rel.split('/') for pattern in exclude):
+                continue
+            result.append((rel, size, mtime))
+        return result
+
+    def older_than(self, directory: str, cutoff: float,
+                   extensions: Optional[List[str]] = None) -> Optional[List[Tuple[str, int]]]:
+        """``(absolute_path, size)`` of files under ``directory`` last modified before ``cutoff``"""
+        path = os.path.abspath(directory)
+        if not self.covers(path):
+            return None
+        query = 'SELECT path, size FROM files WHERE path >= ? AND path < ? AND mtime < ?'
+        params = list(_subtree(path)) + [cutoff]
+        if extensions:
+            query += f" AND ext IN ({','.join('?' * len(extensions))})"
+            params.extend(extensions)
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def forget(self, paths: Iterable[str]) -> None:
+        """Drop files the caller just deleted, ahead of their inotify events"""
+        with self._lock:
+            for path in paths:
+                self._drop_file(os.path.abspath(path))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            if not self.writer:
+                self._sync_roots()
+            roots = {}
+            for path, info in self._roots.items():
+                row = self._conn.execute('SELECT total_bytes, file_count FROM dirs WHERE path = ?', (path,)).fetchone()
+                roots[path] = {
+                    'ready': info['ready'],
+                    'mode': info['mode'],
+                    'last_reconcile': info['last_reconcile'],
+                    'total_bytes': row[0] if row else 0,
+                    'file_count': row[1] if row else 0
+                }
+            return {
+                'db_path': self.db_path,
+                'running': self._thread is not None,
+                'inotify': self._inotify is not None,
+                'watches': len(self._wd_paths),
+                'events_processed': self.events_processed,
+                'reconcile_interval': self.reconcile_interval,
+                'roots': roots
+            }
+
+    # -- writer thread -----------------------------------------------------
+
+    def _sync_roots(self) -> None:
+        """Adopt roots, scans and rescan requests recorded by other processes (lock held)"""
+        for path, last_reconcile in self._conn.execute('SELECT path, last_reconcile FROM roots').fetchall():
+            if path not in self._roots:
+                if self._outer_root(path) is not None:
+                    continue
+                self._add_root(path)
+            info = self._roots[path]
+            if self.writer:
+                if last_reconcile is None and info['last_reconcile'] is not None and path not in self._pending_roots:
+                    self._pending_roots.append(path)
+            else:
+                info['ready'] = last_reconcile is not None
+                info['last_reconcile'] = last_reconcile
+                info['mode'] = 'reader'
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                self._sync_roots()
+                pending, self._pending_roots = self._pending_roots, []
+                due = [path for path, info in self._roots.items()
+                       if info['last_reconcile'] is None
+                       or time.time() - info['last_reconcile'] >= self.reconcile_interval]
+            for root in dict.fromkeys(pending + due):
+                if self._stop.is_set():
+                    return
+                self._reconcile_root(root)
+
+            try:
+                if self._inotify is not None:
+                    self._handle_events(self._inotify.read_events(timeout=1.0))
+                else:
+                    self._wake.wait(timeout=1.0)
+                self._wake.clear()
+            except Exception as e:
+                log.error("File index error: %s", e)
+
+    def _reconcile_root(self, root: str) -> None:
+        started = time.perf_counter()
+        try:
+            self._sync_tree(root)
+        except Exception as e:
+            log.error("File index reconcile of %s failed: %s", root, e)
+            return
+        with self._lock:
+            info = self._roots.get(root)
+            if info is None:
+                return
+            info['ready'] = True
+            info['last_reconcile'] = time.time()
+            self._conn.execute('UPDATE roots SET last_reconcile = ? WHERE path = ?', (info['last_reconcile'], root))
+        log.info("File index reconciled %s in %.2fs", root, time.perf_counter() - started)
+
+    def _handle_events(self, events: List[Tuple[int, int, int, str]]) -> None:
+        # Repeated writes to one file collapse into a single stat per batch
+        touched = {}
+        for wd, mask, cookie, name in events:
+            self.events_processed += 1
+            if mask & IN_Q_OVERFLOW:
+                log.info("inotify queue overflowed, reconciling")
+                self.reconcile()
+                continue
+            directory = self._wd_paths.get(wd)
+            if mask & IN_IGNORED:
+                self._forget_watch(wd)
+                continue
+            if directory is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if directory in self._roots:
+                    self.reconcile(directory)
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if mask & IN_ISDIR:
+                self._refresh_files(touched)
+                touched = {}
+                if mask & (IN_MOVED_FROM | IN_DELETE):
+                    self._unwatch_tree(path)
+                # New, moved-in or removed directory: bring its subtree in line
+                self._sync_tree(path)
+            else:
+                touched[path] = True
+        self._refresh_files(touched)
+
+    def _refresh_files(self, paths: Dict[str, bool]) -> None:
+        updates = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                updates.append((path, st if stat_module.S_ISREG(st.st_mode) else None))
+            except OSError:
+                updates.append((path, None))
+        if not updates:
+            return
+        with self._lock, self._transaction():
+            for path, st in updates:
+                if st is None:
+                    self._drop_file(path)
+                else:
+                    self._put_file(path, st.st_size, st.st_mtime)
+
+    def _sync_tree(self, path: str) -> None:
+        """Rescan ``path`` and apply the difference to files and dirs"""
+        with self._lock:
+            root = self._outer_root(path)
+        if root is None:
+            return
+
+        fresh = {}
+        totals: Dict[str, List[int]] = {}
+        if os.path.isdir(path) and not os.path.islink(path):
+            ondir = self._add_watch if self._inotify is not None else None
+            for entry, st in walk_files(path, ondir=ondir):
+                fresh[entry.path] = (st.st_size, st.st_mtime)
+                for directory in _ancestors(os.path.dirname(entry.path), path):
+                    bucket = totals.setdefault(directory, [0, 0])
+                    bucket[0] += st.st_size
+                    bucket[1] += 1
+
+        with self._lock, self._transaction():
+            conn = self._conn
+            old = {row[0]: (row[1], row[2]) for row in
+                   conn.execute('SELECT path, size, mtime FROM files WHERE path >= ? AND path < ?', _subtree(path))}
+            gone = [(file_path,) for file_path in old if file_path not in fresh]
+            changed = [(file_path, os.path.dirname(file_path), os.path.splitext(file_path)[1], size, mtime)
+                       for file_path, (size, mtime) in fresh.items() if old.get(file_path) != (size, mtime)]
+            conn.executemany('DELETE FROM files WHERE path = ?', gone)
+            conn.executemany('INSERT OR REPLACE INTO files (path, dir, ext, size, mtime) VALUES (?, ?, ?, ?, ?)',
+                             changed)
+
+            # Replace the subtree's aggregates and pass the net change up to the root
+            previous = conn.execute('SELECT total_bytes, file_count FROM dirs WHERE path = ?', (path,)).fetchone()
+            conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (path,) + _subtree(path))
+            conn.executemany('INSERT INTO dirs (path, total_bytes, file_count) VALUES (?, ?, ?)',
+                             [(directory, bucket[0], bucket[1]) for directory, bucket in totals.items()])
+            new_bytes, new_count = totals.get(path, (0, 0))
+            old_bytes, old_count = previous or (0, 0)
+            if path != root:
+                self._propagate(os.path.dirname(path), root, new_bytes - old_bytes, new_count - old_count)
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute('BEGIN')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def _put_file(self, path: str, size: int, mtime: float) -> None:
+        """Insert or update one file and adjust its ancestors (lock held)"""
+        root = self._outer_root(path)
+        if root is None:
+            return
+        row = self._conn.execute('SELECT size FROM files WHERE path = ?', (path,)).fetchone()
+        self._conn.execute('INSERT OR REPLACE INTO files (path, dir, ext, size, mtime) VALUES (?, ?, ?, ?, ?)',
+                           (path, os.path.dirname(path), os.path.splitext(path)[1], size, mtime))
+        if row is None:
+            self._propagate(os.path.dirname(path), root, size, 1)
+        elif row[0] != size:
+            self._propagate(os.path.dirname(path), root, size - row[0], 0)
+
+    def _drop_file(self, path: str) -> None:
+        """Remove one file and adjust its ancestors (lock held)"""
+        row = self._conn.execute('SELECT size FROM files WHERE path = ?', (path,)).fetchone()
+        root = self._outer_root(path)
+        if row is None or root is None:
+            return
+        self._conn.execute('DELETE FROM files WHERE path = ?', (path,))
+        self._propagate(os.path.dirname(path), root, -row[0], -1)
+
+    def _propagate(self, directory: str, root: str, delta_bytes: int, delta_count: int) -> None:
+        if not delta_bytes and not delta_count:
+            return
+        self._conn.executemany(
+            'INSERT INTO dirs (path, total_bytes, file_count) VALUES (?, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET total_bytes = total_bytes + excluded.total_bytes, '
+            'file_count = file_count + excluded.file_count',
+            [(ancestor, delta_bytes, delta_count) for ancestor in _ancestors(directory, root)])
+
+    def _add_watch(self, directory: str) -> None:
+        if directory in self._path_wds:
+            return
+        try:
+            wd = self._inotify.add_watch(directory)
+        except OSError as e:
+            with self._lock:
+                root = self._outer_root(directory)
+                if root is None or self._roots[root]['mode'] == 'polling':
+                    return
+                self._roots[root]['mode'] = 'polling'
+            # Usually fs.inotify.max_user_watches; the periodic reconcile still covers it
+            log.warning("Can't watch %s (%s); %s falls back to polling", directory, e, root)
+            return
+        self._wd_paths[wd] = directory
+        self._path_wds[directory] = wd
+
+    def _unwatch_tree(self, path: str) -> None:
+        low, high = _subtree(path)
+        for directory in [d for d in self._path_wds if d == path or low <= d < high]:
+            wd = self._path_wds.pop(directory)
+            self._wd_paths.pop(wd, None)
+            self._inotify.rm_watch(wd)
+
+    def _forget_watch(self, wd: int) -> None:
+        directory = self._wd_paths.pop(wd, None)
+        if directory is not None and self._path_wds.get(directory) == wd:
+            del self._path_wds[directory]
+
+    # -- roots -------------------------------------------------------------
+
+    def _add_root(self, path: str) -> None:
+        """Register a root, absorbing any existing roots nested inside it (lock held)"""
+        low, high = _subtree(path)
+        for nested in [root for root in self._roots if low <= root < high]:
+            del self._roots[nested]
+            self._conn.execute('DELETE FROM roots WHERE path = ?', (nested,))
+        self._roots[path] = {'ready': False, 'last_reconcile': None,
+                             'mode': 'inotify' if self._inotify is not None else 'polling'}
+
+    def _outer_root(self, path: str) -> Optional[str]:
+        for root in self._roots:
+            if path == root or path.startswith(root.rstrip('/') + '/'):
+                return root
+        return None
@@ -4,100 +4,773 @@ Handles file operations, cleanup, and organization
 """
 
 import os
+import errno
 import shutil
 import json
+import base64
+import hashlib
+import heapq
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
+
+from file_walker import walk_files, walk_sorted
+from log import get_logger
+from telemetry import stage, timed
+
+log = get_logger('file_manager')
+
+BACKUP_MANIFEST = '.autoflow-backup.json'
+LATEST_SNAPSHOT = 'latest'
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+# organize_by_extension state lives in a dot-directory so it is never organized itself
+ORGANIZE_STATE_DIR = '.autoflow-organize'
+ORGANIZE_JOURNAL = 'journal.jsonl'
+ORGANIZE_DISPLACED = 'displaced'
+# Journals of earlier runs, kept as <run>.jsonl when a new run starts
+ORGANIZE_HISTORY = 'history'
+COLLISION_POLICIES = ('rename', 'skip', 'overwrite', 'error')
+JOURNAL_FLUSH_EVERY = 1000
+
+
+def _organize_run_id() -> str:
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def _file_digest(path: str) -> str:
+    """BLAKE2b digest of a file's contents"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _zero_copy(src: str, dst: str) -> int:
+    """Copy file contents in the kernel where possible
+    
+    Tries copy_file_range (reflinks/server-side copy on supporting
+    filesystems), then sendfile, then a userspace copy. Returns bytes copied;
+    raises ``OSError`` if fewer than the source's size were written (the
+    source shrank or the copy stopped early).
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        for kernel_copy in ('copy_file_range', 'sendfile'):
+            func = getattr(os, kernel_copy, None)
+            if func is None:
+                continue
+            copied = 0
+            try:
+                while copied < size:
+                    if kernel_copy == 'copy_file_range':
+                        sent = func(fsrc.fileno(), fdst.fileno(), min(COPY_CHUNK_SIZE, size - copied))
+                    else:
+                        sent = func(fdst.fileno(), fsrc.fileno(), copied, min(COPY_CHUNK_SIZE, size - copied))
+                    if sent == 0:
+                        break
+                    copied += sent
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF) or copied:
+                    raise
+                continue
+            break
+        else:
+            shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+            copied = fdst.tell()
+        if copied != size:
+            raise OSError(errno.EIO, f"Short copy: {copied} of {size} bytes", src)
+        return copied
+
+
+def _discard_snapshot(report: Dict) -> None:
+    """Remove a half-written backup snapshot so it is never mistaken for a complete one"""
+    if report['snapshot']:
+        shutil.rmtree(report['snapshot'], ignore_errors=True)
+        report['snapshot'] = None
+
+
+def _copy_move(src: str, dst: str) -> None:
+    """Move across filesystems: kernel-side copy, then unlink the source"""
+    _zero_copy(src, dst)
+    shutil.copystat(src, dst)
+    os.unlink(src)
+
+
+def _move_file(src: str, dst: str) -> None:
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        _copy_move(src, dst)
+
+
+class _RateLimiter:
+    """Token bucket shared by worker threads"""
+    
+    def __init__(self, rate: float):
+        self.rate = float(rate)
+        self.allowance = self.rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            if self.allowance >= 1:
+                self.allowance -= 1
+                return
+            wait = (1 - self.allowance) / self.rate
+            self.allowance = 0.0
+            self.last = now + wait
+        time.sleep(wait)
+
+
+class _Journal:
+    """Append-only JSON Lines log of an organize run"""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+        self._pending = 0
+    
+    @staticmethod
+    def read(path: Path) -> List[Dict]:
+        records = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A torn final line from an interrupted write
+                    break
+        return records
+    
+    def append(self, record: Dict, sync: bool = False) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(record) + '\n')
+        self._pending += 1
+        if sync or self._pending >= JOURNAL_FLUSH_EVERY:
+            self.flush(sync)
+    
+    def flush(self, sync: bool = False) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+    
+    def close(self) -> None:
+        if self._file is not None:
+            self.flush(sync=True)
+            self._file.close()
+            self._file = None
+
+
+# Path order compares component lists, matching walk_sorted's directory-by-directory order
+SORT_KEYS = {
+    'path': lambda rel, size, mtime: rel.split('/'),
+    'name': lambda rel, size, mtime: rel.rsplit('/', 1)[-1],
+    'size': lambda rel, size, mtime: size,
+    'modified': lambda rel, size, mtime: mtime,
+}
+
+
+def encode_cursor(state: Dict) -> str:
+    """Opaque, URL-safe continuation token"""
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _valid_sort_key(sort: str, key) -> bool:
+    if sort == 'path':
+        return isinstance(key, list) and all(isinstance(part, str) for part in key)
+    if sort == 'name':
+        return isinstance(key, str)
+    return isinstance(key, (int, float)) and not isinstance(key, bool)
+
+
+def decode_cursor(token: str) -> Dict:
+    """Parse a ``next_cursor``; raises ValueError unless it is one ``iter_files`` could have issued"""
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(state, dict) or state.get('sort') not in SORT_KEYS or not isinstance(state.get('path'), str):
+        raise ValueError("Invalid cursor")
+    # Ranked sorts resume after (key, path); only path order can rebuild the key from the path
+    if 'key' in state or state['sort'] != 'path':
+        if not _valid_sort_key(state['sort'], state.get('key')):
+            raise ValueError("Invalid cursor")
+    return state
+
+
+class FileListing:
+    """Lazily produced page of file records
+    
+    Iterate to get the records; afterwards ``count`` and ``next_cursor``
+    (None when the listing is complete) describe the page.
+    """
+    
+    def __init__(self, records):
+        self._records = records
+        self.count = 0
+        self.next_cursor = None
+    
+    def __iter__(self):
+        with stage('file_manager', 'list'):
+            for record in self._records(self):
+                self.count += 1
+                yield record
+
 
 class FileManager:
-    """File management and organization"""
+    """File management and organization
+    
+    With an ``index`` (a started ``FileIndex``), listings, sizes and cleanup
+    candidates for directories under a watched root come from the index
+    instead of a filesystem walk.
+    """
     
-    def __init__(self, base_path: str = "."):
+    def __init__(self, base_path: str = ".", index=None):
         self.base_path = Path(base_path)
-        print(f"[v0] FileManager initialized at {self.base_path}")
+        self.index = index
+        log.debug("FileManager initialized at %s", self.base_path)
     
-    def list_files(self, directory: str = None, recursive: bool = False) -> List[Dict]:
+    @timed('file_manager', 'list')
+    def list_files(self, directory: str = None, recursive: bool = False, max_depth: int = None,
+                   exclude: List[str] = None, threads: int = 0) -> List[Dict]:
         """List files in directory"""
         target_dir = self.base_path / directory if directory else self.base_path
-        print(f"[v0] Listing files in {target_dir}")
+        log.debug("Listing files in %s", target_dir)
         
+        if not recursive:
+            max_depth = 0
         files = []
-        pattern = '**/*' if recursive else '*'
-        
-        for file_path in target_dir.glob(pattern):
-            if file_path.is_file():
-                stat = file_path.stat()
-                files.append({
-                    'name': file_path.name,
-                    'path': str(file_path),
-                    'size_bytes': stat.st_size,
-                    'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                    'type': file_path.suffix
-                })
-        
-        print(f"[v0] Found {len(files)} files")
+        
+        indexed = self.index.files(target_dir, max_depth=max_depth, exclude=exclude) if self.index else None
+        if indexed is not None:
+            for rel, size, mtime in indexed:
+                files.append(self._file_record(os.path.join(str(target_dir), rel), size, mtime))
+        else:
+            for entry, stat in walk_files(target_dir, max_depth=max_depth, exclude=exclude, threads=threads):
+                files.append(self._file_record(entry.path, stat.st_size, stat.st_mtime))
+        
+        log.debug("Found %s files", len(files))
         return files
     
+    def iter_files(self, directory: str = None, recursive: bool = False, sort: str = 'path',
+                   descending: bool = False, limit: int = None, cursor: str = None,
+                   extensions: List[str] = None, min_size: int = None, max_size: int = None,
+                   min_age_days: float = None, max_age_days: float = None,
+                   exclude: List[str] = None, max_depth: int = None, threads: int = 0) -> FileListing:
+        """Filtered, sorted, paginated file listing that never builds the full list
+        
+        Ascending ``path`` order streams straight from a sorted directory walk
+        and resumes from the cursor without revisiting earlier directories.
+        Other orders (and any order answered from the index) keep only the
+        best ``limit + 1`` matches in a heap; their cursor records the last
+        (key, path) so the next page starts after it. Those full walks scan
+        directories on ``threads`` threads when it is above 0; the streamed
+        walk has to visit them in order and ignores it.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort '{sort}'. Use one of: {', '.join(SORT_KEYS)}")
+        if limit is not None and limit < 1:
+            raise ValueError("'limit' must be at least 1")
+        target_dir = self.base_path / directory if directory else self.base_path
+        state = decode_cursor(cursor) if cursor else {}
+        if state and (state.get('sort') != sort or state.get('desc') != descending):
+            raise ValueError("Cursor was issued for a different sort order")
+        if not recursive:
+            max_depth = 0
+        
+        now = time.time()
+        extensions = {ext.lower() for ext in extensions} if extensions else None
+        newest = now - min_age_days * 86400 if min_age_days is not None else None
+        oldest = now - max_age_days * 86400 if max_age_days is not None else None
+        
+        def matches(rel, size, mtime):
+            if extensions is not None and os.path.splitext(rel)[1].lower() not in extensions:
+                return False
+            if min_size is not None and size < min_size:
+                return False
+            if max_size is not None and size > max_size:
+                return False
+            if newest is not None and mtime > newest:
+                return False
+            if oldest is not None and mtime < oldest:
+                return False
+            return True
+        
+        indexed = self.index.files(target_dir, max_depth=max_depth, exclude=exclude) if self.index else None
+        streaming = sort == 'path' and not descending and indexed is None
+        if indexed is not None:
+            candidates = ((rel, os.path.join(str(target_dir), rel), size, mtime)
+                          for rel, size, mtime in indexed if matches(rel, size, mtime))
+        elif not streaming and threads and threads > 0:
+            root = str(target_dir)
+            candidates = ((os.path.relpath(entry.path, root), entry.path, stat.st_size, stat.st_mtime)
+                          for entry, stat in walk_files(root, max_depth=max_depth, exclude=exclude, threads=threads)
+                          if matches(os.path.relpath(entry.path, root), stat.st_size, stat.st_mtime))
+        else:
+            start_after = state.get('path') if streaming else None
+            candidates = ((rel, entry.path, stat.st_size, stat.st_mtime) for rel, entry, stat
+                          in walk_sorted(target_dir, start_after=start_after, max_depth=max_depth, exclude=exclude)
+                          if matches(rel, stat.st_size, stat.st_mtime))
+        
+        def streamed(listing):
+            last = None
+            for rel, path, size, mtime in candidates:
+                if limit is not None and listing.count >= limit:
+                    listing.next_cursor = encode_cursor({'sort': sort, 'desc': descending, 'path': last})
+                    return
+                last = rel
+                yield self._file_record(path, size, mtime)
+        
+        def ranked(listing):
+            key_fn = SORT_KEYS[sort]
+            # Ties on the key fall back to the path so (key, path) is a total order for cursors
+            keyed = ((key_fn(rel, size, mtime), rel, path, size, mtime) for rel, path, size, mtime in candidates)
+            if state:
+                # Cursors from a streamed walk carry only the path
+                key = state['key'] if 'key' in state else key_fn(state['path'], 0, 0)
+                after = (key, state['path'])
+                keyed = (item for item in keyed
+                         if ((item[0], item[1]) < after if descending else (item[0], item[1]) > after))
+            if limit is None:
+                page = sorted(keyed, key=lambda item: (item[0], item[1]), reverse=descending)
+                more = False
+            else:
+                select = heapq.nlargest if descending else heapq.nsmallest
+                page = select(limit + 1, keyed, key=lambda item: (item[0], item[1]))
+                more = len(page) > limit
+                page = page[:limit]
+            for key, rel, path, size, mtime in page:
+                yield self._file_record(path, size, mtime)
+            if more:
+                key, rel = page[-1][0], page[-1][1]
+                listing.next_cursor = encode_cursor({'sort': sort, 'desc': descending, 'key': key, 'path': rel})
+        
+        return FileListing(streamed if streaming else ranked)
+    
+    @staticmethod
+    def _file_record(path: str, size: int, mtime: float) -> Dict:
+        name = os.path.basename(path)
+        return {
+            'name': name,
+            'path': path,
+            'size_bytes': size,
+            'modified': datetime.fromtimestamp(mtime).isoformat(),
+            'type': os.path.splitext(name)[1]
+        }
+    
     def cleanup_old_files(self, directory: str, days: int = 30, extensions: List[str] = None) -> int:
         """Remove files older than specified days"""
-        print(f"[v0] Cleaning up files older than {days} days in {directory}")
+        plan = self.plan_cleanup(directory, days, extensions)
+        return self.execute_cleanup(plan)['deleted']
+    
+    @timed('file_manager', 'plan_cleanup')
+    def plan_cleanup(self, directory: str, days: int = 30, extensions: List[str] = None) -> Dict:
+        """Dry run: collect the files ``cleanup_old_files`` would delete
+        
+        Nothing is removed. The plan lists candidate paths and carries
+        counts and byte totals (overall and per extension) for previewing.
+        """
+        log.info("Planning cleanup of files older than %s days in %s", days, directory)
         target_dir = self.base_path / directory
-        deleted_count = 0
-        cutoff_date = datetime.now() - timedelta(days=days)
+        cutoff = (datetime.now() - timedelta(days=days)).timestamp()
+        plan = {
+            'directory': str(target_dir),
+            'days': days,
+            'cutoff': datetime.fromtimestamp(cutoff).isoformat(),
+            'cutoff_timestamp': cutoff,
+            'files': [],
+            'file_count': 0,
+            'total_bytes': 0,
+            'by_extension': {}
+        }
         
-        for file_path in target_dir.glob('**/*'):
-            if file_path.is_file():
-                # Check extension filter
-                if extensions and file_path.suffix not in extensions:
+        def add(path, size):
+            plan['files'].append(path)
+            plan['file_count'] += 1
+            plan['total_bytes'] += size
+            bucket = plan['by_extension'].setdefault(os.path.splitext(path)[1] or 'no_extension',
+                                                     {'count': 0, 'bytes': 0})
+            bucket['count'] += 1
+            bucket['bytes'] += size
+        
+        indexed = self.index.older_than(target_dir, cutoff, extensions) if self.index else None
+        if indexed is not None:
+            for path, size in indexed:
+                add(path, size)
+        else:
+            for entry, stat in walk_files(target_dir):
+                if extensions and os.path.splitext(entry.name)[1] not in extensions:
                     continue
-                
-                # Check file age
-                file_time = datetime.fromtimestamp(file_path.stat().st_mtime)
-                if file_time < cutoff_date:
-                    try:
-                        file_path.unlink()
-                        print(f"[v0] Deleted: {file_path.name}")
-                        deleted_count += 1
-                    except Exception as e:
-                        print(f"[v0] Error deleting {file_path.name}: {str(e)}")
-        
-        print(f"[v0] Deleted {deleted_count} files")
-        return deleted_count
-    
-    def organize_by_extension(self, directory: str = None) -> bool:
+                if stat.st_mtime < cutoff:
+                    add(entry.path, stat.st_size)
+        
+        log.info("Cleanup plan: %s files, %s bytes", plan['file_count'], plan['total_bytes'])
+        return plan
+    
+    def execute_cleanup(self, plan: Dict, workers: int = 4, batch_size: int = 500,
+                        max_files_per_second: float = None,
+                        progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """Delete the files in a ``plan_cleanup`` plan
+        
+        Batches of ``batch_size`` paths are unlinked on ``workers`` threads;
+        ``max_files_per_second`` caps the combined unlink rate so a large
+        cleanup doesn't starve other I/O on the host. Each file's mtime is
+        re-checked first, so files modified after planning are kept.
+        ``progress(done, total)`` is called after each batch; an exception
+        raised from it stops the remaining batches.
+        """
+        started = time.perf_counter()
+        cutoff = plan['cutoff_timestamp']
+        paths = plan['files']
+        total = len(paths)
+        limiter = _RateLimiter(max_files_per_second) if max_files_per_second else None
+        report = {'deleted': 0, 'bytes_freed': 0, 'skipped': 0, 'errors': []}
+        log.info("Deleting %s files on %s threads", total, workers)
+        
+        def delete_batch(batch):
+            deleted, freed, skipped, errors = [], 0, 0, []
+            for path in batch:
+                if limiter:
+                    limiter.acquire()
+                try:
+                    st = os.stat(path)
+                    if st.st_mtime >= cutoff:
+                        skipped += 1
+                        continue
+                    os.unlink(path)
+                    deleted.append(path)
+                    freed += st.st_size
+                except FileNotFoundError:
+                    skipped += 1
+                except OSError as e:
+                    errors.append(f"{path}: {str(e)}")
+            return deleted, freed, skipped, errors
+        
+        batches = [paths[i:i + batch_size] for i in range(0, total, max(batch_size, 1))]
+        done = 0
+        executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='cleanup')
+        try:
+            for deleted, freed, skipped, errors in executor.map(delete_batch, batches):
+                report['deleted'] += len(deleted)
+                report['bytes_freed'] += freed
+                report['skipped'] += skipped
+                report['errors'].extend(errors)
+                if self.index:
+                    self.index.forget(deleted)
+                done += len(deleted) + skipped + len(errors)
+                if progress:
+                    progress(done, total)
+        finally:
+            # On cancellation, batches not yet started are dropped
+            executor.shutdown(wait=True, cancel_futures=True)
+        
+        report['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        log.info("Deleted %s files (%s bytes), %s skipped, %s errors",
+                 report['deleted'], report['bytes_freed'], report['skipped'], len(report['errors']))
+        return report
+    
+    def organize_by_extension(self, directory: str = None, collisions: str = 'rename',
+                              workers: int = 4) -> bool:
         """Organize files into folders by extension"""
+        try:
+            return self.organize_files(directory, collisions=collisions, workers=workers)['success']
+        except Exception as e:
+            log.error("Error organizing files: %s", e)
+            return False
+    
+    @timed('file_manager', 'plan_organize')
+    def plan_organize(self, directory: str = None, collisions: str = 'rename', run: Optional[str] = None) -> Dict:
+        """Work out every move ``organize_files`` would make, without moving anything
+        
+        ``collisions`` decides what happens when ``<ext>/<name>`` already
+        exists: ``rename`` picks ``<stem>_<n><ext>``, ``skip`` leaves the file
+        in place, ``overwrite`` replaces it (keeping the old file under
+        ``displaced/<run>/`` so the run can be undone) and ``error`` rejects
+        the whole plan.
+        """
+        if collisions not in COLLISION_POLICIES:
+            raise ValueError(f"Unknown collision policy '{collisions}'. Use one of: {', '.join(COLLISION_POLICIES)}")
+        target_dir = self.base_path / directory if directory else self.base_path
+        log.info("Planning organization of %s by extension", target_dir)
+        
+        with os.scandir(target_dir) as it:
+            # Dotfiles are organized too (the old Path.glob('*') loop matched them); only our state dir is left out
+            entries = sorted((entry for entry in it if entry.name != ORGANIZE_STATE_DIR), key=lambda e: e.name)
+        names = {entry.name for entry in entries}
+        files = [entry for entry in entries if entry.is_file()]
+        
+        run = run or _organize_run_id()
+        plan = {'directory': str(target_dir), 'run': run, 'collisions': collisions, 'moves': [],
+                'directories': [], 'skipped': [], 'errors': [], 'renamed': 0, 'overwritten': 0}
+        existing = {}
+        for entry in files:
+            ext = os.path.splitext(entry.name)[1][1:] or 'no_extension'
+            if ext not in existing:
+                ext_dir = target_dir / ext
+                if ext in names and not ext_dir.is_dir():
+                    existing[ext] = None
+                else:
+                    existing[ext] = set(os.listdir(ext_dir)) if ext_dir.is_dir() else set()
+                    if not ext_dir.is_dir():
+                        plan['directories'].append(ext)
+            taken = existing[ext]
+            if taken is None:
+                plan['errors'].append(f"{entry.name}: '{ext}' exists and is not a directory")
+                continue
+            
+            name, displaced = entry.name, None
+            if name in taken:
+                if collisions == 'skip':
+                    plan['skipped'].append(entry.name)
+                    continue
+                if collisions == 'rename':
+                    stem, suffix = os.path.splitext(entry.name)
+                    n = 1
+                    while f"{stem}_{n}{suffix}" in taken:
+                        n += 1
+                    name = f"{stem}_{n}{suffix}"
+                    plan['renamed'] += 1
+                elif collisions == 'overwrite':
+                    displaced = f"{ORGANIZE_STATE_DIR}/{ORGANIZE_DISPLACED}/{run}/{ext}/{name}"
+                    plan['overwritten'] += 1
+                else:
+                    plan['errors'].append(f"{entry.name}: {ext}/{name} already exists")
+                    continue
+            taken.add(name)
+            plan['moves'].append({'src': entry.name, 'dst': f"{ext}/{name}", 'displaced': displaced})
+        
+        if collisions == 'error' and plan['errors']:
+            raise ValueError(f"{len(plan['errors'])} name collisions, e.g. {plan['errors'][0]}")
+        log.info("Organize plan: %s moves, %s new folders, %s skipped",
+                 len(plan['moves']), len(plan['directories']), len(plan['skipped']))
+        return plan
+    
+    def organize_files(self, directory: str = None, collisions: str = 'rename', workers: int = 4,
+                       resume: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """Planned bulk version of ``organize_by_extension``
+        
+        All target folders are created first. Moves within one filesystem are
+        ``os.rename`` calls; folders on another device (e.g. a mount point)
+        get a copy + unlink on ``workers`` threads. Every planned move is
+        journaled under ``.autoflow-organize/`` before anything changes and
+        each completed move is appended, so an interrupted run can be
+        finished with ``resume=True`` or reverted with ``undo_organize``.
+        The journal of an earlier, finished run is moved to ``history/``.
+        Failed moves are reported and don't stop the rest.
+        """
+        started = time.perf_counter()
         target_dir = self.base_path / directory if directory else self.base_path
-        print(f"[v0] Organizing files in {target_dir} by extension")
+        journal_path = target_dir / ORGANIZE_STATE_DIR / ORGANIZE_JOURNAL
+        records = _Journal.read(journal_path) if journal_path.exists() else []
+        interrupted = bool(records) and records[-1].get('type') != 'complete'
         
+        if resume:
+            if not interrupted:
+                raise ValueError("No interrupted organize run to resume")
+            header = records[0]
+            moves = [record for record in records if record.get('type') == 'move']
+            done = {record['id'] for record in records if record.get('type') == 'done'}
+            plan = {'directory': str(target_dir), 'run': header.get('run'), 'collisions': header['collisions'],
+                    'directories': header['directories'], 'skipped': [], 'errors': [],
+                    'renamed': header.get('renamed', 0), 'overwritten': header.get('overwritten', 0)}
+            journal = _Journal(journal_path)
+            log.info("Resuming organize of %s: %s moves left", target_dir, len(moves) - len(done))
+        else:
+            if interrupted:
+                raise ValueError("An interrupted organize run exists; resume or undo it first")
+            plan = self.plan_organize(directory, collisions)
+            moves = [dict(move, id=i) for i, move in enumerate(plan['moves'])]
+            done = set()
+            if records:
+                self._archive_journal(journal_path, records[0])
+            journal = _Journal(journal_path)
+            journal.append({'type': 'header', 'run': plan['run'], 'directory': str(target_dir),
+                            'collisions': collisions,
+                            'directories': plan['directories'], 'renamed': plan['renamed'],
+                            'overwritten': plan['overwritten'], 'created': datetime.now().isoformat()})
+            for move in moves:
+                journal.append(dict(move, type='move'))
+            journal.flush(sync=True)
+        
+        report = {
+            'success': False,
+            'moved': 0,
+            'skipped': len(plan['skipped']),
+            'renamed': plan['renamed'],
+            'overwritten': plan['overwritten'],
+            'directories_created': 0,
+            'cross_device': 0,
+            'errors': list(plan['errors']),
+            'journal': str(journal_path),
+            'run': plan['run']
+        }
         try:
-            for file_path in target_dir.glob('*'):
-                if file_path.is_file():
-                    ext = file_path.suffix[1:] or 'no_extension'
-                    ext_dir = target_dir / ext
-                    ext_dir.mkdir(exist_ok=True)
-                    
-                    dest_path = ext_dir / file_path.name
-                    shutil.move(str(file_path), str(dest_path))
-                    print(f"[v0] Moved {file_path.name} to {ext}/")
+            for ext in plan['directories']:
+                try:
+                    (target_dir / ext).mkdir()
+                    report['directories_created'] += 1
+                except FileExistsError:
+                    pass
             
-            print("[v0] File organization completed")
-            return True
-        except Exception as e:
-            print(f"[v0] Error organizing files: {str(e)}")
-            return False
+            base_dev = os.stat(target_dir).st_dev
+            same_device, cross_device = [], []
+            device_of = {}
+            for move in moves:
+                if move['id'] in done:
+                    continue
+                folder = move['dst'].split('/', 1)[0]
+                if folder not in device_of:
+                    device_of[folder] = os.stat(target_dir / folder).st_dev
+                (same_device if device_of[folder] == base_dev else cross_device).append(move)
+            report['cross_device'] = len(cross_device)
+            total = len(same_device) + len(cross_device)
+            completed = 0
+            
+            def finished(move, error):
+                nonlocal completed
+                completed += 1
+                if error:
+                    report['errors'].append(error)
+                else:
+                    report['moved'] += 1
+                    journal.append({'type': 'done', 'id': move['id']})
+                if progress and (completed % JOURNAL_FLUSH_EVERY == 0 or completed == total):
+                    progress(completed, total)
+            
+            for move in same_device:
+                finished(move, self._apply_move(target_dir, move, os.rename))
+            
+            with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+                results = executor.map(lambda move: self._apply_move(target_dir, move, _copy_move), cross_device)
+                for move, error in zip(cross_device, results):
+                    finished(move, error)
+            
+            journal.append({'type': 'complete'}, sync=True)
+            report['success'] = not report['errors']
+            log.info("Organized %s files into %s new folders", report['moved'], len(plan['directories']))
+        except OSError as e:
+            # Anything else (including cancellation from ``progress``) propagates
+            # and leaves the journal open for resume/undo
+            log.error("Error organizing files: %s", e)
+            report['errors'].append(str(e))
+        finally:
+            journal.close()
+        
+        report['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        return report
     
-    def get_directory_size(self, directory: str = None) -> Dict:
+    @staticmethod
+    def _archive_journal(journal_path: Path, header: Dict) -> None:
+        """Keep a finished run's journal as ``history/<run>.jsonl``"""
+        run = header.get('run') or str(journal_path.stat().st_mtime_ns)
+        history = journal_path.parent / ORGANIZE_HISTORY
+        history.mkdir(exist_ok=True)
+        os.replace(journal_path, history / f"{run}.jsonl")
+    
+    @staticmethod
+    def _apply_move(base: Path, move: Dict, transfer: Callable[[str, str], None]) -> Optional[str]:
+        """Carry out one journaled move; safe to repeat after an interruption"""
+        src, dst = base / move['src'], base / move['dst']
+        try:
+            if not src.exists():
+                # Already moved before a crash, just not journaled as done
+                return None if dst.exists() else f"{move['src']}: source disappeared"
+            if dst.exists():
+                if not move['displaced']:
+                    return f"{move['src']}: {move['dst']} appeared after planning"
+                displaced = base / move['displaced']
+                displaced.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(dst, displaced)
+            transfer(str(src), str(dst))
+            return None
+        except OSError as e:
+            return f"{move['src']}: {str(e)}"
+    
+    def undo_organize(self, directory: str = None,
+                      progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """Revert the last (complete or interrupted) organize run from its journal"""
+        started = time.perf_counter()
+        target_dir = self.base_path / directory if directory else self.base_path
+        journal_path = target_dir / ORGANIZE_STATE_DIR / ORGANIZE_JOURNAL
+        if not journal_path.exists():
+            raise ValueError(f"No organize journal in {target_dir}")
+        records = _Journal.read(journal_path)
+        header = records[0]
+        moves = [record for record in records if record.get('type') == 'move']
+        log.info("Undoing organize of %s (%s journaled moves)", target_dir, len(moves))
+        
+        report = {'success': False, 'restored': 0, 'directories_removed': 0, 'errors': []}
+        # Reverse order so an overwritten file is put back after the file that replaced it leaves
+        for i, move in enumerate(reversed(moves), 1):
+            src, dst = target_dir / move['src'], target_dir / move['dst']
+            try:
+                if dst.exists() and not src.exists():
+                    _move_file(str(dst), str(src))
+                    report['restored'] += 1
+                if move['displaced'] and (target_dir / move['displaced']).exists() and not dst.exists():
+                    _move_file(str(target_dir / move['displaced']), str(dst))
+            except OSError as e:
+                report['errors'].append(f"{move['src']}: {str(e)}")
+            if progress and (i % JOURNAL_FLUSH_EVERY == 0 or i == len(moves)):
+                progress(i, len(moves))
+        
+        for ext in header['directories']:
+            try:
+                (target_dir / ext).rmdir()
+                report['directories_removed'] += 1
+            except OSError:
+                # Not empty (new files arrived) or already gone
+                pass
+        
+        if not report['errors']:
+            journal_path.unlink()
+            state_dir = target_dir / ORGANIZE_STATE_DIR
+            if header.get('run'):
+                shutil.rmtree(state_dir / ORGANIZE_DISPLACED / header['run'], ignore_errors=True)
+            # Files displaced by earlier runs, and their journals, stay
+            for leftover in (state_dir / ORGANIZE_DISPLACED, state_dir):
+                try:
+                    leftover.rmdir()
+                except OSError:
+                    pass
+            report['success'] = True
+        log.info("Restored %s files", report['restored'])
+        report['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        return report
+    
+    @timed('file_manager', 'size')
+    def get_directory_size(self, directory: str = None, threads: int = 0) -> Dict:
         """Calculate directory size"""
         target_dir = self.base_path / directory if directory else self.base_path
-        print(f"[v0] Calculating size of {target_dir}")
+        log.debug("Calculating size of %s", target_dir)
         
         total_size = 0
         file_count = 0
         
-        for file_path in target_dir.rglob('*'):
-            if file_path.is_file():
-                total_size += file_path.stat().st_size
+        indexed = self.index.directory_size(target_dir) if self.index else None
+        if indexed is not None:
+            total_size, file_count = indexed['total_bytes'], indexed['file_count']
+        else:
+            for _, stat in walk_files(target_dir, threads=threads):
+                total_size += stat.st_size
                 file_count += 1
         
         return {
@@ -107,24 +780,211 @@ class FileManager:
             'file_count': file_count
         }
     
-    def backup_directory(self, source: str, destination: str) -> bool:
-        """Backup directory to destination"""
+    def backup_directory(self, source: str, destination: str, incremental: bool = False,
+                         verify_hash: bool = False, workers: int = 4,
+                         progress: Optional[Callable[[int, int], None]] = None) -> bool:
+        """Backup directory to destination
+        
+        With ``incremental=True`` a snapshot is added under ``destination``
+        instead of replacing it; see ``incremental_backup``. ``progress(done,
+        total)`` is called after each file; an exception it raises (e.g. job
+        cancellation) stops the copy and propagates.
+        """
+        if incremental:
+            return self.incremental_backup(source, destination, verify_hash, workers, progress)['success']
+        
         source_path = self.base_path / source
         dest_path = self.base_path / destination
         
-        print(f"[v0] Backing up {source} to {destination}")
+        log.info("Backing up %s to %s", source, destination)
         
         try:
             if dest_path.exists():
                 shutil.rmtree(dest_path)
             
-            shutil.copytree(source_path, dest_path)
-            print("[v0] Backup completed successfully")
+            copy_function = shutil.copy2
+            if progress:
+                total = sum(len(files) for _, _, files in os.walk(source_path))
+                copied = 0
+                
+                def copy_function(src, dst):
+                    nonlocal copied
+                    result = shutil.copy2(src, dst)
+                    copied += 1
+                    progress(copied, total)
+                    return result
+            
+            shutil.copytree(source_path, dest_path, copy_function=copy_function)
+            log.info("Backup completed successfully")
             return True
-        except Exception as e:
-            print(f"[v0] Error during backup: {str(e)}")
+        except OSError as e:
+            log.error("Error during backup: %s", e)
             return False
 
+    @timed('file_manager', 'backup')
+    def incremental_backup(self, source: str, destination: str, verify_hash: bool = False,
+                           workers: int = 4, progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """rsync --link-dest style snapshot backup
+        
+        Each run creates ``destination/<timestamp>/`` and points
+        ``destination/latest`` at it. Files whose size and mtime (and, with
+        ``verify_hash``, content digest) match the previous snapshot's manifest
+        are hard-linked from that snapshot; only changed files are copied, on
+        ``workers`` threads using kernel-side copies. Returns a report of bytes
+        copied versus skipped.
+        
+        A file enters the manifest only once it is safely in the snapshot. If
+        any copy fails, ``latest`` keeps pointing at the previous snapshot, so
+        the next run compares against complete data and retries the failures.
+        
+        ``progress(done, total)`` is called for every file, with ``done`` at 0
+        while the source is still being scanned. An exception it raises (e.g.
+        job cancellation) stops the backup, discards queued copies and
+        propagates, leaving ``latest`` untouched. A run that fails or is
+        cancelled this way removes its partial snapshot directory.
+        """
+        started = time.perf_counter()
+        source_path = self.base_path / source
+        dest_root = self.base_path / destination
+        log.info("Incremental backup of %s to %s", source, destination)
+        
+        report = {
+            'success': False,
+            'snapshot': None,
+            'previous_snapshot': None,
+            'files_total': 0,
+            'files_copied': 0,
+            'files_linked': 0,
+            'bytes_copied': 0,
+            'bytes_skipped': 0,
+            'errors': []
+        }
+        try:
+            if not source_path.is_dir():
+                raise FileNotFoundError(f"Source directory not found: {source_path}")
+            dest_root.mkdir(parents=True, exist_ok=True)
+            
+            previous_dir = None
+            previous_manifest = {}
+            latest = dest_root / LATEST_SNAPSHOT
+            if latest.is_symlink() or latest.is_dir():
+                previous_dir = latest.resolve()
+                manifest_file = previous_dir / BACKUP_MANIFEST
+                if manifest_file.exists():
+                    with open(manifest_file) as f:
+                        previous_manifest = json.load(f)
+                report['previous_snapshot'] = str(previous_dir)
+            
+            snapshot = dest_root / datetime.now().strftime('%Y%m%d-%H%M%S')
+            suffix = 1
+            while snapshot.exists():
+                snapshot = dest_root / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{suffix}"
+                suffix += 1
+            snapshot.mkdir()
+            report['snapshot'] = str(snapshot)
+            
+            manifest = {}
+            to_copy = []
+            for root, dirs, files in os.walk(source_path):
+                rel_root = os.path.relpath(root, source_path)
+                target_root = snapshot if rel_root == '.' else snapshot / rel_root
+                target_root.mkdir(exist_ok=True)
+                for name in list(dirs):
+                    # os.walk lists directory symlinks but doesn't descend; keep them as links
+                    if os.path.islink(os.path.join(root, name)):
+                        os.symlink(os.readlink(os.path.join(root, name)), target_root / name)
+                        dirs.remove(name)
+                for name in files:
+                    src = os.path.join(root, name)
+                    rel = name if rel_root == '.' else os.path.join(rel_root, name)
+                    dst = target_root / name
+                    st = os.stat(src, follow_symlinks=False)
+                    if os.path.islink(src):
+                        os.symlink(os.readlink(src), dst)
+                        continue
+                    
+                    report['files_total'] += 1
+                    if progress:
+                        progress(0, report['files_total'])
+                    previous = previous_manifest.get(rel)
+                    unchanged = previous is not None and previous[0] == st.st_size and previous[1] == st.st_mtime_ns
+                    digest = None
+                    if unchanged and verify_hash:
+                        # Catch edits that kept size and mtime; older manifests may lack digests
+                        digest = _file_digest(src)
+                        previous_digest = previous[2]
+                        if previous_digest is None and (previous_dir / rel).exists():
+                            previous_digest = _file_digest(str(previous_dir / rel))
+                        unchanged = previous_digest == digest
+                    entry = [st.st_size, st.st_mtime_ns, digest]
+                    
+                    if unchanged:
+                        try:
+                            os.link(previous_dir / rel, dst)
+                            manifest[rel] = entry
+                            report['files_linked'] += 1
+                            report['bytes_skipped'] += st.st_size
+                            continue
+                        except OSError:
+                            # Missing in the old snapshot or across devices: copy instead
+                            pass
+                    to_copy.append((src, str(dst), rel, entry))
+            
+            def copy_one(task):
+                src, dst, rel, entry = task
+                try:
+                    copied = _zero_copy(src, dst)
+                    shutil.copystat(src, dst)
+                    return rel, entry, copied, None
+                except OSError as e:
+                    return rel, entry, 0, f"{src}: {str(e)}"
+            
+            executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+            try:
+                done = report['files_linked']
+                for rel, entry, copied, error in executor.map(copy_one, to_copy):
+                    if error:
+                        report['errors'].append(error)
+                    else:
+                        manifest[rel] = entry
+                        report['files_copied'] += 1
+                        report['bytes_copied'] += copied
+                    done += 1
+                    if progress:
+                        progress(done, report['files_total'])
+            finally:
+                # On cancellation, drop the copies that haven't started
+                executor.shutdown(cancel_futures=True)
+            
+            with open(snapshot / BACKUP_MANIFEST, 'w') as f:
+                json.dump(manifest, f)
+            
+            if report['errors']:
+                # Leave "latest" on the last complete snapshot; this one may hold partial files
+                report['incomplete'] = True
+            else:
+                # Repoint "latest" atomically so a failed run never leaves it dangling
+                temp_link = dest_root / f".{LATEST_SNAPSHOT}.tmp"
+                if temp_link.is_symlink() or temp_link.exists():
+                    temp_link.unlink()
+                os.symlink(snapshot.name, temp_link)
+                os.replace(temp_link, latest)
+            
+            report['success'] = not report['errors']
+            log.info("Backup completed: %s copied, %s linked, %s bytes skipped",
+                     report['files_copied'], report['files_linked'], report['bytes_skipped'])
+        except (OSError, ValueError) as e:
+            # Anything else (including cancellation from ``progress``) propagates
+            log.error("Error during backup: %s", e)
+            report['errors'].append(str(e))
+            _discard_snapshot(report)
+        except Exception:
+            _discard_snapshot(report)
+            raise
+        
+        report['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        return report
+
 
 if __name__ == "__main__":
     manager = FileManager()
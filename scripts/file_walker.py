@@ -0,0 +1,191 @@
+"""
+Directory Walker
+Single-pass os.scandir traversal shared by the FileManager operations
+"""
+
+import fnmatch
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+# Symlink policies
+SYMLINKS_SKIP = 'skip'      # ignore every symlink
+SYMLINKS_FILES = 'files'    # report links to files, don't descend into linked dirs (Path.rglob behaviour)
+SYMLINKS_FOLLOW = 'follow'  # also descend into linked dirs, guarding against cycles
+
+WalkResult = Tuple[os.DirEntry, os.stat_result]
+
+
+class _Walker:
+    def __init__(self, max_depth: Optional[int], symlinks: str, exclude: Optional[Iterable[str]],
+                 onerror: Optional[Callable[[OSError], None]], ondir: Optional[Callable[[str], None]] = None):
+        if symlinks not in (SYMLINKS_SKIP, SYMLINKS_FILES, SYMLINKS_FOLLOW):
+            raise ValueError(f"Unknown symlink policy: {symlinks}")
+        self.max_depth = max_depth
+        self.symlinks = symlinks
+        self.exclude = list(exclude or [])
+        self.onerror = onerror
+        self.ondir = ondir
+        self.visited = set()
+
+    def excluded(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.exclude)
+
+    def scan(self, path: str, depth: int) -> Tuple[List[WalkResult], List[Tuple[str, int]]]:
+        """Read one directory: return its files (with stat) and subdirectories to visit"""
+        files, subdirs = [], []
+        if self.ondir:
+            self.ondir(path)
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if self.exclude and self.excluded(entry.name):
+                        continue
+                    try:
+                        # d_type from readdir answers these without a syscall
+                        is_link = entry.is_symlink()
+                        if is_link and self.symlinks == SYMLINKS_SKIP:
+                            continue
+                        if entry.is_dir(follow_symlinks=True):
+                            if is_link and self.symlinks != SYMLINKS_FOLLOW:
+                                continue
+                            if self.max_depth is None or depth < self.max_depth:
+                                if is_link and not self._first_visit(entry):
+                                    continue
+                                subdirs.append((entry.path, depth + 1))
+                        elif entry.is_file(follow_symlinks=True):
+                            # The only stat per file; DirEntry caches it
+                            files.append((entry, entry.stat(follow_symlinks=True)))
+                    except OSError as e:
+                        # Broken links and entries removed mid-walk
+                        if self.onerror:
+                            self.onerror(e)
+        except OSError as e:
+            if self.onerror:
+                self.onerror(e)
+        return files, subdirs
+
+    def _first_visit(self, entry: os.DirEntry) -> bool:
+        st = entry.stat(follow_symlinks=True)
+        key = (st.st_dev, st.st_ino)
+        if key in self.visited:
+            return False
+        self.visited.add(key)
+        return True
+
+
+def walk_files(root: str, max_depth: Optional[int] = None, symlinks: str = SYMLINKS_FILES,
+               exclude: Optional[Iterable[str]] = None, threads: int = 0,
+               onerror: Optional[Callable[[OSError], None]] = None,
+               ondir: Optional[Callable[[str], None]] = None) -> Iterator[WalkResult]:
+    """Yield ``(DirEntry, stat_result)`` for every regular file under ``root``
+
+    One ``scandir`` per directory and one ``stat`` per file; file-type checks
+    come from the directory listing itself. ``max_depth=0`` lists only
+    ``root``'s own files. ``exclude`` holds fnmatch patterns matched against
+    entry names; excluded directories are not descended into. Unreadable
+    entries are skipped (reported to ``onerror`` if given). ``ondir`` is
+    called with each directory's path just before it is listed.
+
+    With ``threads > 0`` directories are scanned concurrently, which hides
+    per-stat latency on network filesystems; results then arrive in no
+    particular order.
+    """
+    walker = _Walker(max_depth, symlinks, exclude, onerror, ondir)
+    if threads and threads > 0:
+        yield from _walk_threaded(walker, str(root), threads)
+        return
+
+    stack = [(str(root), 0)]
+    while stack:
+        path, depth = stack.pop()
+        files, subdirs = walker.scan(path, depth)
+        yield from files
+        # Reverse so directories are visited in listing order
+        stack.extend(reversed(subdirs))
+
+
+def _walk_threaded(walker: _Walker, root: str, threads: int) -> Iterator[WalkResult]:
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='walk') as executor:
+        waiting = deque([(root, 0)])
+        running = set()
+        while waiting or running:
+            # Keep a bounded number of scans in flight so huge trees don't queue millions of futures
+            while waiting and len(running) < threads * 4:
+                path, depth = waiting.popleft()
+                running.add(executor.submit(walker.scan, path, depth))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                waiting.extend(subdirs)
+                yield from files
+
+
+def walk_sorted(root: str, start_after: Optional[str] = None, max_depth: Optional[int] = None,
+                symlinks: str = SYMLINKS_FILES, exclude: Optional[Iterable[str]] = None,
+                onerror: Optional[Callable[[OSError], None]] = None) -> Iterator[Tuple[str, os.DirEntry, os.stat_result]]:
+    """Yield ``(relative_path, DirEntry, stat_result)`` in lexicographic path order
+
+    Each directory is listed and sorted by name; files and subdirectories are
+    interleaved so the overall order is the sort order of the relative path
+    components. That makes ``start_after`` (a relative path previously
+    yielded) a resumable cursor: directories that sort before it are never
+    opened, so continuing a walk costs roughly the depth of the cursor rather
+    than the number of entries already returned.
+    """
+    walker = _Walker(max_depth, symlinks, exclude, onerror)
+    root = str(root)
+    resume = start_after.split('/') if start_after else []
+
+    def listing(path: str, rel_prefix: str, depth: int, resume_parts: List[str]):
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            if onerror:
+                onerror(e)
+            return
+        for entry in entries:
+            name = entry.name
+            if resume_parts:
+                if name < resume_parts[0]:
+                    continue
+                if name == resume_parts[0] and len(resume_parts) == 1:
+                    # The cursor itself was already returned
+                    continue
+            if walker.exclude and walker.excluded(name):
+                continue
+            rel = f"{rel_prefix}{name}"
+            try:
+                is_link = entry.is_symlink()
+                if is_link and walker.symlinks == SYMLINKS_SKIP:
+                    continue
+                if entry.is_dir(follow_symlinks=True):
+                    if is_link and walker.symlinks != SYMLINKS_FOLLOW:
+                        continue
+                    if max_depth is not None and depth >= max_depth:
+                        continue
+                    if is_link and not walker._first_visit(entry):
+                        continue
+                    child_resume = resume_parts[1:] if resume_parts and name == resume_parts[0] else []
+                    yield ('dir', entry.path, rel + '/', depth + 1, child_resume)
+                elif entry.is_file(follow_symlinks=True):
+                    if resume_parts and name <= resume_parts[0]:
+                        continue
+                    yield ('file', rel, entry, entry.stat(follow_symlinks=True))
+            except OSError as e:
+                if onerror:
+                    onerror(e)
+
+    # Explicit stack of per-directory generators instead of recursion
+    stack = [listing(root, '', 0, resume)]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+        elif item[0] == 'dir':
+            _, path, rel_prefix, depth, child_resume = item
+            stack.append(listing(path, rel_prefix, depth, child_resume))
+        else:
+            yield item[1], item[2], item[3]
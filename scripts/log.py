@@ -0,0 +1,123 @@
+"""
+Logging
+Leveled, buffered logging for the API and scripts; records are written to stdout by a background thread
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Optional, Union
+
+ROOT = 'v0'
+FORMAT = '[v0] %(message)s'
+# LOG_LEVEL=OFF: loggers drop every record before it is formatted
+OFF = logging.CRITICAL + 10
+
+_lock = threading.RLock()
+_queue = None
+_handler = None
+_listener = None
+_configured = False
+
+
+def parse_level(level: Union[int, str]) -> int:
+    """``DEBUG``/``INFO``/``WARNING``/``ERROR``/``CRITICAL``/``OFF`` (or a number) to a level"""
+    if isinstance(level, int):
+        return level
+    name = str(level).strip().upper()
+    if name in ('OFF', 'NONE', 'FALSE'):
+        return OFF
+    if name.isdigit():
+        return int(name)
+    value = logging.getLevelName(name)
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level '{level}'. Use DEBUG, INFO, WARNING, ERROR, CRITICAL or OFF")
+    return value
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+        _listener = None
+
+
+def _start_listener() -> None:
+    global _listener
+    _listener = logging.handlers.QueueListener(_queue, _handler)
+    _listener.start()
+
+
+def _after_fork() -> None:
+    # The writer thread doesn't survive fork; records queued by the child need a new one
+    global _listener
+    if _queue is not None:
+        _listener = None
+        _start_listener()
+
+
+def configure(level: Union[int, str, None] = None, buffered: Optional[bool] = None, stream=None) -> None:
+    """(Re)configure the ``v0`` loggers
+
+    ``level`` defaults to ``LOG_LEVEL`` (INFO) and ``buffered`` to
+    ``LOG_BUFFERED`` (true). Buffered loggers only put the record on a queue;
+    a background thread formats and writes it, so callers never block on
+    stdout. Records below the level, or every record with ``OFF``, are
+    dropped by the level check before they are formatted or queued. The
+    call's arguments are still evaluated, so hot paths pass values lazily
+    (``log.debug("Listing %s", path)``) instead of building an f-string.
+    """
+    global _queue, _handler, _configured
+    level = parse_level(level if level is not None else os.environ.get('LOG_LEVEL', 'INFO'))
+    if buffered is None:
+        buffered = os.environ.get('LOG_BUFFERED', 'true').lower() == 'true'
+    with _lock:
+        _stop_listener()
+        root = logging.getLogger(ROOT)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.setLevel(level)
+        root.propagate = False
+        _queue = None
+        if level >= OFF:
+            # NullHandler keeps logging's last-resort stderr handler out of it
+            root.addHandler(logging.NullHandler())
+        else:
+            _handler = logging.StreamHandler(stream or sys.stdout)
+            _handler.setFormatter(logging.Formatter(FORMAT))
+            if buffered:
+                _queue = queue.SimpleQueue()
+                root.addHandler(logging.handlers.QueueHandler(_queue))
+                _start_listener()
+            else:
+                root.addHandler(_handler)
+        _configured = True
+
+
+def flush() -> None:
+    """Write out every queued record (restarts the writer thread)"""
+    with _lock:
+        if _listener is not None:
+            _stop_listener()
+            _start_listener()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the ``v0`` hierarchy, configured from the environment on first use"""
+    if not _configured:
+        with _lock:
+            if not _configured:
+                configure()
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+atexit.register(_stop_listener)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,139 @@
+"""
+Background Metrics Sampler
+Keeps a shared system health snapshot refreshed on a fixed cadence
+"""
+
+import copy
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import psutil
+
+from log import get_logger
+from system_monitor import SystemMonitor
+
+log = get_logger('metrics_sampler')
+
+
+class MetricsSampler:
+    """Long-lived sampler around SystemMonitor
+
+    A daemon thread regenerates the health report every ``interval`` seconds
+    and swaps it into ``self._snapshot``. Readers never touch psutil, they only
+    copy the latest snapshot, so request handlers return immediately instead of
+    sleeping in ``cpu_percent(interval=1)``.
+    """
+
+    def __init__(self, interval: float = 5.0, alert_threshold: float = 80.0):
+        self.interval = max(float(interval), 0.5)
+        self.monitor = SystemMonitor(alert_threshold=alert_threshold)
+        self._snapshot = None
+        self._sampled_at = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._listeners: List[Callable[[Dict], None]] = []
+        self._source: Optional[Callable[[], Optional[Dict]]] = None
+
+    def add_listener(self, callback: Callable[[Dict], None]) -> None:
+        """Register a callback invoked with every new report (from the sampler thread)"""
+        self._listeners.append(callback)
+
+    def set_source(self, source: Optional[Callable[[], Optional[Dict]]]) -> None:
+        """Take reports from ``source`` instead of sampling (None samples locally again)
+
+        ``source`` returns a new report, or None if nothing changed since its
+        last call. Worker processes use it to mirror the leader's sampler.
+        """
+        self._source = source
+
+    def start(self) -> None:
+        """Start the sampling thread (no-op if already running)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='metrics-sampler', daemon=True
+            )
+            self._thread.start()
+        log.info("Metrics sampler started (interval=%ss)", self.interval)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the sampling thread"""
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        log.info("Metrics sampler stopped")
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def ready(self) -> bool:
+        """Whether ``snapshot`` can answer without starting or priming the sampler"""
+        return self.running and self._snapshot is not None
+
+    def sample_now(self) -> Dict:
+        """Collect a fresh report and publish it as the current snapshot"""
+        source = self._source
+        report = source() if source is not None else None
+        if report is None:
+            with self._lock:
+                current = self._snapshot
+            if source is not None and current is not None:
+                return current
+            report = self.monitor.generate_health_report(cpu_interval=None)
+            report['sampled_at'] = time.time()
+        sampled_at = report['sampled_at']
+        with self._lock:
+            self._snapshot = report
+            self._sampled_at = sampled_at
+        for callback in list(self._listeners):
+            try:
+                callback(report)
+            except Exception as e:
+                log.error("Metrics listener error: %s", e)
+        return report
+
+    def snapshot(self) -> Dict:
+        """Return a copy of the latest report with its age in seconds
+
+        Starts the sampler on first use. Only the very first call after start
+        has to wait for a (short, 0.1s) priming sample.
+        """
+        if not self.running:
+            self.start()
+        with self._lock:
+            report = self._snapshot
+            sampled_at = self._sampled_at
+        if report is None:
+            report = self._prime()
+            sampled_at = self._sampled_at
+
+        result = copy.deepcopy(report)
+        result['age_seconds'] = round(max(time.time() - sampled_at, 0.0), 3)
+        return result
+
+    def _prime(self) -> Dict:
+        """Take the first sample, giving cpu_percent a short baseline window"""
+        with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+        psutil.cpu_percent(interval=None)
+        psutil.cpu_percent(interval=None, percpu=True)
+        time.sleep(0.1)
+        return self.sample_now()
+
+    def _run(self) -> None:
+        """Sampling loop executed by the background thread"""
+        if self._snapshot is None:
+            self._prime()
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample_now()
+            except Exception as e:
+                log.error("Metrics sampler error: %s", e)
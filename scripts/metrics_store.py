@@ -0,0 +1,272 @@
+"""
+Metrics Time-Series Store
+Fixed-memory ring buffers of system metric samples with 1m/1h rollups
+"""
+
+import fcntl
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# Metrics extracted from a SystemMonitor health report
+DEFAULT_METRICS = (
+    'cpu_percent',
+    'memory_percent',
+    'disk_percent',
+    'net_sent_bps',
+    'net_recv_bps',
+)
+
+RAW_RETENTION_SECONDS = 7 * 24 * 3600        # one week of 1s samples
+MINUTE_RETENTION_SECONDS = 30 * 24 * 3600    # 30 days of 1m rollups
+HOUR_RETENTION_SECONDS = 2 * 365 * 24 * 3600  # two years of 1h rollups
+
+
+def _allocate(name: str, shape, dtype, fill) -> np.ndarray:
+    return np.full(shape, fill, dtype=dtype)
+
+
+def _mapped_allocator(directory: str) -> Callable:
+    """Allocator backing each ring array with a ``.npy`` file under ``directory``
+
+    Arrays are mapped shared, so every process that opens the same directory
+    sees the same history, and the history survives restarts. A file whose
+    shape or dtype no longer matches (e.g. after a retention change) is
+    recreated empty.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    def allocate(name: str, shape, dtype, fill) -> np.ndarray:
+        path = os.path.join(directory, f"{name}.npy")
+        with open(os.path.join(directory, '.lock'), 'w') as lock:
+            # Serialize creation so a second process never maps a half-filled file
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(path):
+                try:
+                    array = np.lib.format.open_memmap(path, mode='r+')
+                    if array.shape == tuple(shape) and array.dtype == np.dtype(dtype):
+                        return array
+                    del array
+                except ValueError:
+                    pass
+            array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+            array[...] = fill
+            array.flush()
+            return array
+
+    return allocate
+
+
+class _RawRing:
+    """One value per metric per second
+
+    Slots are addressed by ``timestamp % capacity`` so no per-sample index is
+    kept; ``timestamps`` records which second currently owns a slot and lets
+    stale slots be told apart from fresh ones. Memory is 4 bytes for the
+    timestamp plus 4 bytes per metric per slot (a week at 1s with the five
+    default metrics is ~14.5 MB, ~2.4 MB per metric).
+    """
+
+    resolution = 1
+
+    def __init__(self, capacity: int, n_metrics: int, allocate: Callable = _allocate):
+        self.capacity = capacity
+        self.timestamps = allocate('raw_timestamps', (capacity,), np.uint32, 0)
+        self.values = allocate('raw_values', (n_metrics, capacity), np.float32, np.nan)
+
+    def append(self, ts: int, row: np.ndarray) -> None:
+        slot = ts % self.capacity
+        self.timestamps[slot] = ts
+        self.values[:, slot] = row
+
+    def select(self, metric_index: int, start: int, end: int):
+        """Return (timestamps, mins, maxs, sums, counts) in [start, end], time-ordered"""
+        mask = (self.timestamps >= start) & (self.timestamps <= end) & (self.timestamps != 0)
+        ts = self.timestamps[mask]
+        values = self.values[metric_index, mask]
+        keep = ~np.isnan(values)
+        ts, values = ts[keep], values[keep]
+        order = np.argsort(ts, kind='stable')
+        ts, values = ts[order], values[order].astype(np.float64)
+        return ts, values, values, values, np.ones(len(ts), dtype=np.float64)
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.values.nbytes
+
+
+class _RollupRing:
+    """Per-bucket min/max/sum/count for a coarser resolution"""
+
+    def __init__(self, resolution: int, capacity: int, n_metrics: int, allocate: Callable = _allocate):
+        self.resolution = resolution
+        self.capacity = capacity
+        prefix = f"rollup_{resolution}s"
+        self.timestamps = allocate(f"{prefix}_timestamps", (capacity,), np.uint32, 0)
+        self.mins = allocate(f"{prefix}_mins", (n_metrics, capacity), np.float32, np.nan)
+        self.maxs = allocate(f"{prefix}_maxs", (n_metrics, capacity), np.float32, np.nan)
+        self.sums = allocate(f"{prefix}_sums", (n_metrics, capacity), np.float64, 0.0)
+        self.counts = allocate(f"{prefix}_counts", (n_metrics, capacity), np.uint32, 0)
+
+    def append(self, ts: int, row: np.ndarray) -> None:
+        bucket = ts - ts % self.resolution
+        slot = (bucket // self.resolution) % self.capacity
+        valid = ~np.isnan(row)
+        if self.timestamps[slot] != bucket:
+            self.timestamps[slot] = bucket
+            self.mins[:, slot] = row
+            self.maxs[:, slot] = row
+            self.sums[:, slot] = np.where(valid, row, 0.0)
+            self.counts[:, slot] = valid
+            return
+        self.mins[valid, slot] = np.fmin(self.mins[valid, slot], row[valid])
+        self.maxs[valid, slot] = np.fmax(self.maxs[valid, slot], row[valid])
+        self.sums[valid, slot] += row[valid]
+        self.counts[valid, slot] += 1
+
+    def select(self, metric_index: int, start: int, end: int):
+        """Return (timestamps, mins, maxs, sums, counts) in [start, end], time-ordered"""
+        mask = (self.timestamps >= start) & (self.timestamps <= end) & (self.timestamps != 0)
+        mask &= self.counts[metric_index] > 0
+        ts = self.timestamps[mask]
+        order = np.argsort(ts, kind='stable')
+        return (
+            ts[order],
+            self.mins[metric_index, mask][order].astype(np.float64),
+            self.maxs[metric_index, mask][order].astype(np.float64),
+            self.sums[metric_index, mask][order],
+            self.counts[metric_index, mask][order].astype(np.float64),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return (self.timestamps.nbytes + self.mins.nbytes + self.maxs.nbytes
+                + self.sums.nbytes + self.counts.nbytes)
+
+
+class MetricsStore:
+    """Array-backed history of system metrics
+
+    Every sample lands in a 1-second ring and is folded into 1-minute and
+    1-hour rollup rings at the same time, so there is no separate compaction
+    job. Queries pick the coarsest tier that still resolves the requested step
+    and downsample with ``numpy.ufunc.reduceat``; no per-sample Python objects
+    are created on either path.
+
+    With ``path`` the rings are memory-mapped files in that directory, shared
+    by every process that opens it. Only one process should append (rollups
+    would count a sample once per writer); the others just query.
+    """
+
+    def __init__(self, metrics=DEFAULT_METRICS,
+                 raw_seconds: int = RAW_RETENTION_SECONDS,
+                 minute_seconds: int = MINUTE_RETENTION_SECONDS,
+                 hour_seconds: int = HOUR_RETENTION_SECONDS,
+                 path: Optional[str] = None):
+        self.metrics = tuple(metrics)
+        self.path = path
+        self._index = {name: i for i, name in enumerate(self.metrics)}
+        n = len(self.metrics)
+        allocate = _mapped_allocator(path) if path else _allocate
+        self._tiers = [
+            _RawRing(raw_seconds, n, allocate),
+            _RollupRing(60, max(minute_seconds // 60, 1), n, allocate),
+            _RollupRing(3600, max(hour_seconds // 3600, 1), n, allocate),
+        ]
+        self._lock = threading.Lock()
+        self._last_network = None
+
+    @property
+    def nbytes(self) -> int:
+        """Total memory held by the ring buffers"""
+        return sum(tier.nbytes for tier in self._tiers)
+
+    def append(self, values: Dict[str, float], timestamp: Optional[float] = None) -> None:
+        """Record one sample; missing metrics are stored as gaps"""
+        ts = int(timestamp if timestamp is not None else time.time())
+        row = np.array([values.get(name, np.nan) for name in self.metrics], dtype=np.float64)
+        with self._lock:
+            for tier in self._tiers:
+                tier.append(ts, row)
+
+    def record_report(self, report: Dict, timestamp: Optional[float] = None) -> None:
+        """Extract metrics from a SystemMonitor health report and append them"""
+        ts = timestamp if timestamp is not None else report.get('sampled_at', time.time())
+        values = {
+            'cpu_percent': report['cpu']['usage_percent'],
+            'memory_percent': report['memory']['percent'],
+            'disk_percent': report['disk']['percent'],
+        }
+
+        # Network counters are cumulative; store per-second rates instead
+        network = report.get('network')
+        if network:
+            current = (ts, network['bytes_sent'], network['bytes_received'])
+            previous = self._last_network
+            self._last_network = current
+            if previous is not None and current[0] > previous[0]:
+                elapsed = current[0] - previous[0]
+                values['net_sent_bps'] = max(current[1] - previous[1], 0) / elapsed
+                values['net_recv_bps'] = max(current[2] - previous[2], 0) / elapsed
+
+        self.append(values, ts)
+
+    def query(self, metric: str, start: float, end: float, step: Optional[int] = None) -> Dict:
+        """Return min/avg/max series for ``metric`` over [start, end] in ``step``-second buckets"""
+        if metric not in self._index:
+            raise KeyError(f"Unknown metric '{metric}'. Available: {', '.join(self.metrics)}")
+        start, end = int(start), int(end)
+        if end <= start:
+            raise ValueError("'to' must be later than 'from'")
+        if step is None:
+            step = max((end - start) // 300, 1)
+        step = max(int(step), 1)
+
+        tier = self._select_tier(start, step)
+        with self._lock:
+            ts, mins, maxs, sums, counts = tier.select(self._index[metric], start, end)
+
+        if len(ts) == 0:
+            bucket_ts = np.empty(0, dtype=np.int64)
+            bucket_min = bucket_avg = bucket_max = np.empty(0)
+        else:
+            buckets = (ts.astype(np.int64) - start) // step
+            edges = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            bucket_ts = start + buckets[edges] * step
+            bucket_min = np.minimum.reduceat(mins, edges)
+            bucket_max = np.maximum.reduceat(maxs, edges)
+            bucket_avg = np.add.reduceat(sums, edges) / np.add.reduceat(counts, edges)
+
+        return {
+            'metric': metric,
+            'from': start,
+            'to': end,
+            'step': step,
+            'resolution': tier.resolution,
+            'timestamps': bucket_ts.tolist(),
+            'min': np.round(bucket_min, 3).tolist(),
+            'avg': np.round(bucket_avg, 3).tolist(),
+            'max': np.round(bucket_max, 3).tolist(),
+        }
+
+    def _select_tier(self, start: int, step: int):
+        """Coarsest tier whose resolution fits in ``step`` and whose retention covers ``start``"""
+        now = int(time.time())
+        chosen = self._tiers[0]
+        for tier in self._tiers:
+            if tier.resolution > step:
+                break
+            chosen = tier
+        # Fall back to coarser tiers when the finer ones no longer hold the range
+        for tier in self._tiers:
+            if tier.resolution < chosen.resolution:
+                continue
+            if now - start <= tier.capacity * tier.resolution:
+                return tier
+        return self._tiers[-1]
+
+    def list_metrics(self) -> List[str]:
+        return list(self.metrics)
@@ -0,0 +1,183 @@
+"""
+Live Metrics Streaming
+Fans sampler snapshots out to Server-Sent Events subscribers as deltas
+"""
+
+import asyncio
+import itertools
+import json
+import queue
+import threading
+from typing import Dict, Optional
+
+# Delta entry listing the keys of an object that disappeared between two snapshots,
+# kept apart from the values so a key that became null stays distinguishable
+REMOVED_KEY = '$removed'
+
+
+def compute_delta(previous: Dict, current: Dict) -> Dict:
+    """Return the keys of ``current`` that differ from ``previous``
+
+    Nested dicts are diffed recursively; lists and scalars are replaced whole.
+    Keys missing from ``current`` are listed under ``$removed`` in the
+    (nested) delta of the object that lost them.
+    """
+    delta = {}
+    for key, value in current.items():
+        if key not in previous:
+            delta[key] = value
+            continue
+        old = previous[key]
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = compute_delta(old, value)
+            if nested:
+                delta[key] = nested
+        elif value != old:
+            delta[key] = value
+    removed = [key for key in previous if key not in current]
+    if removed:
+        delta[REMOVED_KEY] = removed
+    return delta
+
+
+def format_sse(data: str, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """Encode one Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [''])
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """Bounded per-client message queue"""
+
+    def __init__(self, max_queue: int):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Next encoded SSE message, or None if nothing arrived within ``timeout``"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def offer(self, message: str, resync_message: str) -> None:
+        """Queue ``message``; if the client is behind, replace its backlog with a full snapshot"""
+        try:
+            self.queue.put_nowait(message)
+            return
+        except queue.Full:
+            pass
+
+        # Slow consumer: deltas are useless once one is dropped, so discard
+        # the backlog and let the client resynchronise from a full snapshot
+        self.dropped += 1
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            self.queue.put_nowait(resync_message)
+        except queue.Full:
+            pass
+
+
+class AsyncSubscription:
+    """Per-client queue consumed from an asyncio event loop
+
+    The publisher thread hands each message to the loop with
+    ``call_soon_threadsafe``, so an idle client costs a queue rather than a
+    blocked thread. Slow clients are resynchronised the same way as in
+    ``Subscription``.
+    """
+
+    def __init__(self, max_queue: int, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Next encoded SSE message, or None if nothing arrived within ``timeout``"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def offer(self, message: str, resync_message: str) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._offer, message, resync_message)
+        except RuntimeError:
+            # Loop already closed; the client is gone
+            pass
+
+    def _offer(self, message: str, resync_message: str) -> None:
+        try:
+            self.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        self.dropped += 1
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(resync_message)
+
+
+class MetricsBroadcaster:
+    """One sampler, many viewers
+
+    Each published report is diffed against the previous one and encoded
+    exactly once; subscribers receive the same pre-encoded string. A client
+    whose queue fills up is sent a fresh full snapshot instead of blocking the
+    publisher or growing memory without bound.
+    """
+
+    def __init__(self, max_queue: int = 16):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._last_report = None
+        self._last_snapshot_message = None
+        self._ids = itertools.count(1)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Register a client; its first message is the current full snapshot
+
+        With ``loop`` the subscription is read with ``await`` from that loop
+        (call from the loop's thread).
+        """
+        subscription = AsyncSubscription(self.max_queue, loop) if loop else Subscription(self.max_queue)
+        with self._lock:
+            if self._last_snapshot_message is not None:
+                subscription.queue.put_nowait(self._last_snapshot_message)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, report: Dict) -> None:
+        """Diff ``report`` against the previous one and fan the delta out"""
+        with self._lock:
+            event_id = next(self._ids)
+            snapshot_message = format_sse(json.dumps(report), 'snapshot', event_id)
+            if self._last_report is None:
+                message = snapshot_message
+            else:
+                delta = compute_delta(self._last_report, report)
+                message = format_sse(json.dumps(delta), 'delta', event_id)
+            self._last_report = report
+            self._last_snapshot_message = snapshot_message
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            subscription.offer(message, snapshot_message)
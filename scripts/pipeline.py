@@ -0,0 +1,596 @@
+"""
+Declarative Data Pipeline
+Lazily planned, optimized transformation steps on top of DataProcessor
+"""
+
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+import pandas as pd
+
+from data_processor import DataProcessor, _filter_frame, is_supported_format, read_schema, validate_filters
+from log import get_logger
+
+log = get_logger('pipeline')
+
+FILL_STRATEGIES = ('ffill', 'bfill', 'value', 'mean', 'median', 'drop')
+AGG_FUNCS = ('sum', 'mean', 'min', 'max', 'count', 'median', 'std', 'nunique', 'first', 'last')
+JOIN_HOWS = ('inner', 'left', 'right', 'outer')
+JOIN_SUFFIX = '_right'
+
+
+def _names(step: dict, field: str, required: bool = True) -> Optional[List[str]]:
+    """A list of column names from ``step[field]`` (a single name is accepted)"""
+    value = step.get(field)
+    if value is None:
+        if required:
+            raise ValueError(f"'{step.get('op')}' step needs '{field}'")
+        return None
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, (list, tuple)) or not value or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"'{step.get('op')}' step: '{field}' must be a column name or a list of them")
+    return list(value)
+
+
+class Source:
+    """Where a pipeline (or the right side of a join) reads from
+
+    ``columns`` and ``filters`` are filled in by the optimizer and handed to
+    DataProcessor, which pushes them into Parquet/Arrow scans.
+    """
+
+    def __init__(self, path: str):
+        if not is_supported_format(path):
+            raise ValueError(f"Unsupported file format: {path}")
+        self.path = path
+        self.schema = read_schema(path)
+        self.columns: Optional[List[str]] = None
+        self.filters: List[tuple] = []
+
+    def load(self) -> pd.DataFrame:
+        columns = self.columns
+        if columns is not None and self.schema is None:
+            # Unknown schema: read everything and project afterwards
+            columns = None
+        processor = DataProcessor(self.path, columns=columns, filters=self.filters or None)
+        frame = processor.load_data()
+        if frame is None:
+            raise ValueError(f"Could not load {self.path}")
+        if self.columns is not None and list(frame.columns) != self.columns:
+            wanted = set(self.columns)
+            frame = frame[[c for c in frame.columns if c in wanted]]
+        return frame
+
+    def describe(self) -> Dict:
+        return {'path': self.path, 'columns': self.columns, 'filters': [list(f) for f in self.filters]}
+
+
+class Step:
+    """One pipeline operation
+
+    Subclasses describe how they interact with the optimizer:
+    ``output_schema`` maps input column names to output names (None when
+    unknown), ``required`` maps the columns needed downstream to the columns
+    this step needs from upstream (None meaning all), ``referenced`` lists
+    the input columns the step names (checked against a known schema when
+    the pipeline is built), and ``commutes_with_filter`` says whether a
+    filter on ``columns`` placed after this step may run before it instead.
+    """
+    op = None
+
+    def referenced(self) -> List[str]:
+        return []
+
+    def output_schema(self, schema: Optional[List[str]]) -> Optional[List[str]]:
+        return schema
+
+    def required(self, needed: Optional[Set[str]]) -> Optional[Set[str]]:
+        return needed
+
+    def commutes_with_filter(self, columns: Set[str]) -> bool:
+        return False
+
+    def apply(self, frame: pd.DataFrame) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def describe(self) -> Dict:
+        return {'op': self.op}
+
+
+def _union(needed: Optional[Set[str]], columns) -> Optional[Set[str]]:
+    return None if needed is None else needed | set(columns)
+
+
+class FilterStep(Step):
+    op = 'filter'
+
+    def __init__(self, spec: dict):
+        conditions = spec.get('conditions')
+        if not conditions:
+            raise ValueError("'filter' step needs 'conditions'")
+        self.conditions = validate_filters(conditions)
+
+    @property
+    def columns(self) -> Set[str]:
+        return {column for column, _, _ in self.conditions}
+
+    def referenced(self):
+        return [column for column, _, _ in self.conditions]
+
+    def required(self, needed):
+        return _union(needed, self.columns)
+
+    def commutes_with_filter(self, columns):
+        return True
+
+    def apply(self, frame):
+        return _filter_frame(frame, self.conditions)
+
+    def describe(self):
+        return {'op': self.op, 'conditions': [list(c) for c in self.conditions]}
+
+
+class SelectStep(Step):
+    op = 'select'
+
+    def __init__(self, spec: dict):
+        self.columns = _names(spec, 'columns')
+
+    def referenced(self):
+        return list(self.columns)
+
+    def output_schema(self, schema):
+        return list(self.columns)
+
+    def required(self, needed):
+        if needed is not None:
+            # Downstream doesn't use the rest, so they need not be carried at all
+            self.columns = [c for c in self.columns if c in needed] or self.columns[:1]
+        return set(self.columns)
+
+    def commutes_with_filter(self, columns):
+        # A filter on a column the select drops must stay after it (and fail there)
+        return columns <= set(self.columns)
+
+    def apply(self, frame):
+        return frame[self.columns]
+
+    def describe(self):
+        return {'op': self.op, 'columns': self.columns}
+
+
+class DedupeStep(Step):
+    op = 'dedupe'
+
+    def __init__(self, spec: dict):
+        self.subset = _names(spec, 'subset', required=False)
+        self.keep = spec.get('keep', 'first')
+        if self.keep not in ('first', 'last'):
+            raise ValueError("'dedupe' step: 'keep' must be 'first' or 'last'")
+
+    def referenced(self):
+        return list(self.subset or [])
+
+    def required(self, needed):
+        return None if self.subset is None else _union(needed, self.subset)
+
+    def commutes_with_filter(self, columns):
+        # Rows sharing a key agree on these columns, so they are kept or dropped together
+        return self.subset is None or columns <= set(self.subset)
+
+    def apply(self, frame):
+        return frame.drop_duplicates(subset=self.subset, keep=self.keep)
+
+    def describe(self):
+        return {'op': self.op, 'subset': self.subset, 'keep': self.keep}
+
+
+class FillStep(Step):
+    op = 'fill'
+
+    def __init__(self, spec: dict):
+        self.strategy = spec.get('strategy', 'ffill')
+        if self.strategy not in FILL_STRATEGIES:
+            raise ValueError(f"Unknown fill strategy '{self.strategy}'. Use one of: {', '.join(FILL_STRATEGIES)}")
+        self.columns = _names(spec, 'columns', required=False)
+        self.value = spec.get('value')
+        if self.strategy == 'value' and self.value is None:
+            raise ValueError("'fill' step with strategy 'value' needs 'value'")
+
+    def referenced(self):
+        return list(self.columns or [])
+
+    def required(self, needed):
+        if self.columns is None:
+            return None if self.strategy == 'drop' else needed
+        return _union(needed, self.columns)
+
+    def commutes_with_filter(self, columns):
+        # dropna is itself a row filter; a constant fill leaves other columns alone.
+        # ffill/bfill/mean/median depend on which rows are present.
+        if self.strategy == 'drop':
+            return True
+        return self.strategy == 'value' and self.columns is not None and not columns & set(self.columns)
+
+    def apply(self, frame):
+        columns = self.columns
+        if self.strategy == 'drop':
+            return frame.dropna(subset=columns)
+        if columns is None:
+            columns = list(frame.columns)
+        frame = frame.copy()
+        if self.strategy == 'value':
+            frame[columns] = frame[columns].fillna(self.value)
+        elif self.strategy in ('ffill', 'bfill'):
+            filled = frame[columns].ffill() if self.strategy == 'ffill' else frame[columns].bfill()
+            frame[columns] = filled
+        else:
+            numeric = [c for c in columns if pd.api.types.is_numeric_dtype(frame[c])]
+            values = frame[numeric].mean() if self.strategy == 'mean' else frame[numeric].median()
+            frame[numeric] = frame[numeric].fillna(values)
+        return frame
+
+    def describe(self):
+        described = {'op': self.op, 'strategy': self.strategy, 'columns': self.columns}
+        if self.strategy == 'value':
+            described['value'] = self.value
+        return described
+
+
+class CleanStep(Step):
+    """The built-in cleaning pass: drop duplicate rows, then forward-fill"""
+    op = 'clean'
+
+    def __init__(self, spec: dict):
+        pass
+
+    def required(self, needed):
+        return None
+
+    def apply(self, frame):
+        return frame.drop_duplicates().ffill()
+
+
+class AggregateStep(Step):
+    op = 'aggregate'
+
+    def __init__(self, spec: dict):
+        self.by = _names(spec, 'by')
+        aggs = spec.get('aggs')
+        if not isinstance(aggs, dict) or not aggs:
+            raise ValueError("'aggregate' step needs 'aggs' as {column: function or [functions]}")
+        self.aggs = {}
+        for column, funcs in aggs.items():
+            funcs = [funcs] if isinstance(funcs, str) else list(funcs)
+            unknown = [f for f in funcs if f not in AGG_FUNCS]
+            if unknown or not funcs:
+                raise ValueError(f"Unknown aggregate for '{column}': {unknown}. Use: {', '.join(AGG_FUNCS)}")
+            self.aggs[column] = funcs
+
+    def _output_names(self) -> List[str]:
+        names = list(self.by)
+        for column, funcs in self.aggs.items():
+            names.extend([column] if len(funcs) == 1 else [f"{column}_{f}" for f in funcs])
+        return names
+
+    def referenced(self):
+        return list(self.by) + [c for c in self.aggs if c not in self.by]
+
+    def output_schema(self, schema):
+        return self._output_names()
+
+    def required(self, needed):
+        return set(self.by) | set(self.aggs)
+
+    def commutes_with_filter(self, columns):
+        # Filtering on group keys removes whole groups either way
+        return columns <= set(self.by)
+
+    def apply(self, frame):
+        grouped = frame.groupby(self.by, sort=False, dropna=False)
+        result = grouped.agg({column: funcs for column, funcs in self.aggs.items()})
+        result.columns = self._output_names()[len(self.by):]
+        return result.reset_index()
+
+    def describe(self):
+        return {'op': self.op, 'by': self.by, 'aggs': self.aggs}
+
+
+class JoinStep(Step):
+    """Merge with another file; right-side columns that clash get ``_right``"""
+    op = 'join'
+
+    def __init__(self, spec: dict):
+        path = spec.get('right')
+        if not path:
+            raise ValueError("'join' step needs 'right' (a file path)")
+        self.on = _names(spec, 'on')
+        self.how = spec.get('how', 'inner')
+        if self.how not in JOIN_HOWS:
+            raise ValueError(f"Unknown join '{self.how}'. Use one of: {', '.join(JOIN_HOWS)}")
+        self.right = Source(path)
+        if self.right.schema is not None:
+            missing = [c for c in self.on if c not in self.right.schema]
+            if missing:
+                raise ValueError(f"Join keys {missing} not in {path}")
+        self.left_schema: Optional[List[str]] = None
+
+    def _right_name(self, column: str) -> str:
+        if column in self.on or self.left_schema is None or column not in self.left_schema:
+            return column
+        return column + JOIN_SUFFIX
+
+    def referenced(self):
+        return list(self.on)
+
+    def output_schema(self, schema):
+        self.left_schema = schema
+        if schema is None or self.right.schema is None:
+            return None
+        return list(schema) + [self._right_name(c) for c in self.right.schema if c not in self.on]
+
+    def right_column(self, column: str) -> Optional[str]:
+        """The right-side column that output ``column`` comes from, if known for certain
+
+        With an unknown left schema any column may exist on both sides, so
+        nothing is attributed to the right (and no filter is pushed there).
+        """
+        if self.right.schema is None or self.left_schema is None or column in self.on:
+            return None
+        if column.endswith(JOIN_SUFFIX) and column[:-len(JOIN_SUFFIX)] in self.right.schema:
+            return column[:-len(JOIN_SUFFIX)]
+        if column in self.right.schema and column not in self.left_schema:
+            return column
+        return None
+
+    def required(self, needed):
+        if needed is None:
+            self.right.columns = None
+            return None
+        if self.left_schema is None:
+            # Can't tell which side a needed column comes from: read every candidate on the right
+            right = {c for c in needed} | {c[:-len(JOIN_SUFFIX)] for c in needed if c.endswith(JOIN_SUFFIX)}
+        else:
+            right = {self.right_column(c) for c in needed} - {None}
+        self.right.columns = [c for c in self.right.schema if c in right or c in self.on] \
+            if self.right.schema is not None else None
+        left = {c for c in needed if self.right_column(c) is None} | set(self.on)
+        # Keep a left column whose right twin is needed, or the twin would lose its suffix
+        left |= {c[:-len(JOIN_SUFFIX)] for c in needed if c.endswith(JOIN_SUFFIX)}
+        if self.left_schema is not None:
+            left &= set(self.left_schema)
+        return left
+
+    def commutes_with_filter(self, columns):
+        # Conditions on left-side columns commute with inner and left joins
+        if self.how not in ('inner', 'left') or self.left_schema is None:
+            return False
+        return columns <= set(self.left_schema)
+
+    def apply(self, frame):
+        right = self.right.load()
+        suffixes = ('', JOIN_SUFFIX)
+        return frame.merge(right, on=self.on, how=self.how, suffixes=suffixes)
+
+    def describe(self):
+        return {'op': self.op, 'on': self.on, 'how': self.how, 'right': self.right.describe()}
+
+
+class SortStep(Step):
+    op = 'sort'
+
+    def __init__(self, spec: dict):
+        self.by = _names(spec, 'by')
+        ascending = spec.get('ascending', True)
+        self.ascending = list(ascending) if isinstance(ascending, (list, tuple)) else [bool(ascending)] * len(self.by)
+        if len(self.ascending) != len(self.by):
+            raise ValueError("'sort' step: 'ascending' must match 'by'")
+        self.limit = _limit(spec.get('limit'))
+
+    def referenced(self):
+        return list(self.by)
+
+    def required(self, needed):
+        return _union(needed, self.by)
+
+    def commutes_with_filter(self, columns):
+        return self.limit is None
+
+    def apply(self, frame):
+        if self.limit is not None and len(set(self.ascending)) == 1 \
+                and all(pd.api.types.is_numeric_dtype(frame[c]) for c in self.by):
+            # Top-n selection instead of a full sort
+            select = frame.nsmallest if self.ascending[0] else frame.nlargest
+            return select(self.limit, self.by)
+        result = frame.sort_values(self.by, ascending=self.ascending, kind='stable')
+        return result.head(self.limit) if self.limit is not None else result
+
+    def describe(self):
+        return {'op': self.op, 'by': self.by, 'ascending': self.ascending, 'limit': self.limit}
+
+
+class LimitStep(Step):
+    op = 'limit'
+
+    def __init__(self, spec: dict):
+        self.n = _limit(spec.get('n'))
+        if self.n is None:
+            raise ValueError("'limit' step needs 'n'")
+
+    def apply(self, frame):
+        return frame.head(self.n)
+
+    def describe(self):
+        return {'op': self.op, 'n': self.n}
+
+
+def _limit(value) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError("Row limits must be non-negative integers")
+    return value
+
+
+STEP_TYPES = {cls.op: cls for cls in (FilterStep, SelectStep, DedupeStep, FillStep, CleanStep,
+                                      AggregateStep, JoinStep, SortStep, LimitStep)}
+
+
+class Pipeline:
+    """A lazily evaluated chain of steps over one input file
+
+    Building a pipeline only validates the spec. ``optimize`` (run once,
+    before the first ``run`` or ``explain``) rewrites the plan:
+
+    - filters move upstream past every step they commute with, and those
+      that reach the start become reader filters (Parquet/Arrow scans skip
+      row groups; text formats drop rows right after parsing); on an inner
+      join, conditions on right-only columns are pushed into the right
+      file's reader instead
+    - adjacent filters merge into one, consecutive selects collapse, and a
+      limit directly after a sort becomes a top-n selection
+    - walking back from the output, every step declares the columns it
+      needs, so the reader (and each join's right side) only loads columns
+      that reach the result or feed a step on the way
+
+    Steps then run in order over pandas frames.
+    """
+
+    def __init__(self, input_file: str, steps: List[Dict]):
+        if not isinstance(steps, list):
+            raise ValueError("'pipeline' must be a list of steps")
+        self.source = Source(input_file)
+        self.steps: List[Step] = []
+        for index, spec in enumerate(steps):
+            if not isinstance(spec, dict) or spec.get('op') not in STEP_TYPES:
+                raise ValueError(f"Step {index}: 'op' must be one of: {', '.join(STEP_TYPES)}")
+            self.steps.append(STEP_TYPES[spec['op']](spec))
+        self._propagate_schema()
+        self.optimizations: List[str] = []
+        self.trace: List[Dict] = []
+        self._optimized = False
+
+    def _propagate_schema(self) -> None:
+        """Carry the schema through the steps, rejecting references to columns that won't exist"""
+        schema = self.source.schema
+        for index, step in enumerate(self.steps):
+            if schema is not None:
+                missing = [c for c in step.referenced() if c not in schema]
+                if missing:
+                    raise ValueError(f"Step {index} ('{step.op}'): unknown column(s) {missing}")
+            schema = step.output_schema(schema)
+
+    def optimize(self) -> 'Pipeline':
+        if self._optimized:
+            return self
+        self._propagate_schema()
+        self._push_filters()
+        self._fuse()
+        self._prune_columns()
+        self._optimized = True
+        return self
+
+    def _push_filters(self) -> None:
+        index = 0
+        while index < len(self.steps):
+            step = self.steps[index]
+            if not isinstance(step, FilterStep):
+                index += 1
+                continue
+            position = index
+            pushed_right = False
+            while position > 0:
+                previous = self.steps[position - 1]
+                if isinstance(previous, JoinStep) and previous.how in ('inner', 'right') \
+                        and all(previous.right_column(c) == c for c in step.columns):
+                    previous.right.filters.extend(step.conditions)
+                    pushed_right = True
+                    break
+                if isinstance(previous, FilterStep) or not previous.commutes_with_filter(step.columns):
+                    break
+                position -= 1
+            if pushed_right:
+                del self.steps[index]
+                self.optimizations.append(f"filter on {sorted(step.columns)} pushed into join input "
+                                          f"{self.steps[position - 1].right.path}")
+                continue
+            if position == 0:
+                del self.steps[index]
+                self.source.filters.extend(step.conditions)
+                self.optimizations.append(f"filter on {sorted(step.columns)} pushed into the reader")
+                continue
+            if position != index:
+                self.steps.insert(position, self.steps.pop(index))
+                self.optimizations.append(f"filter on {sorted(step.columns)} moved before "
+                                          f"'{self.steps[position + 1].op}'")
+            index += 1
+
+    def _fuse(self) -> None:
+        fused = []
+        for step in self.steps:
+            previous = fused[-1] if fused else None
+            if isinstance(step, FilterStep) and isinstance(previous, FilterStep):
+                previous.conditions.extend(step.conditions)
+                self.optimizations.append("adjacent filters merged")
+            elif isinstance(step, SelectStep) and isinstance(previous, SelectStep):
+                missing = [c for c in step.columns if c not in previous.columns]
+                if missing:
+                    raise ValueError(f"'select' refers to columns dropped earlier: {missing}")
+                fused[-1] = step
+                self.optimizations.append("consecutive selects collapsed")
+            elif isinstance(step, LimitStep) and isinstance(previous, SortStep):
+                previous.limit = step.n if previous.limit is None else min(previous.limit, step.n)
+                self.optimizations.append("sort + limit fused into top-n")
+            else:
+                fused.append(step)
+        self.steps = fused
+
+    def _prune_columns(self) -> None:
+        needed: Optional[Set[str]] = None
+        for step in reversed(self.steps):
+            needed = step.required(needed)
+        if needed is None:
+            return
+        if self.source.schema is not None:
+            columns = [c for c in self.source.schema if c in needed]
+            skipped = len(self.source.schema) - len(columns)
+            if skipped:
+                self.optimizations.append(f"{skipped} unused column(s) not read")
+        else:
+            columns = sorted(needed)
+        self.source.columns = columns
+
+    def explain(self) -> Dict:
+        """The optimized plan, without running it"""
+        self.optimize()
+        return {
+            'source': self.source.describe(),
+            'steps': [step.describe() for step in self.steps],
+            'optimizations': list(self.optimizations)
+        }
+
+    def run(self, progress: Optional[Callable[[int, int], None]] = None) -> pd.DataFrame:
+        """Optimize and execute the plan
+
+        ``progress(done, total)`` is called after the read and after each
+        step; an exception it raises (e.g. job cancellation) stops the run.
+        """
+        self.optimize()
+        self.trace = []
+        total = len(self.steps) + 1
+        started = time.perf_counter()
+        frame = self.source.load()
+        self.trace.append({'op': 'read', 'rows': len(frame), 'columns': len(frame.columns),
+                           'seconds': round(time.perf_counter() - started, 4)})
+        if progress:
+            progress(1, total)
+        for done, step in enumerate(self.steps, 2):
+            started = time.perf_counter()
+            frame = step.apply(frame)
+            self.trace.append({'op': step.op, 'rows': len(frame), 'columns': len(frame.columns),
+                               'seconds': round(time.perf_counter() - started, 4)})
+            if progress:
+                progress(done, total)
+        log.info("Pipeline finished: %s rows, %s columns", len(frame), len(frame.columns))
+        return frame.reset_index(drop=True)
@@ -0,0 +1,103 @@
+"""
+Process Table Sampler
+Keeps psutil.Process handles between samples to rank processes cheaply
+"""
+
+import heapq
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+
+SORT_FIELDS = {
+    'memory': 3,
+    'cpu': 2,
+}
+
+# (pid, name, cpu_percent, rss_bytes)
+ProcessRecord = Tuple[int, str, float, int]
+
+
+class ProcessSampler:
+    """Incremental view of the process table
+
+    ``psutil.Process`` objects are created once per PID and reused, so a
+    sample only reads each process's stat/statm (inside ``oneshot``) while
+    names are looked up when a PID first appears. Handles of PIDs that
+    vanished are dropped. Keeping handles also makes ``cpu_percent`` usable:
+    each sample reports CPU since the previous one (0.0 on a process's first
+    sample), the same as ``top``.
+
+    A sample keeps compact tuples; ``top`` builds dicts only for the ``n``
+    processes it returns, using ``heapq.nlargest`` rather than a full sort.
+    """
+
+    def __init__(self):
+        self._handles: Dict[int, psutil.Process] = {}
+        self._names: Dict[int, str] = {}
+        self._records: List[ProcessRecord] = []
+        self._total_memory = psutil.virtual_memory().total
+        self._lock = threading.Lock()
+        self.sampled_at: Optional[float] = None
+
+    @property
+    def process_count(self) -> int:
+        return len(self._records)
+
+    def sample(self) -> List[ProcessRecord]:
+        """Refresh CPU and memory figures for every process"""
+        with self._lock:
+            pids = psutil.pids()
+            live = set(pids)
+            for pid in [pid for pid in self._handles if pid not in live]:
+                del self._handles[pid]
+                self._names.pop(pid, None)
+
+            records = []
+            for pid in pids:
+                proc = self._handles.get(pid)
+                try:
+                    if proc is None:
+                        proc = psutil.Process(pid)
+                        self._names[pid] = proc.name()
+                        self._handles[pid] = proc
+                    with proc.oneshot():
+                        cpu = proc.cpu_percent(None)
+                        rss = proc.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                    self._handles.pop(pid, None)
+                    self._names.pop(pid, None)
+                    continue
+                except psutil.AccessDenied:
+                    continue
+                records.append((pid, self._names.get(pid), cpu, rss))
+
+            self._records = records
+            self.sampled_at = time.time()
+            return records
+
+    def records(self) -> List[ProcessRecord]:
+        """The last sample's records (e.g. to publish to other processes)"""
+        return list(self._records)
+
+    def load(self, records: List[ProcessRecord], sampled_at: Optional[float] = None) -> None:
+        """Adopt records sampled elsewhere so ``top`` can rank them"""
+        self._records = [tuple(record) for record in records]
+        self.sampled_at = sampled_at
+
+    def top(self, n: int = 5, sort_by: str = 'memory') -> List[Dict]:
+        """The ``n`` heaviest processes of the last sample by ``memory`` or ``cpu``"""
+        if sort_by not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort '{sort_by}'. Use one of: {', '.join(SORT_FIELDS)}")
+        field = SORT_FIELDS[sort_by]
+        records = self._records
+        return [
+            {
+                'pid': pid,
+                'name': name,
+                'memory_percent': rss * 100.0 / self._total_memory,
+                'cpu_percent': cpu
+            }
+            for pid, name, cpu, rss in heapq.nlargest(n, records, key=lambda record: record[field])
+        ]
@@ -0,0 +1,362 @@
+"""
+Analysis Result Cache
+Content-addressed LRU cache for DataProcessor results
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from log import get_logger
+
+log = get_logger('result_cache')
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def content_hasher():
+    """Incremental hasher matching ``hash_file`` (for data hashed as it streams in)"""
+    return hashlib.blake2b(digest_size=20)
+
+
+def hash_file(path: str) -> str:
+    """BLAKE2b digest of a file's contents"""
+    digest = content_hasher()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """LRU cache of analysis results keyed on file content + pipeline parameters
+
+    Hashing a large file is itself a full read, so digests are remembered per
+    path together with ``(st_dev, st_ino, st_mtime_ns, st_size)``; while those
+    are unchanged the stored digest is reused without touching the file.
+    Results are held in memory; cleaned frames are optionally written to
+    Parquet under ``cache_dir``. Both count towards ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024,
+                 store_frames: bool = False):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.store_frames = store_frames
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._fingerprints: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def content_hash(self, path: str) -> str:
+        """Digest of ``path``, reusing the last one while its stat signature is unchanged"""
+        real = os.path.realpath(path)
+        st = os.stat(real)
+        signature = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        known = self._fingerprint(real)
+        if known is not None and known[0] == signature:
+            return known[1]
+        digest = hash_file(real)
+        self._store_fingerprint(real, signature, digest)
+        return digest
+
+    def remember(self, path: str, digest: str) -> None:
+        """Record a digest computed elsewhere (e.g. while the file was uploaded)"""
+        real = os.path.realpath(path)
+        st = os.stat(real)
+        self._store_fingerprint(real, (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size), digest)
+
+    def find_by_digest(self, digest: str, exclude: Optional[str] = None) -> Optional[str]:
+        """Another known, unchanged file with this content, if any"""
+        exclude = os.path.realpath(exclude) if exclude else None
+        known = [(path, signature) for path, signature in self._paths_with_digest(digest) if path != exclude]
+        for path, signature in known:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size) == signature:
+                return path
+        return None
+
+    def key_for(self, path: str, params: Optional[Dict] = None) -> str:
+        """Cache key for running a pipeline with ``params`` over ``path``"""
+        encoded = json.dumps(params or {}, sort_keys=True, default=str)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(self.content_hash(path).encode())
+        digest.update(encoded.encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry['result']
+
+    def get_frame(self, key: str) -> Optional[pd.DataFrame]:
+        """Cached cleaned frame for ``key`` if one was stored"""
+        with self._lock:
+            entry = self._entries.get(key)
+            frame_path = entry.get('frame_path') if entry else None
+        if frame_path is None or not os.path.exists(frame_path):
+            return None
+        return pd.read_parquet(frame_path)
+
+    def put(self, key: str, result: Dict, frame: Optional[pd.DataFrame] = None) -> None:
+        size = len(json.dumps(result, default=str))
+        frame_path = None
+        if frame is not None and self.store_frames:
+            frame_path = self._write_frame(key, frame)
+            if frame_path is not None:
+                size += os.path.getsize(frame_path)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {'result': result, 'frame_path': frame_path, 'size': size}
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, path: str) -> None:
+        """Forget the stored digest for ``path`` (e.g. after it was re-uploaded)
+
+        Results stay addressed by content, so identical re-uploads still hit.
+        """
+        with self._lock:
+            self._fingerprints.pop(os.path.realpath(path), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+            self._fingerprints.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _fingerprint(self, real: str) -> Optional[Tuple[tuple, str]]:
+        with self._lock:
+            return self._fingerprints.get(real)
+
+    def _store_fingerprint(self, real: str, signature: tuple, digest: str) -> None:
+        with self._lock:
+            self._fingerprints[real] = (signature, digest)
+
+    def _paths_with_digest(self, digest: str) -> List[Tuple[str, tuple]]:
+        with self._lock:
+            return [(path, signature) for path, (signature, d) in self._fingerprints.items() if d == digest]
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+        if entry['frame_path']:
+            try:
+                os.remove(entry['frame_path'])
+            except OSError:
+                pass
+
+    def _write_frame(self, key: str, frame: pd.DataFrame) -> Optional[str]:
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            frame_path = self.cache_dir / f"{key}.parquet"
+            frame.to_parquet(frame_path, index=False)
+            return str(frame_path)
+        except (ImportError, ValueError) as e:
+            # Parquet needs pyarrow (or fastparquet); results are still cached
+            log.warning("Skipping frame cache: %s", e)
+            return None
+
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    frame_path TEXT,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fingerprints_digest ON fingerprints(digest);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SharedResultCache(ResultCache):
+    """ResultCache whose entries and file digests live in SQLite
+
+    Every worker process that opens the same ``db_path`` shares hits,
+    digests and the LRU byte budget, so a file analyzed or uploaded through
+    one worker is a cache hit in all of them, and the cache survives
+    restarts. Each process opens its own connection on first use (and again
+    after a fork). Results are stored as JSON.
+    """
+
+    def __init__(self, cache_dir: str, db_path: str, max_bytes: int = 256 * 1024 * 1024,
+                 store_frames: bool = False):
+        super().__init__(cache_dir, max_bytes=max_bytes, store_frames=store_frames)
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = None
+        self._db_pid = None
+        self._inherited = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None or self._db_pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SHARED_SCHEMA)
+            # Keep an inherited connection referenced: closing it could disturb the parent's
+            self._inherited, self._db, self._db_pid = self._db, conn, os.getpid()
+        return self._db
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        self._conn.execute('INSERT INTO counters (name, value) VALUES (?, ?) '
+                           'ON CONFLICT (name) DO UPDATE SET value = value + ?', (name, amount, amount))
+
+    def _fingerprint(self, real: str) -> Optional[Tuple[tuple, str]]:
+        with self._lock:
+            row = self._conn.execute('SELECT signature, digest FROM fingerprints WHERE path = ?', (real,)).fetchone()
+        return (tuple(json.loads(row[0])), row[1]) if row else None
+
+    def _store_fingerprint(self, real: str, signature: tuple, digest: str) -> None:
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO fingerprints (path, signature, digest) VALUES (?, ?, ?)',
+                               (real, json.dumps(signature), digest))
+
+    def _paths_with_digest(self, digest: str) -> List[Tuple[str, tuple]]:
+        with self._lock:
+            rows = self._conn.execute('SELECT path, signature FROM fingerprints WHERE digest = ?',
+                                      (digest,)).fetchall()
+        return [(path, tuple(json.loads(signature))) for path, signature in rows]
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute('SELECT result FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._count('misses')
+                return None
+            self._conn.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._count('hits')
+        return json.loads(row[0])
+
+    def get_frame(self, key: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            row = self._conn.execute('SELECT frame_path FROM entries WHERE key = ?', (key,)).fetchone()
+        frame_path = row[0] if row else None
+        if frame_path is None or not os.path.exists(frame_path):
+            return None
+        return pd.read_parquet(frame_path)
+
+    def put(self, key: str, result: Dict, frame: Optional[pd.DataFrame] = None) -> None:
+        payload = json.dumps(result, default=str)
+        size = len(payload)
+        frame_path = None
+        if frame is not None and self.store_frames:
+            frame_path = self._write_frame(key, frame)
+            if frame_path is not None:
+                size += os.path.getsize(frame_path)
+
+        removed_frames = []
+        with self._lock:
+            conn = self._conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                old = conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+                conn.execute('INSERT OR REPLACE INTO entries (key, result, frame_path, size, last_used) '
+                             'VALUES (?, ?, ?, ?, ?)', (key, payload, frame_path, size, time.time()))
+                self._count('bytes', size - (old[0] if old else 0))
+                total = conn.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+                while total > self.max_bytes:
+                    oldest = conn.execute('SELECT key, frame_path, size FROM entries WHERE key != ? '
+                                          'ORDER BY last_used LIMIT 1', (key,)).fetchone()
+                    if oldest is None:
+                        break
+                    conn.execute('DELETE FROM entries WHERE key = ?', (oldest[0],))
+                    self._count('bytes', -oldest[2])
+                    self._count('evictions')
+                    total -= oldest[2]
+                    if oldest[1] and oldest[1] != frame_path:
+                        removed_frames.append(oldest[1])
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        for path in removed_frames:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM fingerprints WHERE path = ?', (os.path.realpath(path),))
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._conn
+            frames = [row[0] for row in conn.execute('SELECT frame_path FROM entries WHERE frame_path IS NOT NULL')]
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM entries')
+            conn.execute('DELETE FROM fingerprints')
+            conn.execute("UPDATE counters SET value = 0 WHERE name = 'bytes'")
+            conn.execute('COMMIT')
+        for path in frames:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._conn.execute('SELECT name, value FROM counters').fetchall())
+            entries = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'evictions': counters.get('evictions', 0),
+            'entries': entries,
+            'bytes': counters.get('bytes', 0),
+            'max_bytes': self.max_bytes,
+            'shared': True
+        }
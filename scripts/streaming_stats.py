@@ -0,0 +1,263 @@
+"""
+Streaming Statistics Engine
+Mergeable one-pass summaries used instead of DataFrame.describe()
+"""
+
+import copy
+import math
+import sys
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_K = 200
+DESCRIBE_QUANTILES = (0.25, 0.5, 0.75)
+
+
+class KLLSketch:
+    """KLL quantile sketch (Karnin, Lang & Liberty, 2016)
+
+    Items live in a stack of compactors; level ``h`` items carry weight
+    ``2**h``. When a level exceeds its capacity it is sorted and every other
+    item (random offset) is promoted, halving its size. Level capacities
+    shrink geometrically by 2/3 towards the bottom, so the sketch holds
+    roughly ``3k`` items regardless of stream length.
+
+    Error bound: with ``k=200`` the normalized rank error of any single
+    quantile is about 1.65% at 99% confidence (the figure Apache DataSketches
+    publishes for the same construction); it scales as ~1/k. Until more than
+    ``k`` values have been seen nothing is compacted and quantiles are exact,
+    which ``is_exact`` reports.
+    """
+
+    def __init__(self, k: int = DEFAULT_K, seed: Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def is_exact(self) -> bool:
+        return len(self.levels) == 1
+
+    @property
+    def rank_error(self) -> float:
+        """Approximate normalized rank error (0.0 while the sketch is exact)"""
+        return 0.0 if self.is_exact else 1.65 * DEFAULT_K / (100.0 * self.k)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - 1 - level
+        return max(int(math.ceil(self.k * (2.0 / 3.0) ** depth)), 2)
+
+    def update(self, values: np.ndarray) -> None:
+        """Add a batch of values (NaNs are ignored)"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """Fold ``other`` into this sketch and return self"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _compress(self) -> None:
+        # Compact one over-full level at a time, lowest first, until the
+        # sketch as a whole fits its budget again
+        while self.size > sum(self._capacity(level) for level in range(len(self.levels))):
+            for level, items in enumerate(self.levels):
+                if len(items) >= self._capacity(level):
+                    self._compact(level)
+                    break
+
+    def _compact(self, level: int) -> None:
+        if level + 1 == len(self.levels):
+            self.levels.append(np.empty(0))
+        items = np.sort(self.levels[level])
+        # Odd leftovers stay behind so total weight is preserved exactly
+        leftover = items[-1:] if len(items) % 2 else items[:0]
+        paired = items[:len(items) - len(leftover)]
+        promoted = paired[self._rng.integers(2)::2]
+        self.levels[level] = leftover
+        self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def quantiles(self, qs: Iterable[float]) -> List[float]:
+        """Estimate the values at quantile ranks ``qs`` (each in [0, 1])"""
+        qs = list(qs)
+        if self.n == 0:
+            return [float('nan')] * len(qs)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(len(level_items), 2 ** level, dtype=np.float64)
+            for level, level_items in enumerate(self.levels)
+        ])
+        order = np.argsort(items, kind='stable')
+        items, weights = items[order], weights[order]
+        if self.is_exact:
+            # Linear interpolation, matching pandas' describe()
+            return [float(np.quantile(items, q)) for q in qs]
+        cumulative = np.cumsum(weights)
+        total = cumulative[-1]
+        result = []
+        for q in qs:
+            idx = int(np.searchsorted(cumulative, q * total, side='left'))
+            result.append(float(items[min(idx, len(items) - 1)]))
+        return result
+
+    @property
+    def size(self) -> int:
+        return sum(len(items) for items in self.levels)
+
+
+class _ColumnState:
+    """Count/mean/M2/min/max plus a quantile sketch for one column"""
+
+    def __init__(self, k: int):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.sketch = KLLSketch(k)
+
+    def combine(self, count: int, mean: float, m2: float, minimum: float, maximum: float) -> None:
+        """Chan et al. parallel update of (count, mean, M2)"""
+        if count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = count, mean, m2
+        else:
+            total = self.count + count
+            delta = mean - self.mean
+            self.mean += delta * count / total
+            self.m2 += m2 + delta * delta * self.count * count / total
+            self.count = total
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+
+    def merge(self, other: '_ColumnState') -> None:
+        self.combine(other.count, other.mean, other.m2, other.minimum, other.maximum)
+        self.sketch.merge(other.sketch)
+
+    def describe(self) -> Dict:
+        if self.count == 0:
+            nan = float('nan')
+            return {'count': 0.0, 'mean': nan, 'std': nan, 'min': nan,
+                    '25%': nan, '50%': nan, '75%': nan, 'max': nan}
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float('nan')
+        q25, q50, q75 = self.sketch.quantiles(DESCRIBE_QUANTILES)
+        return {
+            'count': float(self.count),
+            'mean': self.mean,
+            'std': std,
+            'min': self.minimum,
+            '25%': q25,
+            '50%': q50,
+            '75%': q75,
+            'max': self.maximum
+        }
+
+
+def estimate_memory_usage(frame: pd.DataFrame, sample_size: int = 1000) -> int:
+    """Approximate ``memory_usage(deep=True)`` without visiting every object
+
+    Fixed-width columns are exact; object columns are extrapolated from a
+    strided sample of ``sample_size`` values.
+    """
+    usage = frame.memory_usage(index=True, deep=False)
+    total = int(usage.sum())
+    rows = len(frame)
+    if rows == 0:
+        return total
+    for col in frame.columns:
+        series = frame[col]
+        if series.dtype != object:
+            continue
+        stride = max(rows // sample_size, 1)
+        sample = series.iloc[::stride]
+        per_item = sum(sys.getsizeof(value) for value in sample) / len(sample)
+        total += int(per_item * rows)
+    return total
+
+
+class StatsAccumulator:
+    """One-pass, mergeable replacement for describe()/memory_usage(deep=True)
+
+    ``update`` takes chunks of any size; ``merge`` combines accumulators built
+    in other chunks or worker processes (all state is plain numpy, so it
+    pickles). ``summary`` returns the same shape as
+    ``DataProcessor.analyze_statistics``.
+    """
+
+    def __init__(self, k: int = DEFAULT_K):
+        self.k = k
+        self.total_rows = 0
+        self.memory_usage = 0
+        self.data_types: Dict[str, str] = {}
+        self.columns: Dict[str, _ColumnState] = {}
+
+    def update(self, frame: pd.DataFrame) -> 'StatsAccumulator':
+        for col, dtype in frame.dtypes.items():
+            self.data_types.setdefault(str(col), str(dtype))
+        self.total_rows += len(frame)
+        self.memory_usage += estimate_memory_usage(frame)
+
+        numeric = frame.select_dtypes(include='number')
+        if numeric.shape[1] == 0 or len(numeric) == 0:
+            for col in numeric.columns:
+                self.columns.setdefault(str(col), _ColumnState(self.k))
+            return self
+
+        # Column-wise batch moments in a single vectorized pass
+        values = numeric.to_numpy(dtype=np.float64, na_value=np.nan)
+        present = ~np.isnan(values)
+        counts = present.sum(axis=0)
+        filled = np.where(present, values, 0.0)
+        safe_counts = np.maximum(counts, 1)
+        means = filled.sum(axis=0) / safe_counts
+        m2s = (np.where(present, values - means, 0.0) ** 2).sum(axis=0)
+        mins = np.where(present, values, np.inf).min(axis=0)
+        maxs = np.where(present, values, -np.inf).max(axis=0)
+
+        for i, col in enumerate(numeric.columns):
+            state = self.columns.setdefault(str(col), _ColumnState(self.k))
+            state.combine(int(counts[i]), float(means[i]), float(m2s[i]),
+                          float(mins[i]), float(maxs[i]))
+            state.sketch.update(values[present[:, i], i])
+        return self
+
+    def merge(self, other: 'StatsAccumulator') -> 'StatsAccumulator':
+        self.total_rows += other.total_rows
+        self.memory_usage += other.memory_usage
+        for col, dtype in other.data_types.items():
+            self.data_types.setdefault(col, dtype)
+        for col, state in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(state)
+            else:
+                # Copy so later merges into this accumulator don't change ``other``
+                self.columns[col] = copy.deepcopy(state)
+        return self
+
+    @property
+    def rank_error(self) -> float:
+        return max((state.sketch.rank_error for state in self.columns.values()), default=0.0)
+
+    def summary(self) -> Dict:
+        return {
+            'total_rows': self.total_rows,
+            'total_columns': len(self.data_types),
+            'memory_usage': str(self.memory_usage),
+            'numeric_summary': {col: state.describe() for col, state in self.columns.items()},
+            'data_types': dict(self.data_types),
+            'quantile_rank_error': self.rank_error
+        }
@@ -6,32 +6,43 @@ Monitors CPU, memory, disk usage and system health
 import psutil
 import json
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Optional
 import time
 
+from log import get_logger
+from process_sampler import ProcessSampler
+
+log = get_logger('system_monitor')
+
 class SystemMonitor:
     """System monitoring and health check"""
     
     def __init__(self, alert_threshold: float = 80.0):
         self.alert_threshold = alert_threshold
         self.metrics = {}
+        self.process_sampler = ProcessSampler()
         
-    def get_cpu_stats(self) -> Dict:
-        """Get CPU statistics"""
-        print("[v0] Gathering CPU statistics")
-        cpu_percent = psutil.cpu_percent(interval=1)
+    def get_cpu_stats(self, interval: Optional[float] = 1) -> Dict:
+        """Get CPU statistics
+        
+        With ``interval=None`` the call does not sleep and reports usage since
+        the previous call, which is what the background sampler relies on.
+        """
+        log.debug("Gathering CPU statistics")
+        cpu_percent = psutil.cpu_percent(interval=interval)
         cpu_count = psutil.cpu_count()
+        per_core_interval = 0.1 if interval is not None else None
         
         return {
             'usage_percent': cpu_percent,
             'core_count': cpu_count,
-            'per_core_usage': psutil.cpu_percent(interval=0.1, percpu=True),
+            'per_core_usage': psutil.cpu_percent(interval=per_core_interval, percpu=True),
             'alert': cpu_percent > self.alert_threshold
         }
     
     def get_memory_stats(self) -> Dict:
         """Get memory statistics"""
-        print("[v0] Gathering memory statistics")
+        log.debug("Gathering memory statistics")
         memory = psutil.virtual_memory()
         
         return {
@@ -44,7 +55,7 @@ class SystemMonitor:
     
     def get_disk_stats(self, path: str = '/') -> Dict:
         """Get disk statistics"""
-        print(f"[v0] Gathering disk statistics for {path}")
+        log.debug("Gathering disk statistics for %s", path)
         disk = psutil.disk_usage(path)
         
         return {
@@ -57,7 +68,7 @@ class SystemMonitor:
     
     def get_network_stats(self) -> Dict:
         """Get network statistics"""
-        print("[v0] Gathering network statistics")
+        log.debug("Gathering network statistics")
         net_io = psutil.net_io_counters()
         
         return {
@@ -67,33 +78,30 @@ class SystemMonitor:
             'packets_received': net_io.packets_recv
         }
     
-    def get_process_info(self, top_n: int = 5) -> Dict:
-        """Get top N processes by memory usage"""
-        print(f"[v0] Gathering top {top_n} process information")
-        processes = []
-        
-        for proc in psutil.process_iter(['pid', 'name', 'memory_percent']):
-            try:
-                processes.append({
-                    'pid': proc.info['pid'],
-                    'name': proc.info['name'],
-                    'memory_percent': proc.info['memory_percent']
-                })
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                pass
+    def get_process_info(self, top_n: int = 5, sort_by: str = 'memory') -> Dict:
+        """Get top N processes by memory (or CPU) usage
         
-        # Sort by memory usage
-        processes.sort(key=lambda x: x['memory_percent'], reverse=True)
-        return {'top_processes': processes[:top_n]}
+        Backed by a long-lived ProcessSampler, so repeated calls only read
+        per-process counters and CPU percentages cover the time since the
+        previous call.
+        """
+        log.debug("Gathering top %s process information", top_n)
+        self.process_sampler.sample()
+        return {
+            'top_processes': self.process_sampler.top(top_n, sort_by),
+            'top_cpu': self.process_sampler.top(top_n, 'cpu'),
+            'process_count': self.process_sampler.process_count,
+            'sort_by': sort_by
+        }
     
-    def generate_health_report(self) -> Dict:
+    def generate_health_report(self, cpu_interval: Optional[float] = 1) -> Dict:
         """Generate comprehensive system health report"""
-        print("[v0] Generating system health report")
+        log.debug("Generating system health report")
         timestamp = datetime.now().isoformat()
         
         report = {
             'timestamp': timestamp,
-            'cpu': self.get_cpu_stats(),
+            'cpu': self.get_cpu_stats(cpu_interval),
             'memory': self.get_memory_stats(),
             'disk': self.get_disk_stats(),
             'network': self.get_network_stats(),
@@ -113,30 +121,36 @@ class SystemMonitor:
         elif alerts == 1:
             report['overall_health'] = 'WARNING'
         
-        print(f"[v0] System health status: {report['overall_health']}")
+        log.debug("System health status: %s", report['overall_health'])
         return report
     
     def save_report(self, filepath: str) -> bool:
         """Save health report to file"""
-        print(f"[v0] Saving report to {filepath}")
+        log.info("Saving report to %s", filepath)
         try:
             report = self.generate_health_report()
             with open(filepath, 'w') as f:
                 json.dump(report, f, indent=2)
-            print("[v0] Report saved successfully")
+            log.info("Report saved successfully")
             return True
         except Exception as e:
-            print(f"[v0] Error saving report: {str(e)}")
+            log.error("Error saving report: %s", e)
             return False
     
-    def continuous_monitoring(self, duration_seconds: int = 60, interval: int = 5):
-        """Monitor system continuously"""
-        print(f"[v0] Starting continuous monitoring for {duration_seconds} seconds")
+    def continuous_monitoring(self, duration_seconds: int = 60, interval: int = 5, store=None):
+        """Monitor system continuously
+        
+        If a ``MetricsStore`` is given, every report is also recorded into it.
+        """
+        log.info("Starting continuous monitoring for %s seconds", duration_seconds)
         start_time = time.time()
         
         while time.time() - start_time < duration_seconds:
             report = self.generate_health_report()
-            print(f"[v0] CPU: {report['cpu']['usage_percent']}% | Memory: {report['memory']['percent']}% | Disk: {report['disk']['percent']}%")
+            if store is not None:
+                store.record_report(report, time.time())
+            log.info("CPU: %s%% | Memory: %s%% | Disk: %s%%",
+                     report['cpu']['usage_percent'], report['memory']['percent'], report['disk']['percent'])
             time.sleep(interval)
 
 
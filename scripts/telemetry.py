@@ -0,0 +1,401 @@
+"""
+Telemetry
+Counters, gauges and histograms with Prometheus text exposition, stage timers and multi-worker aggregation
+"""
+
+import atexit
+import bisect
+import fcntl
+import functools
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Tuple) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {labels}")
+        return tuple(str(value) for value in labels)
+
+    def dump(self) -> Dict:
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {'kind': self.kind, 'help': self.documentation, 'labelnames': list(self.labelnames), 'values': values}
+
+
+class Counter(_Metric):
+    """Monotonic count per label set; ``inc(*labels)`` in ``labelnames`` order"""
+    kind = COUNTER
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Current value per label set"""
+    kind = GAUGE
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    """Bucketed observations per label set
+
+    Each label set holds per-bucket (not cumulative) counts plus sum and
+    count, so ``observe`` is one bisect and three additions under the lock;
+    buckets are accumulated when rendered.
+    """
+    kind = HISTOGRAM
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the duration of the ``with`` block (also when it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def dump(self) -> Dict:
+        with self._lock:
+            values = [[list(key), [list(counts), total, count]] for key, (counts, total, count) in self._values.items()]
+        return {'kind': self.kind, 'help': self.documentation, 'labelnames': list(self.labelnames),
+                'buckets': list(self.buckets), 'values': values}
+
+
+class Registry:
+    """Named metrics of one process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def dump(self) -> Dict[str, Dict]:
+        """JSON-serializable state of every metric (input to ``merge`` and ``render``)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.dump() for metric in metrics}
+
+
+def merge(dumps: Iterable[Dict[str, Dict]], gauges: bool = True) -> Dict[str, Dict]:
+    """Sum several ``Registry.dump()`` results: counters, gauges and histogram buckets add up
+
+    With ``gauges=False`` gauges are left out (used for exited workers,
+    whose counters still count but whose in-flight requests don't).
+    """
+    merged: Dict[str, Dict] = {}
+    for dump in dumps:
+        for name, metric in dump.items():
+            if metric['kind'] == GAUGE and not gauges:
+                continue
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = {key: value for key, value in metric.items() if key != 'values'}
+                target['values'] = {}
+            elif target['kind'] != metric['kind'] or target.get('buckets') != metric.get('buckets'):
+                continue
+            values = target['values']
+            for labels, value in metric['values']:
+                key = tuple(labels)
+                current = values.get(key)
+                if metric['kind'] == HISTOGRAM:
+                    if current is None:
+                        values[key] = [list(value[0]), value[1], value[2]]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                        current[2] += value[2]
+                else:
+                    values[key] = (current or 0.0) + value
+    for metric in merged.values():
+        metric['values'] = [[list(key), value] for key, value in metric['values'].items()]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + '}'
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(dump: Dict[str, Dict]) -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines: List[str] = []
+    for name in sorted(dump):
+        metric = dump[name]
+        names = metric['labelnames']
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for labels, value in sorted(metric['values'], key=lambda item: item[0]):
+            if metric['kind'] != HISTOGRAM:
+                lines.append(f"{name}{_labels(names, labels)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(metric['buckets']) + [math.inf], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(names, labels, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(names, labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry used by the scripts and the API
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'stage_duration_seconds', 'Time spent in data processing and file walking stages',
+    ('component', 'stage'), STAGE_BUCKETS
+)
+
+
+http_requests = registry.counter('http_requests_total', 'HTTP requests served', ('method', 'route', 'status'))
+http_errors = registry.counter('http_request_errors_total', 'HTTP requests answered with a 5xx status',
+                               ('method', 'route'))
+http_latency = registry.histogram('http_request_duration_seconds', 'HTTP request latency until the response starts',
+                                  ('method', 'route'))
+http_in_flight = registry.gauge('http_requests_in_flight', 'HTTP requests being served', ('route',))
+
+
+def request_started(route: str) -> None:
+    http_in_flight.inc(route)
+
+
+def request_finished(method: str, route: str, status: int, seconds: float) -> None:
+    """Record a finished request; ``route`` is the URL rule, not the path, to keep label sets bounded"""
+    http_in_flight.dec(route)
+    http_requests.inc(method, route, status)
+    http_latency.observe(seconds, method, route)
+    if status >= 500:
+        http_errors.inc(method, route)
+
+
+def stage(component: str, name: str):
+    """``with stage('data_processor', 'load'):`` times a processing stage"""
+    return stage_seconds.time(component, name)
+
+
+def timed(component: str, name: str):
+    """Decorator form of ``stage``"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_seconds.time(component, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkerExporter:
+    """Aggregates the registries of every worker process through ``directory``
+
+    Each worker writes its ``Registry.dump()`` to ``<pid>.json`` every
+    ``interval`` seconds and at exit; ``collect`` sums those files with the
+    caller's live registry, so a scrape of any worker reports the totals of
+    all of them. Files of exited workers keep contributing their counters
+    and histograms (Prometheus counters must not go backwards) until they
+    are folded into ``retired.json``.
+    """
+
+    RETIRED = 'retired.json'
+
+    def __init__(self, directory: str, registry: Registry = registry, interval: float = 5.0):
+        self.directory = directory
+        self.registry = registry
+        self.interval = interval
+        self._pid = None
+        self._stop = threading.Event()
+        atexit.register(self.publish)
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    def _write(self, path: str, dump: Dict) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.telemetry-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dump, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def start(self) -> None:
+        """Start publishing this process's registry (idempotent per process)"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._run, name='telemetry-export', daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.publish()
+
+    def publish(self) -> None:
+        if self._pid == os.getpid():
+            self._write(self._path(self._pid), self.registry.dump())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+                self._fold_retired()
+            except Exception:
+                pass
+
+    def _worker_files(self) -> List[Tuple[int, str]]:
+        files = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            stem = os.path.basename(path)[:-len('.json')]
+            if stem.isdigit():
+                files.append((int(stem), path))
+        return files
+
+    def _fold_retired(self) -> None:
+        """Merge the files of exited workers into ``retired.json``"""
+        dead = [(pid, path) for pid, path in self._worker_files() if not _process_alive(pid)]
+        if not dead:
+            return
+        with self._locked(exclusive=True):
+            retired_path = os.path.join(self.directory, self.RETIRED)
+            dumps = [self._read(retired_path) or {}] + [self._read(path) or {} for _, path in dead]
+            self._write(retired_path, merge(dumps, gauges=False))
+            for _, path in dead:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def collect(self) -> Dict[str, Dict]:
+        """Totals over every worker, with this process's registry read live"""
+        own = os.getpid()
+        live, retired = [self.registry.dump()], []
+        with self._locked(exclusive=False):
+            for pid, path in self._worker_files():
+                if pid == own:
+                    continue
+                dump = self._read(path)
+                if dump is not None:
+                    (live if _process_alive(pid) else retired).append(dump)
+            retired.append(self._read(os.path.join(self.directory, self.RETIRED)) or {})
+        return merge([merge(live), merge(retired, gauges=False)])